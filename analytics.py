@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import pandas as pd
+
+from date_ranges import _to_date, day_bounds
+
+# Dashboard panels computed in one pass over a columnar frame of an org's
+# completed lines, instead of one SQL GROUP BY per panel. Frames are cached
+# per (org_id, day): a date range only reads the days it does not already
+# hold, with one query per run of missing days. The app drops the days of
+# lines it completes or bills (invalidate()); as the cache is per process,
+# today and yesterday are also reloaded after ANALYTICS_RECENT_TTL seconds and
+# older days, which rarely change, after ANALYTICS_CLOSED_TTL seconds.
+ANALYTICS_CACHE_DAYS = int(os.environ.get('ANALYTICS_CACHE_DAYS', 5000))
+ANALYTICS_RECENT_TTL = float(os.environ.get('ANALYTICS_RECENT_TTL', 30))
+ANALYTICS_CLOSED_TTL = float(os.environ.get('ANALYTICS_CLOSED_TTL', 3600))
+
+COLUMNS = ['sale_date', 'order_id', 'item_id', 'item_name', 'item_cat', 'hour', 'table_id', 'server_id',
+           'chef_id', 'server_name', 'payment_mode', 'item_qty', 'revenue']
+
+LINES_QUERY = """
+    SELECT DATE(c.order_created_at) as sale_date, c.order_id, c.item_id,
+           c.item_name, m.item_cat,
+           HOUR(c.order_created_at) as hour, c.table_id, c.server_id, c.chef_id,
+           u.name as server_name, o.payment_mode, c.item_qty, c.item_qty * c.item_price as revenue
+    FROM cart_reporting c
+    JOIN menu m ON c.item_id = m.item_id
+    LEFT JOIN users u ON c.server_id = u.user_uid
+    LEFT JOIN orders o ON c.order_id = o.order_id
+    WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = %s AND m.org_id = %s
+"""
+
+# Repeated strings become categoricals and numbers the narrowest type that
+# fits, so a month of lines stays a few MB
+CATEGORY_COLUMNS = ('order_id', 'item_id', 'item_name', 'item_cat', 'server_name', 'payment_mode')
+INTEGER_COLUMNS = {'hour': 'int8', 'table_id': 'int32', 'server_id': 'int32', 'chef_id': 'int32', 'item_qty': 'int32'}
+
+
+def _frame(rows):
+    frame = pd.DataFrame.from_records(rows, columns=COLUMNS)
+    for column in CATEGORY_COLUMNS:
+        frame[column] = frame[column].astype('category')
+    for column, dtype in INTEGER_COLUMNS.items():
+        frame[column] = pd.to_numeric(frame[column]).fillna(0).astype(dtype)
+    frame['revenue'] = pd.to_numeric(frame['revenue']).fillna(0).astype('float64')
+    return frame
+
+
+def _records(frame):
+    return frame.to_dict('records')
+
+
+def compute(lines):
+    # Every panel from one frame of lines
+    if lines.empty:
+        return {
+            'overview': {'total_orders': 0, 'total_items': 0, 'total_revenue': 0},
+            'popular_items': [], 'hourly_orders': [], 'table_performance': [],
+            'server_performance': [], 'payment_mode_revenue': [], 'categories': []
+        }
+
+    # Categoricals from different days do not share categories; plain
+    # strings group the same and avoid empty groups
+    lines = lines.astype({column: 'object' for column in CATEGORY_COLUMNS})
+
+    popular = (lines.groupby('item_id')
+               .agg(item_name=('item_name', 'first'), total_quantity=('item_qty', 'sum'),
+                    order_count=('item_qty', 'size'), revenue=('revenue', 'sum'))
+               .nlargest(10, 'total_quantity'))
+
+    hourly = (lines.groupby('hour')
+              .agg(orders=('order_id', 'nunique'), items=('item_qty', 'size'), revenue=('revenue', 'sum'))
+              .reset_index().sort_values('hour'))
+
+    tables = (lines.groupby('table_id')
+              .agg(total_orders=('order_id', 'nunique'), total_items=('item_qty', 'size'),
+                   revenue=('revenue', 'sum'))
+              .reset_index())
+    tables['avg_order_value'] = tables['revenue'] / tables['total_items']
+    tables['table_id'] = tables['table_id'].astype('object').where(tables['table_id'] != 0, None)
+
+    servers = (lines.groupby('server_id')
+               .agg(server_name=('server_name', 'first'), total_orders=('order_id', 'nunique'),
+                    total_items=('item_qty', 'size'), revenue=('revenue', 'sum'))
+               .reset_index())
+    servers['server_id'] = servers['server_id'].astype('object').where(servers['server_id'] != 0, None)
+
+    payments = (lines[lines['payment_mode'].fillna('') != '']
+                .groupby('payment_mode').agg(revenue=('revenue', 'sum')).reset_index())
+
+    categories = (lines.groupby('item_cat')
+                  .agg(total_quantity=('item_qty', 'sum'), total_orders=('order_id', 'nunique'),
+                       revenue=('revenue', 'sum'))
+                  .reset_index().rename(columns={'item_cat': 'category'}))
+
+    return {
+        'overview': {
+            'total_orders': int(lines['order_id'].nunique()),
+            'total_items': int(len(lines)),
+            'total_revenue': float(lines['revenue'].sum())
+        },
+        'popular_items': _records(popular),
+        'hourly_orders': _records(hourly),
+        'table_performance': _records(tables.sort_values('revenue', ascending=False)),
+        'server_performance': _records(servers.sort_values('revenue', ascending=False)),
+        'payment_mode_revenue': _records(payments.sort_values('revenue', ascending=False)),
+        'categories': _records(categories.sort_values('total_quantity', ascending=False))
+    }
+
+
+class AnalyticsCache:
+    def __init__(self, completed_status, max_days=ANALYTICS_CACHE_DAYS, recent_ttl=ANALYTICS_RECENT_TTL,
+                 closed_ttl=ANALYTICS_CLOSED_TTL):
+        self.completed_status = completed_status
+        self.max_days = max_days
+        self.recent_ttl = recent_ttl
+        self.closed_ttl = closed_ttl
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lines(self, cursor, org_id, from_date, to_date, today):
+        # Completed lines of org_id ordered between from_date and to_date
+        # (both inclusive, defaulting to today) as one frame
+        start = _to_date(from_date) if from_date and to_date else today
+        end = _to_date(to_date) if from_date and to_date else today
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        org_id = str(org_id)
+        now = time.monotonic()
+
+        frames, missing = {}, []
+        with self._lock:
+            generation = self._generation
+            for day in days:
+                entry = self._frames.get((org_id, day))
+                if entry and entry[1] > now:
+                    self._frames.move_to_end((org_id, day))
+                    frames[day] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(day)
+                    self.misses += 1
+
+        for run_start, run_end in _runs(missing):
+            loaded = self._load(cursor, org_id, run_start, run_end)
+            with self._lock:
+                # Not kept if an invalidation ran while it was read
+                keep = generation == self._generation
+                for offset in range((run_end - run_start).days + 1):
+                    day = run_start + timedelta(days=offset)
+                    frame = loaded.get(day)
+                    if frame is None:
+                        frame = _frame([])
+                    frames[day] = frame
+                    if not keep:
+                        continue
+                    recent = day >= today - timedelta(days=1)
+                    self._frames[(org_id, day)] = (frame, now + (self.recent_ttl if recent else self.closed_ttl))
+                    self._frames.move_to_end((org_id, day))
+                while len(self._frames) > self.max_days:
+                    self._frames.popitem(last=False)
+
+        parts = [frames[day] for day in days if not frames[day].empty]
+        if not parts:
+            return _frame([])
+        return pd.concat(parts, ignore_index=True)
+
+    def _load(self, cursor, org_id, start, end):
+        range_start, range_end = day_bounds(start, end)
+        cursor.execute(LINES_QUERY, (range_start, range_end, self.completed_status, org_id))
+        frame = _frame(cursor.fetchall())
+        return {day: part.drop(columns='sale_date').reset_index(drop=True)
+                for day, part in frame.groupby('sale_date', observed=True)}
+
+    def panels(self, cursor, org_id, from_date, to_date, today, server_id=None, staff_ids=None):
+        # server_id keeps the lines that server took or cooked; staff_ids
+        # (a manager's staff) keeps the lines taken by any of them
+        lines = self.lines(cursor, org_id, from_date, to_date, today)
+        if server_id:
+            server_id = int(server_id)
+            lines = lines[(lines['server_id'] == server_id) | (lines['chef_id'] == server_id)]
+        elif staff_ids is not None:
+            lines = lines[lines['server_id'].isin([int(uid) for uid in staff_ids])]
+        return compute(lines)
+
+    def invalidate(self, org_id=None, days=None):
+        # Drops the frames of org_id (every org when None) for days (every
+        # day when None)
+        with self._lock:
+            self._generation += 1
+            for key in list(self._frames):
+                if org_id is not None and key[0] != str(org_id):
+                    continue
+                if days is not None and key[1] not in days:
+                    continue
+                del self._frames[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                'entries': len(self._frames),
+                'recent_ttl_seconds': self.recent_ttl
+            }
+
+
+def _runs(days):
+    # Consecutive days as (first, last) pairs
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
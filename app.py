@@ -1,10 +1,23 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file, Response, g, has_request_context
 import mysql.connector
-from mysql.connector import pooling
 import db_config
 from flask_cors import CORS
+from id_allocator import IdAllocator, take_id
+from date_ranges import date_range_condition, day_bounds
+from csv_export import csv_chunks
+import export_jobs
+import order_headers
+from db_pool import ConnectionPool, PoolTimeout
+from query_stats import QueryStats
+import metrics
+from menu_cache import MenuCache
+from report_cache import ReportCache
+from user_hierarchy import UserHierarchy, USER_COLUMNS
+from order_lifecycle import OrderLifecycle, InvalidTransition, BILLING_EDGES
 from datetime import datetime
 import pytz
+import functools
+import os
 
 app = Flask(__name__)
 app.secret_key = 'billing_app_secret_key'
@@ -19,22 +32,139 @@ db_cred = db_config.db_config_cred_react_natvie()
 # Connection pool
 connection_pool = None
 
+# Default and maximum number of orders returned per /completed_orders page
+COMPLETED_ORDERS_PAGE_SIZE = 100
+COMPLETED_ORDERS_MAX_PAGE_SIZE = 500
+
+# Cached /menu and /menu/categories responses
+menu_cache = MenuCache()
+
+# Cached /dashboard_insights/* and /completed_orders responses; live ones
+# are dropped when an order is checked out or completed
+report_cache = ReportCache()
+
+# Org owner -> manager -> staff lookups; invalidated by the member endpoints
+user_hierarchy = UserHierarchy(lambda: connection_pool.get_connection(owner='user_hierarchy'),
+                               columns=('id',) + USER_COLUMNS + ('no_of_users', 'created_at', 'updated_at'))
+
+# Cart line status changes (0 cart -> 1 checked out -> 2 completed, and
+# 1 -> 0 when an order goes back to editing)
+order_lifecycle = OrderLifecycle(BILLING_EDGES, clock=lambda: datetime.now(ist))
+
+@order_lifecycle.on_transition
+def _refresh_transition_headers(cursor, transition):
+    if transition.to_status == 2:
+        order_headers.record_completed(cursor, transition.cart_ids, transition.updated_at)
+    order_headers.refresh_status(cursor, transition.by_order(), completed_status=2,
+                                 updated_at=transition.updated_at)
+
+@order_lifecycle.after_commit
+def _invalidate_reports(cursor, transition):
+    report_cache.invalidate(transition.to_status, transition.order_dates())
+
+# CRT_ ids come from an allocator backed by the id_sequences table; new ORD_
+# ids are taken inside the add_to_cart procedures
+cart_ids = IdAllocator('CRT')
+
 def initialize_connection_pool():
+    # Opens no connections itself, so it is safe to call at import time and
+    # again in each worker process after a fork
     global connection_pool
-    try:
-        connection_pool = pooling.MySQLConnectionPool(
-            pool_name="billing_pool",
-            pool_size=10,
-            pool_reset_session=True,
-            **db_cred
-        )
-    except Exception as e:
-        connection_pool = None
+    connection_pool = ConnectionPool(lambda: mysql.connector.connect(**db_cred), name="billing_pool")
 
 def get_db_connection():
-    if connection_pool is None:
-        return mysql.connector.connect(**db_cred)
-    return connection_pool.get_connection()
+    in_request = has_request_context()
+    try:
+        conn = connection_pool.get_connection(owner=request.endpoint if in_request else None)
+    except PoolTimeout:
+        if in_request:
+            g.pool_timeout = True
+        raise
+    if in_request:
+        conn = query_stats.instrument(conn)
+        g.setdefault('db_connections', []).append(conn)
+    return conn
+
+def detach_db_connection(conn):
+    # For responses that keep reading from the connection after the handler
+    # returns (streamed exports); whatever streams it must close it
+    if conn in g.get('db_connections', []):
+        g.db_connections.remove(conn)
+
+@app.teardown_request
+def release_db_connections(exc):
+    # Every connection a handler took goes back to the pool here, including
+    # the ones left open by early returns and exception paths
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+initialize_connection_pool()
+
+# Per-request SQL timing, slow request log and /admin/query-stats
+query_stats = QueryStats()
+query_stats.install(app)
+
+# Request counters and latency histograms for /metrics
+app_metrics = metrics.Metrics('billing')
+app_metrics.install(app)
+
+@app.after_request
+def report_pool_timeout(response):
+    # Handlers turn any exception into a 500; a request that failed only
+    # because no pooled connection came free in time gets a retryable 503
+    if g.get('pool_timeout') and response.status_code == 500:
+        response = jsonify({"success": False, "message": "Server busy, please retry"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+    return response
+
+@app.route('/admin/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify({"success": True, "data": connection_pool.stats()})
+
+@app.route('/admin/query-stats', methods=['GET'])
+def get_query_stats():
+    return jsonify({"success": True, "data": query_stats.snapshot()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app_metrics.response()
+
+@app_metrics.collector
+def pool_metrics():
+    return metrics.pool_lines('billing', connection_pool.stats())
+
+@app_metrics.collector
+def cache_metrics():
+    return metrics.cache_lines('billing', {'menu': menu_cache.stats(), 'reports': report_cache.stats()})
+
+@app_metrics.collector
+def export_job_metrics():
+    return metrics.export_job_lines('billing', export_jobs.durations, export_jobs.finished)
+
+@app_metrics.collector
+def order_status_metrics():
+    # One grouped query per scrape; completed orders are limited to today so
+    # the scan stays on the open part of the (status, order_created_at) index
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    today_start, today_end = day_bounds(datetime.now(ist).date())
+    cursor.execute("""
+        SELECT status, COUNT(DISTINCT order_id) as orders FROM cart
+        WHERE status IN (0, 1)
+           OR (status = 2 AND order_created_at >= %s AND order_created_at < %s)
+        GROUP BY status
+    """, (today_start, today_end))
+    counts = {int(row['status']): row['orders'] for row in cursor.fetchall()}
+    
+    cursor.close()
+    conn.close()
+    
+    statuses = [(0, 'cart'), (1, 'checked_out'), (2, 'completed_today')]
+    return metrics.family('billing_orders', 'gauge', 'Orders with lines in each cart status; completed counts today only', [
+        ({'status': code, 'name': name}, counts.get(code, 0)) for code, name in statuses
+    ])
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -67,6 +197,46 @@ def login():
     else:
         return jsonify({"success": False, "message": "Invalid credentials or account inactive"}), 401
 
+def _menu_response(key, loader):
+    # Serves menu reads from menu_cache; a matching If-None-Match gets a 304
+    data, etag = menu_cache.get_or_load(key, loader)
+    response = jsonify({"success": True, "data": data})
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# Status changes that alter completed-order reports
+REPORT_STATUSES = (1, 2)
+
+def cached_report(statuses=REPORT_STATUSES, dated=True):
+    # Serves a report view from report_cache. Only successful responses are
+    # kept; dated reports are scoped to their from_date/to_date range.
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            today = datetime.now(ist).date()
+            days = None
+            if dated:
+                try:
+                    days = report_cache.date_range(request.args.get('from_date'), request.args.get('to_date'), today)
+                except ValueError:
+                    # The view rejects it; error responses are not cached
+                    pass
+            
+            def load():
+                response = app.make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, response.mimetype
+            
+            body, status, mimetype = report_cache.get_or_load(
+                report_cache.key(request.endpoint, request.args), days, today, statuses, load,
+                cacheable=lambda result: result[1] == 200)
+            return Response(body, status=status, mimetype=mimetype)
+        return wrapper
+    return decorator
+
+@app.route('/menu/cache-stats', methods=['GET'])
+def get_menu_cache_stats():
+    return jsonify({"success": True, "data": menu_cache.stats()})
+
 @app.route('/menu', methods=['GET'])
 def get_menu():
     try:
@@ -74,28 +244,30 @@ def get_menu():
         manager_id = request.args.get('manager_id')
         all_items = request.args.get('all_items', 'false').lower() == 'true'
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        def load_menu():
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
         
-        # Base query without status filter if all_items=true
-        status_condition = "" if all_items else "item_status = 1 AND "
+            # Base query without status filter if all_items=true
+            status_condition = "" if all_items else "item_status = 1 AND "
         
-        if org_id and manager_id:
-            query = f"SELECT * FROM menu WHERE {status_condition}org_id = %s AND manager_id = %s"
-            cursor.execute(query, (org_id, manager_id))
-        elif org_id:
-            query = f"SELECT * FROM menu WHERE {status_condition}org_id = %s"
-            cursor.execute(query, (org_id,))
-        else:
-            query = f"SELECT * FROM menu WHERE {status_condition}1=1"
-            cursor.execute(query)
+            if org_id and manager_id:
+                query = f"SELECT * FROM menu WHERE {status_condition}org_id = %s AND manager_id = %s"
+                cursor.execute(query, (org_id, manager_id))
+            elif org_id:
+                query = f"SELECT * FROM menu WHERE {status_condition}org_id = %s"
+                cursor.execute(query, (org_id,))
+            else:
+                query = f"SELECT * FROM menu WHERE {status_condition}1=1"
+                cursor.execute(query)
         
-        menu_items = cursor.fetchall()
+            menu_items = cursor.fetchall()
         
-        cursor.close()
-        conn.close()
+            cursor.close()
+            conn.close()
+            return menu_items
         
-        return jsonify({"success": True, "data": menu_items})
+        return _menu_response(menu_cache.key('menu', org_id, manager_id, 'all' if all_items else 'active'), load_menu)
     except Exception as e:
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
@@ -112,63 +284,127 @@ def add_to_cart():
         if not all([item_id, item_qty, manager_id]):
             return jsonify({"success": False, "message": "Missing required fields"}), 400
         
+        # Taken before the request's own connection, so a block reservation
+        # never needs a second one while the first is held
+        cart_id = cart_ids.next_id(get_db_connection)
+        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Check for existing pending order for this manager
-        cursor.execute("SELECT order_id FROM cart WHERE manager_id = %s AND status = 0 LIMIT 1", (manager_id,))
-        existing_order = cursor.fetchone()
+        # One round trip: the procedure finds the manager's open order and
+        # upserts the line on its open_line_key (see schema_updates.sql)
+        cursor.execute("CALL billing_add_to_cart(%s, %s, %s, %s, %s)", (
+            item_id, item_qty, manager_id, cart_id, datetime.now(ist)
+        ))
+        line = cursor.fetchall()[0]
+        while cursor.nextset():
+            pass
+        # The line is new when it kept the reserved cart_id
+        order_headers.apply_lines(cursor, [(line['cart_id'], int(line['cart_id'] == cart_id), int(item_qty))],
+                                  completed_status=2)
         
-        if existing_order:
-            order_id = existing_order['order_id']
-            
-            # Check if item already exists in this order
-            cursor.execute("SELECT cart_id, item_qty FROM cart WHERE order_id = %s AND item_id = %s", (order_id, item_id))
-            existing_item = cursor.fetchone()
-            
-            if existing_item:
-                # Update existing item quantity
-                new_qty = existing_item['item_qty'] + item_qty
-                cursor.execute("""
-                    UPDATE cart SET item_qty = %s, order_updated_at = %s 
-                    WHERE cart_id = %s
-                """, (new_qty, datetime.now(ist), existing_item['cart_id']))
-                cart_id = existing_item['cart_id']
-            else:
-                # Add new item to existing order
-                cursor.execute("SELECT COUNT(*) as count FROM cart WHERE cart_id LIKE 'CRT_%'")
-                count_result = cursor.fetchone()
-                cart_number = count_result['count'] + 1
-                cart_id = f"CRT_{cart_number}"
-                
-                current_time = datetime.now(ist)
-                cursor.execute("""
-                    INSERT INTO cart (order_id, cart_id, item_id, item_qty, order_created_at, order_updated_at, manager_id, status) 
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (order_id, cart_id, item_id, item_qty, current_time, current_time, manager_id, 0))
-        else:
-            # Create new order
-            cursor.execute("SELECT COUNT(*) as count FROM cart WHERE order_id LIKE 'ORD_%'")
-            count_result = cursor.fetchone()
-            order_number = count_result['count'] + 1
-            order_id = f"ORD_{order_number}"
-            
-            cursor.execute("SELECT COUNT(*) as count FROM cart WHERE cart_id LIKE 'CRT_%'")
-            count_result = cursor.fetchone()
-            cart_number = count_result['count'] + 1
-            cart_id = f"CRT_{cart_number}"
-            
-            current_time = datetime.now(ist)
-            cursor.execute("""
-                INSERT INTO cart (order_id, cart_id, item_id, item_qty, order_created_at, order_updated_at, manager_id, status) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            """, (order_id, cart_id, item_id, item_qty, current_time, current_time, manager_id, 0))
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        return jsonify({"success": True, "message": "Item added to cart", "data": {"cart_id": line['cart_id'], "order_id": line['order_id']}})
+    except Exception as e:
+        return jsonify({"success": False, "message": "Server error"}), 500
+
+def _menu_snapshot(cursor, item_ids):
+    # {item_id: (item_name, item_price)} as copied onto new cart lines
+    placeholders = ','.join(['%s'] * len(item_ids))
+    cursor.execute(f"SELECT item_id, item_name, item_price FROM menu WHERE item_id IN ({placeholders})", list(item_ids))
+    return {row['item_id']: (row['item_name'], row['item_price']) for row in cursor.fetchall()}
+
+def _open_order_id(cursor, manager_id):
+    # The manager's open order or a new ORD_ id, resolved the way
+    # billing_add_to_cart does: taking the id locks the ORD sequence row
+    # until commit, and the locking read after it finds an order another add
+    # opened in the meantime
+    query = "SELECT order_id FROM cart WHERE manager_id = %s AND status = 0 LIMIT 1"
+    cursor.execute(query, (manager_id,))
+    existing_order = cursor.fetchone()
+    if existing_order:
+        return existing_order['order_id']
+    order_id = take_id(cursor, 'ORD')
+    cursor.execute(query + " FOR UPDATE", (manager_id,))
+    existing_order = cursor.fetchone()
+    return existing_order['order_id'] if existing_order else order_id
+
+@app.route('/cart/add-batch', methods=['POST'])
+def add_to_cart_batch():
+    try:
+        data = request.get_json()
+        items = data.get('items')
+        manager_id = data.get('manager_id')
+        
+        if not all([items, manager_id]) or not isinstance(items, list):
+            return jsonify({"success": False, "message": "Missing required fields"}), 400
+        
+        # Repeated items in one submission become a single line
+        quantities = {}
+        for item in items:
+            try:
+                item_qty = int(item.get('item_qty'))
+            except (AttributeError, TypeError, ValueError):
+                item_qty = 0
+            if item_qty <= 0 or not item.get('item_id'):
+                return jsonify({"success": False, "message": "Each item needs item_id and a positive item_qty"}), 400
+            quantities[item['item_id']] = quantities.get(item['item_id'], 0) + item_qty
+        
+        # Taken before the request's own connection (see add_to_cart)
+        new_cart_ids = cart_ids.reserve(get_db_connection, len(quantities))
+        
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        # New lines keep the name and price they were ordered at
+        menu_items = _menu_snapshot(cursor, quantities)
+        unknown = [item_id for item_id in quantities if item_id not in menu_items]
+        if unknown:
+            cursor.close()
+            conn.close()
+            return jsonify({"success": False, "message": f"Unknown item_id: {', '.join(map(str, unknown))}"}), 400
+        
+        order_id = _open_order_id(cursor, manager_id)
+        
+        # All lines in one statement; items already in the cart grow instead
+        current_time = datetime.now(ist)
+        rows = [
+            (order_id, cart_id, item_id, *menu_items[item_id], item_qty,
+             current_time, current_time, manager_id, 0)
+            for cart_id, (item_id, item_qty) in zip(new_cart_ids, quantities.items())
+        ]
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+        cursor.execute(f"""
+            INSERT INTO cart (order_id, cart_id, item_id, item_name, item_price, item_qty, order_created_at, order_updated_at, manager_id, status) 
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE item_qty = item_qty + VALUES(item_qty), order_updated_at = VALUES(order_updated_at), order_created_at = order_created_at
+        """, [value for row in rows for value in row])
+        
+        # Read the open lines back by their unique key: items already in the
+        # cart kept their own cart_ids
+        line_keys = [f"M{manager_id}:{item_id}" for item_id in quantities]
+        cursor.execute(f"""
+            SELECT item_id, cart_id FROM cart WHERE open_line_key IN ({','.join(['%s'] * len(line_keys))})
+        """, line_keys)
+        line_cart_ids = {line['item_id']: line['cart_id'] for line in cursor.fetchall()}
+        if len(line_cart_ids) != len(quantities):
+            raise RuntimeError(f"Batch add for manager {manager_id} left {len(quantities) - len(line_cart_ids)} items without an open line")
+        # Lines that kept their reserved cart_id are new to the order
+        reserved = dict(zip(quantities, new_cart_ids))
+        order_headers.apply_lines(cursor, [
+            (line_cart_ids[item_id], int(line_cart_ids[item_id] == reserved[item_id]), item_qty)
+            for item_id, item_qty in quantities.items()
+        ], completed_status=2)
         
         conn.commit()
         cursor.close()
         conn.close()
         
-        return jsonify({"success": True, "message": "Item added to cart", "data": {"cart_id": cart_id, "order_id": order_id}})
+        lines = [{"item_id": item_id, "cart_id": line_cart_ids[item_id]} for item_id in quantities]
+        return jsonify({"success": True, "message": "Items added to cart", "data": {"order_id": order_id, "items": lines}})
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -184,9 +420,8 @@ def get_cart_items():
         cursor = conn.cursor(dictionary=True)
         
         cursor.execute("""
-            SELECT c.*, m.item_name, m.item_price 
+            SELECT c.* 
             FROM cart c 
-            JOIN menu m ON c.item_id = m.item_id 
             WHERE c.manager_id = %s AND c.status IN (0, 1)
             ORDER BY c.order_created_at DESC
         """, (manager_id,))
@@ -211,15 +446,19 @@ def update_cart_item():
             return jsonify({"success": False, "message": "Missing required fields"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
+        lines = order_headers.read_lines(cursor, [cart_id])
         if item_qty <= 0:
             cursor.execute("DELETE FROM cart WHERE cart_id = %s", (cart_id,))
+            order_headers.remove_lines(cursor, lines, completed_status=2)
         else:
             cursor.execute("""
                 UPDATE cart SET item_qty = %s, order_updated_at = %s 
                 WHERE cart_id = %s
             """, (item_qty, datetime.now(ist), cart_id))
+            order_headers.apply_lines(cursor, [(line['cart_id'], 0, item_qty - (line['item_qty'] or 0))
+                                               for line in lines], completed_status=2)
         
         conn.commit()
         cursor.close()
@@ -239,19 +478,17 @@ def checkout_order():
             return jsonify({"success": False, "message": "Missing manager_id"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
-        current_time = datetime.now(ist)
-        cursor.execute("""
-            UPDATE cart SET status = 1, order_updated_at = %s 
-            WHERE manager_id = %s AND status = 0
-        """, (current_time, manager_id))
+        transition = order_lifecycle.move(cursor, 1, "manager_id = %s AND status = 0", (manager_id,))
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Order checked out successfully"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -275,6 +512,7 @@ def save_payment_mode():
             INSERT INTO payment_mode (order_id, mode, org_id, billed_by) 
             VALUES (%s, %s, %s, %s)
         """, (order_id, mode, org_id, billed_by))
+        order_headers.set_payment(cursor, order_id, mode, billed_by)
         
         conn.commit()
         cursor.close()
@@ -310,18 +548,17 @@ def print_order():
                     INSERT INTO payment_mode (order_id, mode, org_id, billed_by) 
                     VALUES (%s, %s, %s, %s)
                 """, (order_id, payment_mode, None, manager_id))
+                order_headers.set_payment(cursor, order_id, payment_mode, manager_id)
         
-        current_time = datetime.now(ist)
-        cursor.execute("""
-            UPDATE cart SET status = 2, order_updated_at = %s 
-            WHERE manager_id = %s AND status = 1
-        """, (current_time, manager_id))
+        transition = order_lifecycle.move(cursor, 2, "manager_id = %s AND status = 1", (manager_id,))
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Order printed successfully"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -335,38 +572,38 @@ def back_to_edit():
             return jsonify({"success": False, "message": "Missing manager_id"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
-        current_time = datetime.now(ist)
-        cursor.execute("""
-            UPDATE cart SET status = 0, order_updated_at = %s 
-            WHERE manager_id = %s AND status = 1
-        """, (current_time, manager_id))
+        transition = order_lifecycle.move(cursor, 0, "manager_id = %s AND status = 1", (manager_id,))
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Order moved back to editing mode"})
+    except mysql.connector.IntegrityError as e:
+        # The manager already has a new open cart holding one of these items
+        return jsonify({"success": False, "message": "Finish or clear the current cart before editing this order"}), 409
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/org/info/<user_uid>', methods=['GET'])
 def get_org_info_by_user(user_uid):
     try:
+        org_id = user_hierarchy.org_of(user_uid)
+        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
-
-
         
-        cursor.execute("""
-            SELECT oi.org_name, oi.org_address, oi.org_phone, oi.org_gst, oi.org_fssai 
-            FROM users u 
-            JOIN org_info oi ON u.org = oi.org_id 
-            WHERE u.user_uid = %s
-        """, (user_uid,))
-        
-        result = cursor.fetchone()
+        result = None
+        if org_id is not None:
+            cursor.execute("""
+                SELECT org_name, org_address, org_phone, org_gst, org_fssai
+                FROM org_info WHERE org_id = %s
+            """, (org_id,))
+            result = cursor.fetchone()
         cursor.close()
         conn.close()
         
@@ -394,6 +631,7 @@ def get_org_info_by_user(user_uid):
         }), 500
 
 @app.route('/dashboard_insights/overview', methods=['GET'])
+@cached_report()
 def dashboard_insights_overview():
     try:
         from_date = request.args.get('from_date')
@@ -403,15 +641,8 @@ def dashboard_insights_overview():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Always use date filter if provided, otherwise default to today
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            # Default to today's data (Asia/Kolkata timezone)
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
+        # Always use date filter if provided, otherwise default to today (Asia/Kolkata timezone)
+        date_condition, params = date_range_condition("c.order_created_at", from_date, to_date, default=datetime.now(ist).date())
         
         # Add manager filter if provided
         manager_condition = ""
@@ -423,9 +654,8 @@ def dashboard_insights_overview():
         cursor.execute(f"""
             SELECT COUNT(DISTINCT order_id) as total_orders,
                    COUNT(*) as total_items,
-                   COALESCE(SUM(c.item_qty * m.item_price), 0) as total_revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
+                   COALESCE(SUM(c.item_qty * c.item_price), 0) as total_revenue
+            FROM cart_reporting c
             WHERE {date_condition} AND c.status = 2{manager_condition}
         """, params)
         overview = cursor.fetchone()
@@ -457,6 +687,7 @@ def dashboard_insights_overview():
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
 @app.route('/dashboard_insights/popular_items', methods=['GET'])
+@cached_report()
 def dashboard_insights_popular_items():
     try:
         from_date = request.args.get('from_date')
@@ -466,13 +697,8 @@ def dashboard_insights_popular_items():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
+        # Default to today's data (Asia/Kolkata timezone)
+        date_condition, params = date_range_condition("c.order_created_at", from_date, to_date, default=datetime.now(ist).date())
         
         # Add manager filter if provided
         filter_condition = ""
@@ -481,13 +707,12 @@ def dashboard_insights_popular_items():
             params.append(manager_id)
         
         cursor.execute(f"""
-            SELECT m.item_name, SUM(c.item_qty) as total_quantity,
+            SELECT MAX(c.item_name) as item_name, SUM(c.item_qty) as total_quantity,
                    COUNT(*) as order_count,
-                   SUM(c.item_qty * m.item_price) as revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
+                   SUM(c.item_qty * c.item_price) as revenue
+            FROM cart_reporting c
             WHERE {date_condition} AND c.status = 2{filter_condition}
-            GROUP BY c.item_id, m.item_name
+            GROUP BY c.item_id
             ORDER BY total_quantity DESC
             LIMIT 10
         """, params)
@@ -501,6 +726,7 @@ def dashboard_insights_popular_items():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/hourly_orders', methods=['GET'])
+@cached_report()
 def dashboard_insights_hourly_orders():
     try:
         from_date = request.args.get('from_date')
@@ -510,13 +736,8 @@ def dashboard_insights_hourly_orders():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
+        # Default to today's data (Asia/Kolkata timezone)
+        date_condition, params = date_range_condition("c.order_created_at", from_date, to_date, default=datetime.now(ist).date())
         
         # Add manager filter if provided
         filter_condition = ""
@@ -528,9 +749,8 @@ def dashboard_insights_hourly_orders():
             SELECT HOUR(c.order_created_at) as hour,
                    COUNT(DISTINCT c.order_id) as orders,
                    COUNT(*) as items,
-                   SUM(c.item_qty * m.item_price) as revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
+                   SUM(c.item_qty * c.item_price) as revenue
+            FROM cart_reporting c
             WHERE {date_condition} AND c.status = 2{filter_condition}
             GROUP BY HOUR(c.order_created_at)
             ORDER BY hour
@@ -545,6 +765,7 @@ def dashboard_insights_hourly_orders():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/payment_mode_revenue', methods=['GET'])
+@cached_report()
 def dashboard_insights_payment_mode_revenue():
     try:
         from_date = request.args.get('from_date')
@@ -554,13 +775,8 @@ def dashboard_insights_payment_mode_revenue():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
+        # Default to today's data (Asia/Kolkata timezone)
+        date_condition, params = date_range_condition("c.order_created_at", from_date, to_date, default=datetime.now(ist).date())
         
         # Add manager filter if provided
         manager_condition = ""
@@ -570,9 +786,8 @@ def dashboard_insights_payment_mode_revenue():
         
         cursor.execute(f"""
             SELECT pm.mode as payment_mode,
-                   SUM(c.item_qty * m.item_price) as revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
+                   SUM(c.item_qty * c.item_price) as revenue
+            FROM cart_reporting c
             JOIN payment_mode pm ON c.order_id = pm.order_id
             WHERE {date_condition} AND c.status = 2{manager_condition}
             GROUP BY pm.mode
@@ -588,6 +803,7 @@ def dashboard_insights_payment_mode_revenue():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/status_counts', methods=['GET'])
+@cached_report(statuses=None)
 def dashboard_insights_status_counts():
     try:
         from_date = request.args.get('from_date')
@@ -597,13 +813,8 @@ def dashboard_insights_status_counts():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(order_created_at) = %s"
-            params = [current_date]
+        # Default to today's data (Asia/Kolkata timezone)
+        date_condition, params = date_range_condition("order_created_at", from_date, to_date, default=datetime.now(ist).date())
         
         # Add manager filter if provided
         filter_condition = ""
@@ -621,7 +832,7 @@ def dashboard_insights_status_counts():
                 END as status_name,
                 status,
                 COUNT(DISTINCT order_id) as count
-            FROM cart
+            FROM cart_reporting
             WHERE {date_condition}{filter_condition}
             GROUP BY status
             ORDER BY status
@@ -667,6 +878,7 @@ def add_menu_item():
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         return jsonify({"success": True, "message": "Item added successfully", "item_id": item_id})
     except Exception as e:
@@ -706,6 +918,7 @@ def update_menu_item():
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         return jsonify({"success": True, "message": "Item updated successfully"})
     except Exception as e:
@@ -742,6 +955,7 @@ def update_menu_item_status():
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         return jsonify({"success": True, "message": "Item status updated successfully"})
     except Exception as e:
@@ -760,6 +974,7 @@ def delete_menu_item(item_id):
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         return jsonify({"success": True, "message": "Item deleted successfully"})
     except Exception as e:
@@ -770,24 +985,27 @@ def get_menu_categories():
     try:
         org_id = request.args.get('org_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def load_categories():
+            conn = get_db_connection()
+            cursor = conn.cursor()
         
-        if org_id:
-            cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE org_id = %s AND item_status = 1", (org_id,))
-        else:
-            cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE item_status = 1")
+            if org_id:
+                cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE org_id = %s AND item_status = 1", (org_id,))
+            else:
+                cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE item_status = 1")
         
-        categories = [row[0] for row in cursor.fetchall()]
+            categories = [row[0] for row in cursor.fetchall()]
         
-        cursor.close()
-        conn.close()
+            cursor.close()
+            conn.close()
+            return categories
         
-        return jsonify({"success": True, "data": categories})
+        return _menu_response(menu_cache.key('menu/categories', org_id), load_categories)
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/completed_orders', methods=['GET'])
+@cached_report()
 def get_completed_orders():
     try:
         from_date = request.args.get('from_date')
@@ -797,65 +1015,151 @@ def get_completed_orders():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Base query for completed orders (status = 2)
+        # Orders with completed (status = 2) lines from their headers, see
+        # order_headers
         base_query = """
-            SELECT DISTINCT c.order_id, 
-                   SUM(c.item_qty * m.item_price) as total_amount,
-                   MIN(c.order_created_at) as order_created_at,
-                   pm.mode as payment_mode
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
-            LEFT JOIN payment_mode pm ON c.order_id = pm.order_id
-            WHERE c.status = 2
+            SELECT o.order_id, o.completed_amount as total_amount, o.created_at as order_created_at, o.payment_mode
+            FROM orders o
+            WHERE o.completed_line_count > 0
         """
         
         params = []
         conditions = []
         
         if from_date and to_date:
-            conditions.append("DATE(c.order_created_at) BETWEEN %s AND %s")
-            params.extend([from_date, to_date])
+            date_condition, date_params = date_range_condition("o.created_at", from_date, to_date)
+            conditions.append(date_condition)
+            params.extend(date_params)
         
         if manager_id:
-            conditions.append("c.manager_id = %s")
+            conditions.append("o.manager_id = %s")
             params.append(manager_id)
         
         if conditions:
             base_query += " AND " + " AND ".join(conditions)
         
-        base_query += " GROUP BY c.order_id, pm.mode ORDER BY MIN(c.order_created_at) DESC"
+        base_query += " ORDER BY o.created_at DESC, o.order_id"
+        
+        # Paginate so a month view is served in pages rather than one huge payload
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = min(max(int(request.args.get('page_size', COMPLETED_ORDERS_PAGE_SIZE)), 1), COMPLETED_ORDERS_MAX_PAGE_SIZE)
+        base_query += " LIMIT %s OFFSET %s"
+        params.extend([page_size + 1, (page - 1) * page_size])
         
         cursor.execute(base_query, params)
         orders_data = cursor.fetchall()
+        has_more = len(orders_data) > page_size
+        orders_data = orders_data[:page_size]
+        
+        # Get items for every order on the page in one query, through
+        # cart_reporting since past days are archived to cart_history
+        items_by_order = {}
+        order_ids = list({order['order_id'] for order in orders_data})
+        if order_ids:
+            placeholders = ','.join(['%s'] * len(order_ids))
+            cursor.execute(f"""
+                SELECT c.order_id, c.item_name, c.item_qty, c.item_price,
+                       (c.item_qty * c.item_price) as total
+                FROM cart_reporting c
+                WHERE c.order_id IN ({placeholders}) AND c.status = 2
+            """, order_ids)
+            
+            for item in cursor.fetchall():
+                items_by_order.setdefault(item.pop('order_id'), []).append(item)
         
-        # Get items for each order
         orders = []
         for order in orders_data:
-            cursor.execute("""
-                SELECT m.item_name, c.item_qty, m.item_price, 
-                       (c.item_qty * m.item_price) as total
-                FROM cart c
-                JOIN menu m ON c.item_id = m.item_id
-                WHERE c.order_id = %s AND c.status = 2
-            """, (order['order_id'],))
-            
-            items = cursor.fetchall()
-            
             orders.append({
                 'order_id': order['order_id'],
                 'total_amount': float(order['total_amount']),
                 'order_created_at': order['order_created_at'].isoformat() if order['order_created_at'] else None,
                 'payment_mode': order['payment_mode'],
-                'items': items
+                'items': items_by_order.get(order['order_id'], [])
             })
         
         cursor.close()
         conn.close()
         
-        return jsonify({"success": True, "orders": orders})
+        return jsonify({
+            "success": True,
+            "orders": orders,
+            "pagination": {"page": page, "page_size": page_size, "has_more": has_more}
+        })
     except Exception as e:
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
+def _export_query(from_date, to_date, export_type, manager_id):
+    if export_type == 'summary':
+        # Summary export - order totals with payment info, from the headers
+        query = """
+            SELECT o.order_id, o.completed_amount as total_amount, o.created_at as order_created_at,
+                   o.payment_mode, o.completed_line_count as total_items
+            FROM orders o
+            WHERE o.completed_line_count > 0
+        """
+        
+        params = []
+        if from_date and to_date:
+            date_condition, date_params = date_range_condition("o.created_at", from_date, to_date)
+            query += f" AND {date_condition}"
+            params.extend(date_params)
+        
+        if manager_id:
+            query += " AND o.manager_id = %s"
+            params.append(manager_id)
+        
+        query += " ORDER BY o.created_at DESC"
+        
+        header = ['Order ID', 'Date', 'Total Amount', 'Payment Mode', 'Total Items']
+        
+        def format_row(row):
+            return [row['order_id'], row['order_created_at'], row['total_amount'], row['payment_mode'] or 'N/A', row['total_items']]
+        
+    else:
+        # Full export - all order details with items
+        query = """
+            SELECT c.order_id, c.order_created_at, c.item_name,
+                   c.item_qty, c.item_price,
+                   (c.item_qty * c.item_price) as item_total,
+                   pm.mode as payment_mode
+            FROM cart_reporting c
+            LEFT JOIN payment_mode pm ON c.order_id = pm.order_id
+            WHERE c.status = 2
+        """
+        
+        params = []
+        if from_date and to_date:
+            date_condition, date_params = date_range_condition("c.order_created_at", from_date, to_date)
+            query += f" AND {date_condition}"
+            params.extend(date_params)
+        
+        if manager_id:
+            query += " AND c.manager_id = %s"
+            params.append(manager_id)
+        
+        query += " ORDER BY c.order_created_at DESC, c.order_id"
+        
+        header = ['Order ID', 'Date', 'Item Name', 'Quantity', 'Price', 'Item Total', 'Payment Mode']
+        
+        def format_row(row):
+            return [row['order_id'], row['order_created_at'], row['item_name'], row['item_qty'], row['item_price'], row['item_total'], row['payment_mode'] or 'N/A']
+    
+    filename = f"orders_{export_type}_{from_date}_{to_date}.csv"
+    return query, params, header, format_row, filename
+
+def _open_export(from_date, to_date, export_type, manager_id):
+    # Background exports use a dedicated connection so they never hold one of
+    # the pooled connections that billing requests depend on
+    conn = mysql.connector.connect(**db_cred)
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        query, params, header, format_row, filename = _export_query(from_date, to_date, export_type, manager_id)
+        cursor.execute(query, params)
+    except Exception:
+        conn.close()
+        raise
+    return cursor, conn, header, format_row, filename
+
 @app.route('/export/orders', methods=['POST'])
 def export_orders():
     try:
@@ -865,83 +1169,28 @@ def export_orders():
         export_type = data.get('export_type', 'full')
         manager_id = data.get('manager_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        if data.get('async'):
+            # Closed date ranges never change, so their report file can be reused
+            closed_range = bool(from_date and to_date) and str(to_date) < datetime.now(ist).date().isoformat()
+            key = f"billing:{export_type}:{from_date}:{to_date}:{manager_id}" if closed_range else None
+            job = export_jobs.submit(
+                lambda: _open_export(from_date, to_date, export_type, manager_id),
+                compress=bool(data.get('compress')),
+                key=key
+            )
+            return jsonify({"success": True, "job": export_jobs.job_status(job)}), 202
         
-        if export_type == 'summary':
-            # Summary export - order totals with payment info
-            query = """
-                SELECT c.order_id, 
-                       SUM(c.item_qty * m.item_price) as total_amount,
-                       MIN(c.order_created_at) as order_created_at,
-                       pm.mode as payment_mode,
-                       COUNT(c.item_id) as total_items
-                FROM cart c
-                JOIN menu m ON c.item_id = m.item_id
-                LEFT JOIN payment_mode pm ON c.order_id = pm.order_id
-                WHERE c.status = 2
-            """
-            
-            params = []
-            if from_date and to_date:
-                query += " AND DATE(c.order_created_at) BETWEEN %s AND %s"
-                params.extend([from_date, to_date])
-            
-            if manager_id:
-                query += " AND c.manager_id = %s"
-                params.append(manager_id)
-            
-            query += " GROUP BY c.order_id, pm.mode ORDER BY MIN(c.order_created_at) DESC"
-            
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            
-            # Generate CSV
-            csv_content = "Order ID,Date,Total Amount,Payment Mode,Total Items\n"
-            for row in results:
-                csv_content += f"{row['order_id']},{row['order_created_at']},{row['total_amount']},{row['payment_mode'] or 'N/A'},{row['total_items']}\n"
-            
-        else:
-            # Full export - all order details with items
-            query = """
-                SELECT c.order_id, c.order_created_at, m.item_name, 
-                       c.item_qty, m.item_price, 
-                       (c.item_qty * m.item_price) as item_total,
-                       pm.mode as payment_mode
-                FROM cart c
-                JOIN menu m ON c.item_id = m.item_id
-                LEFT JOIN payment_mode pm ON c.order_id = pm.order_id
-                WHERE c.status = 2
-            """
-            
-            params = []
-            if from_date and to_date:
-                query += " AND DATE(c.order_created_at) BETWEEN %s AND %s"
-                params.extend([from_date, to_date])
-            
-            if manager_id:
-                query += " AND c.manager_id = %s"
-                params.append(manager_id)
-            
-            query += " ORDER BY c.order_created_at DESC, c.order_id"
-            
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            
-            # Generate CSV
-            csv_content = "Order ID,Date,Item Name,Quantity,Price,Item Total,Payment Mode\n"
-            for row in results:
-                csv_content += f"{row['order_id']},{row['order_created_at']},{row['item_name']},{row['item_qty']},{row['item_price']},{row['item_total']},{row['payment_mode'] or 'N/A'}\n"
-        
-        cursor.close()
-        conn.close()
+        conn = get_db_connection()
+        # Unbuffered cursor: rows are streamed from the server as the CSV is written
+        cursor = conn.cursor(dictionary=True, buffered=False)
         
-        # Return CSV as response
-        filename = f"orders_{export_type}_{from_date}_{to_date}.csv"
+        query, params, header, format_row, filename = _export_query(from_date, to_date, export_type, manager_id)
+        cursor.execute(query, params)
         
-        from flask import Response
+        # Return CSV as a streamed response; the generator closes the cursor and connection
+        detach_db_connection(conn)
         return Response(
-            csv_content,
+            csv_chunks(cursor, conn, header, format_row),
             mimetype='text/csv',
             headers={
                 'Content-Disposition': f'attachment; filename="{filename}"',
@@ -952,6 +1201,34 @@ def export_orders():
     except Exception as e:
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
+@app.route('/export/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    job = export_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Export job not found"}), 404
+    return jsonify({"success": True, "job": export_jobs.job_status(job)})
+
+@app.route('/export/jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    job = export_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Export job not found"}), 404
+    if job['status'] != 'done':
+        return jsonify({"success": False, "message": f"Export job is {job['status']}"}), 409
+    
+    path = export_jobs.finished_file(job)
+    if not path:
+        return jsonify({"success": False, "message": "Export file has expired"}), 410
+    
+    # conditional=True lets clients resume with HTTP Range requests
+    return send_file(
+        path,
+        mimetype='application/gzip' if job['compress'] else 'text/csv',
+        as_attachment=True,
+        download_name=job['download_name'],
+        conditional=True
+    )
+
 # Client Management Endpoints
 @app.route('/clients', methods=['GET'])
 def get_clients():
@@ -1030,6 +1307,7 @@ def update_client():
             """, (org_name, org_address, org_phone, org_gst, org_fssai, org_id))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1046,6 +1324,7 @@ def delete_client(user_uid):
         cursor.execute("DELETE FROM users WHERE user_uid = %s AND role = 2", (user_uid,))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1059,29 +1338,8 @@ def get_staff():
     try:
         parent_uid = request.args.get('parent_uid')
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        if parent_uid:
-            cursor.execute("""
-                SELECT s.*, m.name as manager_name
-                FROM users s
-                LEFT JOIN users m ON s.parent_uid = m.user_uid
-                WHERE s.role = 4 AND s.parent_uid = %s
-                ORDER BY s.name
-            """, (parent_uid,))
-        else:
-            cursor.execute("""
-                SELECT s.*, m.name as manager_name
-                FROM users s
-                LEFT JOIN users m ON s.parent_uid = m.user_uid
-                WHERE s.role = 4
-                ORDER BY s.name
-            """)
-        
-        staff = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        # Every users column except the password
+        staff = user_hierarchy.staff(parent_uid)
         
         return jsonify({"success": True, "data": staff})
     except Exception as e:
@@ -1168,6 +1426,7 @@ def add_member():
                       current_time))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1206,6 +1465,7 @@ def update_staff():
             """, (name, phone, area, pincode, status, user_uid))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1244,6 +1504,7 @@ def update_manager():
             """, (name, phone, area, pincode, status, user_uid))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1260,6 +1521,7 @@ def delete_staff(user_uid):
         cursor.execute("DELETE FROM users WHERE user_uid = %s AND role = 4", (user_uid,))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1276,6 +1538,7 @@ def delete_manager(user_uid):
         cursor.execute("DELETE FROM users WHERE user_uid = %s AND role = 3", (user_uid,))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1317,4 +1580,6 @@ def home():
 
 if __name__ == '__main__':
     initialize_connection_pool()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    user_hierarchy.warm()
+    # Development server only; production runs wsgi:app under gunicorn
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
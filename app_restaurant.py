@@ -1,13 +1,29 @@
-from flask import Flask, request, jsonify, session, send_from_directory, Response
+from flask import Flask, request, jsonify, session, send_from_directory, send_file, Response, g, has_request_context
 import mysql.connector
-from mysql.connector import pooling
 import db_config
 from flask_cors import CORS
+from id_allocator import IdAllocator, take_id
+import sales_rollup
+import order_headers
+from date_ranges import date_range_condition, day_bounds, month_bounds
+from csv_export import csv_chunks, EXPORT_BATCH_SIZE
+import export_jobs
+from db_pool import ConnectionPool, PoolTimeout
+from query_stats import QueryStats
+import metrics
+import dashboard_panels
+from menu_cache import MenuCache
+from report_cache import ReportCache
+from user_hierarchy import UserHierarchy
+from analytics import AnalyticsCache
+from kitchen_feed import KitchenFeed
+from order_lifecycle import OrderLifecycle, InvalidTransition, RESTAURANT_EDGES
 from datetime import datetime
 import pytz
+import functools
+import os
 import uuid
-import io
-import csv
+import time
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
@@ -22,25 +38,167 @@ db_cred = db_config.db_config_cred_react_natvie()
 # Connection pool
 connection_pool = None
 
-def initialize_connection_pool():
-    global connection_pool
-    try:
-        connection_pool = pooling.MySQLConnectionPool(
-            pool_name="restaurant_pool",
-            pool_size=10,
-            pool_reset_session=True,
-            **db_cred
-        )
+# Cached /menu, /menu/all and /menu/categories responses
+menu_cache = MenuCache()
 
-    except Exception as e:
+# Cached /dashboard_insights/*, /completed_orders and /categories/popular
+# responses; live ones are dropped when an order is billed or completed
+report_cache = ReportCache()
+
+# Per-day frames of completed lines behind /dashboard_insights/analytics
+analytics_cache = AnalyticsCache(completed_status=6)
+
+# Org owner -> manager -> staff lookups; invalidated by the member endpoints
+user_hierarchy = UserHierarchy(lambda: connection_pool.get_connection(owner='user_hierarchy'))
+
+# Pushes kitchen status changes to /kitchen/stream subscribers
+kitchen_feed = KitchenFeed()
+
+# Cart line status changes (0 cart -> 1 kitchen -> 2 preparing -> 3 ready ->
+# 4 served -> 5 billed -> 6 completed)
+order_lifecycle = OrderLifecycle(RESTAURANT_EDGES, clock=lambda: datetime.now(ist))
+
+@order_lifecycle.on_transition
+def _roll_up_completed_lines(cursor, transition):
+    if transition.to_status == 6:
+        for order_id, completed_ids in transition.by_order().items():
+            sales_rollup.record_completed_lines(cursor, order_id, completed_ids)
+
+@order_lifecycle.on_transition
+def _refresh_transition_headers(cursor, transition):
+    if transition.to_status == 6:
+        order_headers.record_completed(cursor, transition.cart_ids, transition.updated_at)
+    order_headers.refresh_status(cursor, transition.by_order(), completed_status=6,
+                                 updated_at=transition.updated_at)
+
+@order_lifecycle.after_commit
+def _publish_kitchen_transition(cursor, transition):
+    # Lines entering or leaving the kitchen (status 1-3)
+    if transition.to_status <= 4:
+        _publish_kitchen_changes(cursor, transition.cart_ids)
+
+@order_lifecycle.after_commit
+def _invalidate_reports(cursor, transition):
+    report_cache.invalidate(transition.to_status, transition.order_dates())
+    # Lines only enter the analytics frames once completed
+    if transition.to_status == 6:
+        analytics_cache.invalidate(days=transition.order_dates())
 
-        connection_pool = None
+# CRT_ ids come from an allocator backed by the id_sequences table; new ORD_
+# ids are taken inside the add_to_cart procedures
+cart_ids = IdAllocator('CRT')
+
+def initialize_connection_pool():
+    # Opens no connections itself, so it is safe to call at import time and
+    # again in each worker process after a fork
+    global connection_pool
+    connection_pool = ConnectionPool(lambda: mysql.connector.connect(**db_cred), name="restaurant_pool")
 
 def get_db_connection():
-    if connection_pool is None:
-        # Fallback to direct connection
-        return mysql.connector.connect(**db_cred)
-    return connection_pool.get_connection()
+    in_request = has_request_context()
+    try:
+        conn = connection_pool.get_connection(owner=request.endpoint if in_request else None)
+    except PoolTimeout:
+        if in_request:
+            g.pool_timeout = True
+        raise
+    if in_request:
+        conn = query_stats.instrument(conn)
+        g.setdefault('db_connections', []).append(conn)
+    return conn
+
+def panel_db_connector():
+    # get_db_connection() for the dashboard panel threads, which have no
+    # request context: connections are checked out under the request's
+    # endpoint and their statements count towards its query stats. Each
+    # panel closes its own connection.
+    owner, stats = request.endpoint, query_stats.current()
+    return lambda: query_stats.instrument(connection_pool.get_connection(owner=owner), stats)
+
+def detach_db_connection(conn):
+    # For responses that keep reading from the connection after the handler
+    # returns (streamed exports); whatever streams it must close it
+    if conn in g.get('db_connections', []):
+        g.db_connections.remove(conn)
+
+@app.teardown_request
+def release_db_connections(exc):
+    # Every connection a handler took goes back to the pool here, including
+    # the ones left open by early returns and exception paths
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+initialize_connection_pool()
+
+# Per-request SQL timing, slow request log and /admin/query-stats
+query_stats = QueryStats()
+query_stats.install(app)
+
+# Request counters and latency histograms for /metrics
+app_metrics = metrics.Metrics('restaurant')
+app_metrics.install(app)
+
+@app.after_request
+def report_pool_timeout(response):
+    # Handlers turn any exception into a 500; a request that failed only
+    # because no pooled connection came free in time gets a retryable 503
+    if g.get('pool_timeout') and response.status_code == 500:
+        response = jsonify({"success": False, "message": "Server busy, please retry"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+    return response
+
+@app.route('/admin/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify({"success": True, "data": connection_pool.stats()})
+
+@app.route('/admin/query-stats', methods=['GET'])
+def get_query_stats():
+    return jsonify({"success": True, "data": query_stats.snapshot()})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return app_metrics.response()
+
+@app_metrics.collector
+def pool_metrics():
+    return metrics.pool_lines('restaurant', connection_pool.stats())
+
+@app_metrics.collector
+def cache_metrics():
+    return metrics.cache_lines('restaurant', {
+        'menu': menu_cache.stats(),
+        'reports': report_cache.stats(),
+        'analytics': analytics_cache.stats()
+    })
+
+@app_metrics.collector
+def export_job_metrics():
+    return metrics.export_job_lines('restaurant', export_jobs.durations, export_jobs.finished)
+
+@app_metrics.collector
+def order_status_metrics():
+    # One grouped query per scrape; completed orders are limited to today so
+    # the scan stays on the open part of the (status, order_created_at) index
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    
+    today_start, today_end = day_bounds(datetime.now(ist).date())
+    cursor.execute("""
+        SELECT status, COUNT(DISTINCT order_id) as orders FROM cart
+        WHERE status IN (0, 1, 2, 3, 4, 5)
+           OR (status = 6 AND order_created_at >= %s AND order_created_at < %s)
+        GROUP BY status
+    """, (today_start, today_end))
+    counts = {int(row['status']): row['orders'] for row in cursor.fetchall()}
+    
+    cursor.close()
+    conn.close()
+    
+    statuses = [(0, 'cart'), (1, 'kitchen'), (2, 'preparing'), (3, 'ready'), (4, 'served'), (5, 'billed'), (6, 'completed_today')]
+    return metrics.family('restaurant_orders', 'gauge', 'Orders with lines in each cart status; completed counts today only', [
+        ({'status': code, 'name': name}, counts.get(code, 0)) for code, name in statuses
+    ])
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -64,6 +222,7 @@ def register():
 
     cursor.execute("INSERT INTO users (phone, password) VALUES (%s, %s)", (phone, password))
     conn.commit()
+    user_hierarchy.invalidate()
     cursor.close()
     conn.close()
 
@@ -101,28 +260,70 @@ def login():
         return jsonify({"success": False, "message": "Invalid credentials or account inactive"}), 401
 
 
+def _menu_response(key, loader):
+    # Serves menu reads from menu_cache; a matching If-None-Match gets a 304
+    data, etag = menu_cache.get_or_load(key, loader)
+    response = jsonify({"success": True, "data": data})
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# Status changes that alter completed-order reports
+REPORT_STATUSES = (5, 6)
+
+def cached_report(statuses=REPORT_STATUSES, dated=True):
+    # Serves a report view from report_cache. Only successful responses are
+    # kept; dated reports are scoped to their from_date/to_date range.
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            today = datetime.now(ist).date()
+            days = None
+            if dated:
+                try:
+                    days = report_cache.date_range(request.args.get('from_date'), request.args.get('to_date'), today)
+                except ValueError:
+                    # The view rejects it; error responses are not cached
+                    pass
+            
+            def load():
+                response = app.make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, response.mimetype
+            
+            body, status, mimetype = report_cache.get_or_load(
+                report_cache.key(request.endpoint, request.args), days, today, statuses, load,
+                cacheable=lambda result: result[1] == 200)
+            return Response(body, status=status, mimetype=mimetype)
+        return wrapper
+    return decorator
+
+@app.route('/menu/cache-stats', methods=['GET'])
+def get_menu_cache_stats():
+    return jsonify({"success": True, "data": menu_cache.stats()})
+
 @app.route('/menu', methods=['GET'])
 def get_menu():
     try:
         org_id = request.args.get('org_id')
         manager_id = request.args.get('manager_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        def load_menu():
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
         
-        if org_id and manager_id:
-            cursor.execute("SELECT * FROM menu WHERE item_status = 1 AND org_id = %s AND manager_id = %s", (org_id, manager_id))
-        elif org_id:
-            cursor.execute("SELECT * FROM menu WHERE item_status = 1 AND org_id = %s", (org_id,))
-        else:
-            cursor.execute("SELECT * FROM menu WHERE item_status = 1")
+            if org_id and manager_id:
+                cursor.execute("SELECT * FROM menu WHERE item_status = 1 AND org_id = %s AND manager_id = %s", (org_id, manager_id))
+            elif org_id:
+                cursor.execute("SELECT * FROM menu WHERE item_status = 1 AND org_id = %s", (org_id,))
+            else:
+                cursor.execute("SELECT * FROM menu WHERE item_status = 1")
         
-        menu_items = cursor.fetchall()
+            menu_items = cursor.fetchall()
         
-        cursor.close()
-        conn.close()
+            cursor.close()
+            conn.close()
+            return menu_items
         
-        return jsonify({"success": True, "data": menu_items})
+        return _menu_response(menu_cache.key('menu', org_id, manager_id, 'active'), load_menu)
     except Exception as e:
         return jsonify({"success": False, "message": "Server error while fetching menu"}), 500
 
@@ -132,38 +333,40 @@ def get_all_menu():
         org_id = request.args.get('org_id')
         manager_id = request.args.get('manager_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        def load_all_menu():
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
         
-        query = """
-            SELECT m.*, u.name as manager_name 
-            FROM menu m 
-            LEFT JOIN users u ON m.manager_id = u.user_uid
-        """
+            query = """
+                SELECT m.*, u.name as manager_name 
+                FROM menu m 
+                LEFT JOIN users u ON m.manager_id = u.user_uid
+            """
         
-        conditions = []
-        params = []
+            conditions = []
+            params = []
         
-        if org_id:
-            conditions.append("m.org_id = %s")
-            params.append(org_id)
+            if org_id:
+                conditions.append("m.org_id = %s")
+                params.append(org_id)
         
-        if manager_id:
-            conditions.append("m.manager_id = %s")
-            params.append(manager_id)
+            if manager_id:
+                conditions.append("m.manager_id = %s")
+                params.append(manager_id)
         
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
         
-        query += " ORDER BY m.item_name"
+            query += " ORDER BY m.item_name"
         
-        cursor.execute(query, params)
-        menu_items = cursor.fetchall()
+            cursor.execute(query, params)
+            menu_items = cursor.fetchall()
         
-        cursor.close()
-        conn.close()
+            cursor.close()
+            conn.close()
+            return menu_items
         
-        return jsonify({"success": True, "data": menu_items})
+        return _menu_response(menu_cache.key('menu/all', org_id, manager_id), load_all_menu)
     except Exception as e:
         return jsonify({"success": False, "message": "Server error while fetching menu"}), 500
 
@@ -192,6 +395,7 @@ def update_menu_status():
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         return jsonify({"success": True, "message": "Item status updated"})
     except Exception as e:
@@ -234,6 +438,7 @@ def update_menu_item():
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         return jsonify({"success": True, "message": "Item updated successfully"})
     except Exception as e:
@@ -269,6 +474,7 @@ def add_menu_item():
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         return jsonify({"success": True, "message": "Item added successfully", "item_id": str(new_id)})
     except Exception as e:
@@ -343,6 +549,7 @@ def delete_menu_item(item_id):
         conn.commit()
         cursor.close()
         conn.close()
+        menu_cache.invalidate(org_id)
         
         # Delete image file
         import os
@@ -375,69 +582,136 @@ def add_to_cart():
         if not all([item_id, item_qty, table_id, server_id, manager_id]):
             return jsonify({"success": False, "message": "Missing required fields"}), 400
         
+        # Taken before the request's own connection, so a block reservation
+        # never needs a second one while the first is held
+        cart_id = cart_ids.next_id(get_db_connection)
+        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Check for existing item with status 0
-        cursor.execute("""
-            SELECT cart_id, item_qty FROM cart 
-            WHERE table_id = %s AND server_id = %s AND item_id = %s AND status = 0
-            ORDER BY order_created_at DESC LIMIT 1
-        """, (table_id, server_id, item_id))
+        # One round trip: the procedure finds the table's open order and
+        # upserts the line on its open_line_key (see schema_updates.sql)
+        cursor.execute("CALL restaurant_add_to_cart(%s, %s, %s, %s, %s, %s, %s, %s, %s)", (
+            item_id, item_qty, table_id, server_id, chef_id, manager_id, status,
+            cart_id, datetime.now(ist)
+        ))
+        line = cursor.fetchall()[0]
+        while cursor.nextset():
+            pass
+        order_headers.apply_lines(cursor, [(line['cart_id'], int(bool(line['inserted'])), int(item_qty))],
+                                  completed_status=6)
         
-        existing_item = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+        conn.close()
         
-        if existing_item:
-            # Update existing item - only update quantity and updated_at, leave created_at unchanged
-            new_qty = existing_item['item_qty'] + item_qty
-            current_time = datetime.now(ist)
-            cursor.execute("""
-                UPDATE cart SET item_qty = %s, order_updated_at = %s, order_created_at = order_created_at 
-                WHERE cart_id = %s
-            """, (new_qty, current_time, existing_item['cart_id']))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            return jsonify({"success": True, "message": "Item updated", "data": {"cart_id": existing_item['cart_id']}})
-        else:
-            # Create new item
-            # Check for existing active order for this table and server
-            cursor.execute("""
-                SELECT order_id FROM cart 
-                WHERE table_id = %s AND server_id = %s AND status < 5 
-                ORDER BY order_created_at DESC LIMIT 1
-            """, (table_id, server_id))
-            
-            existing_order = cursor.fetchone()
-            
-            if existing_order:
-                order_id = existing_order['order_id']
-            else:
-                # Generate new order_id
-                cursor.execute("SELECT COUNT(*) as count FROM cart WHERE order_id LIKE 'ORD_%'")
-                count_result = cursor.fetchone()
-                order_number = count_result['count'] + 1
-                order_id = f"ORD_{order_number}"
-            
-            # Generate unique cart_id
-            cursor.execute("SELECT COUNT(*) as count FROM cart WHERE cart_id LIKE 'CRT_%'")
-            count_result = cursor.fetchone()
-            cart_number = count_result['count'] + 1
-            cart_id = f"CRT_{cart_number}"
-            
-            current_time = datetime.now(ist)
-            cursor.execute("""
-                INSERT INTO cart (order_id, cart_id, item_id, item_qty, table_id, server_id, chef_id, manager_id, order_created_at, order_updated_at, status) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (order_id, cart_id, item_id, item_qty, table_id, server_id, chef_id, manager_id, current_time, current_time, status))
-            
-            conn.commit()
+        if not line['inserted']:
+            return jsonify({"success": True, "message": "Item updated", "data": {"cart_id": line['cart_id']}})
+        return jsonify({"success": True, "message": "Item added to cart", "data": {"cart_id": line['cart_id'], "order_id": line['order_id']}})
+    except Exception as e:
+        return jsonify({"success": False, "message": "Server error"}), 500
+
+def _menu_snapshot(cursor, item_ids):
+    # {item_id: (item_name, item_price)} as copied onto new cart lines
+    placeholders = ','.join(['%s'] * len(item_ids))
+    cursor.execute(f"SELECT item_id, item_name, item_price FROM menu WHERE item_id IN ({placeholders})", list(item_ids))
+    return {row['item_id']: (row['item_name'], row['item_price']) for row in cursor.fetchall()}
+
+def _open_order_id(cursor, table_id, server_id):
+    # The table's open order or a new ORD_ id, resolved the way
+    # restaurant_add_to_cart does: taking the id locks the ORD sequence row
+    # until commit, and the locking read after it finds an order another add
+    # opened in the meantime
+    query = """
+        SELECT order_id FROM cart 
+        WHERE table_id = %s AND server_id = %s AND status < 5 
+        ORDER BY order_created_at DESC LIMIT 1
+    """
+    cursor.execute(query, (table_id, server_id))
+    existing_order = cursor.fetchone()
+    if existing_order:
+        return existing_order['order_id']
+    order_id = take_id(cursor, 'ORD')
+    cursor.execute(query + " FOR UPDATE", (table_id, server_id))
+    existing_order = cursor.fetchone()
+    return existing_order['order_id'] if existing_order else order_id
+
+@app.route('/cart/add-batch', methods=['POST'])
+def add_to_cart_batch():
+    try:
+        data = request.get_json()
+        items = data.get('items')
+        table_id = data.get('table_id')
+        server_id = data.get('server_id')
+        manager_id = data.get('manager_id')
+        chef_id = data.get('chef_id', 1)
+        
+        if not all([items, table_id, server_id, manager_id]) or not isinstance(items, list):
+            return jsonify({"success": False, "message": "Missing required fields"}), 400
+        
+        # Repeated items in one submission become a single line
+        quantities = {}
+        for item in items:
+            try:
+                item_qty = int(item.get('item_qty'))
+            except (AttributeError, TypeError, ValueError):
+                item_qty = 0
+            if item_qty <= 0 or not item.get('item_id'):
+                return jsonify({"success": False, "message": "Each item needs item_id and a positive item_qty"}), 400
+            quantities[item['item_id']] = quantities.get(item['item_id'], 0) + item_qty
+        
+        # Taken before the request's own connection (see add_to_cart)
+        new_cart_ids = cart_ids.reserve(get_db_connection, len(quantities))
+        
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        # New lines keep the name and price they were ordered at
+        menu_items = _menu_snapshot(cursor, quantities)
+        unknown = [item_id for item_id in quantities if item_id not in menu_items]
+        if unknown:
             cursor.close()
             conn.close()
-            
-            return jsonify({"success": True, "message": "Item added to cart", "data": {"cart_id": cart_id, "order_id": order_id}})
+            return jsonify({"success": False, "message": f"Unknown item_id: {', '.join(map(str, unknown))}"}), 400
+        
+        order_id = _open_order_id(cursor, table_id, server_id)
+        
+        # All lines in one statement; items already in the cart grow instead
+        current_time = datetime.now(ist)
+        rows = [
+            (order_id, cart_id, item_id, *menu_items[item_id], item_qty,
+             table_id, server_id, chef_id, manager_id, current_time, current_time, 0)
+            for cart_id, (item_id, item_qty) in zip(new_cart_ids, quantities.items())
+        ]
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+        cursor.execute(f"""
+            INSERT INTO cart (order_id, cart_id, item_id, item_name, item_price, item_qty, table_id, server_id, chef_id, manager_id, order_created_at, order_updated_at, status) 
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE item_qty = item_qty + VALUES(item_qty), order_updated_at = VALUES(order_updated_at), order_created_at = order_created_at
+        """, [value for row in rows for value in row])
+        
+        # Read the open lines back by their unique key: items already in the
+        # cart kept their own cart_ids
+        line_keys = [f"T{table_id}:{server_id}:{item_id}" for item_id in quantities]
+        cursor.execute(f"""
+            SELECT item_id, cart_id FROM cart WHERE open_line_key IN ({','.join(['%s'] * len(line_keys))})
+        """, line_keys)
+        line_cart_ids = {line['item_id']: line['cart_id'] for line in cursor.fetchall()}
+        if len(line_cart_ids) != len(quantities):
+            raise RuntimeError(f"Batch add for table {table_id} left {len(quantities) - len(line_cart_ids)} items without an open line")
+        # Lines that kept their reserved cart_id are new to the order
+        reserved = dict(zip(quantities, new_cart_ids))
+        order_headers.apply_lines(cursor, [
+            (line_cart_ids[item_id], int(line_cart_ids[item_id] == reserved[item_id]), item_qty)
+            for item_id, item_qty in quantities.items()
+        ], completed_status=6)
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        lines = [{"item_id": item_id, "cart_id": line_cart_ids[item_id]} for item_id in quantities]
+        return jsonify({"success": True, "message": "Items added to cart", "data": {"order_id": order_id, "items": lines}})
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -452,12 +726,17 @@ def update_cart():
             return jsonify({"success": False, "message": "Missing cart_id or item_qty"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
+        # The header takes the quantity change, into completed_* as well when
+        # the line was already completed
+        lines = order_headers.read_lines(cursor, [cart_id])
         current_time = datetime.now(ist)
         cursor.execute("""
             UPDATE cart SET item_qty = %s, order_updated_at = %s, order_created_at = order_created_at WHERE cart_id = %s
         """, (item_qty, current_time, cart_id))
+        order_headers.apply_lines(cursor, [(line['cart_id'], 0, int(item_qty) - (line['item_qty'] or 0))
+                                           for line in lines], completed_status=6)
         
         conn.commit()
         cursor.close()
@@ -477,9 +756,11 @@ def remove_from_cart():
             return jsonify({"success": False, "message": "Missing cart_id"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
+        lines = order_headers.read_lines(cursor, [cart_id])
         cursor.execute("DELETE FROM cart WHERE cart_id = %s", (cart_id,))
+        order_headers.remove_lines(cursor, lines, completed_status=6)
         
         conn.commit()
         cursor.close()
@@ -508,7 +789,7 @@ def get_cart_items():
         
         if include_menu:
             base_query = f"""
-                SELECT c.*, m.item_name, m.item_price 
+                SELECT c.* 
                 FROM cart c 
                 JOIN menu m ON c.item_id = m.item_id 
                 WHERE c.table_id = %s AND c.server_id = %s{org_condition}
@@ -529,13 +810,12 @@ def get_cart_items():
             # Optimized query using window function
             if include_menu:
                 base_query = """
-                    SELECT c.*, m.item_name, m.item_price 
+                    SELECT c.* 
                     FROM (
                         SELECT *, ROW_NUMBER() OVER (PARTITION BY item_id ORDER BY cart_id DESC) as rn
                         FROM cart 
                         WHERE table_id = %s AND server_id = %s AND status = 0
                     ) c
-                    JOIN menu m ON c.item_id = m.item_id 
                     WHERE c.rn = 1
                 """
             else:
@@ -565,6 +845,29 @@ def get_cart_items():
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
+# Kitchen rows with the columns the kitchen display renders; item_org_id lets
+# the feed route a row to subscribers filtered by org
+KITCHEN_ROWS_QUERY = """
+    SELECT c.*, m.org_id as item_org_id, u.name as server_name
+    FROM cart c 
+    JOIN menu m ON c.item_id = m.item_id 
+    JOIN users u ON c.server_id = u.user_uid
+"""
+
+def _publish_kitchen_changes(cursor, changed_ids):
+    # Pushes the committed state of the given cart lines to /kitchen/stream.
+    # Needs a dictionary cursor; a failure here must not fail the request
+    # since the transition is already committed.
+    if not changed_ids or not kitchen_feed.has_subscribers():
+        return
+    try:
+        placeholders = ','.join(['%s'] * len(changed_ids))
+        cursor.execute(KITCHEN_ROWS_QUERY + f" WHERE c.cart_id IN ({placeholders})", list(changed_ids))
+        kitchen_feed.publish(cursor.fetchall())
+    except Exception:
+        # Subscribers miss this change until their next snapshot
+        app.logger.exception("Publishing %d kitchen line changes failed", len(changed_ids))
+
 @app.route('/cart/send-to-kitchen', methods=['POST'])
 def send_to_kitchen():
     try:
@@ -576,19 +879,17 @@ def send_to_kitchen():
             return jsonify({"success": False, "message": "Missing table_id or server_id"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
-        current_time = datetime.now(ist)
-        cursor.execute("""
-            UPDATE cart SET status = 1, order_updated_at = %s, order_created_at = order_created_at 
-            WHERE table_id = %s AND server_id = %s AND status = 0
-        """, (current_time, table_id, server_id))
+        transition = order_lifecycle.move(cursor, 1, "table_id = %s AND server_id = %s AND status = 0", (table_id, server_id))
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Order sent to kitchen"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -602,21 +903,18 @@ def send_selected_to_kitchen():
             return jsonify({"success": False, "message": "Missing or invalid cart_ids"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
         # Update selected items to status 1 (sent to kitchen)
-        placeholders = ','.join(['%s'] * len(cart_ids))
-        current_time = datetime.now(ist)
-        cursor.execute(f"""
-            UPDATE cart SET status = 1, order_updated_at = %s, order_created_at = order_created_at 
-            WHERE cart_id IN ({placeholders}) AND status = 0
-        """, [current_time] + cart_ids)
+        transition = order_lifecycle.move(cursor, 1, "status = 0", cart_ids=cart_ids)
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Selected items sent to kitchen"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -630,18 +928,17 @@ def mark_served():
             return jsonify({"success": False, "message": "Missing cart_id"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
-        current_time = datetime.now(ist)
-        cursor.execute("""
-            UPDATE cart SET status = 4, order_updated_at = %s, order_created_at = order_created_at WHERE cart_id = %s
-        """, (current_time, cart_id))
+        transition = order_lifecycle.move(cursor, 4, cart_ids=[cart_id])
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Item marked as served"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -650,31 +947,28 @@ def update_status():
     try:
         data = request.get_json()
         cart_id = data.get('cart_id')
+        # cart_ids moves several lines (e.g. a whole ticket) in one transaction
+        cart_ids = data.get('cart_ids') or ([cart_id] if cart_id else None)
         status = data.get('status')
         chef_id = data.get('chef_id')
         
-        if not cart_id or status is None:
+        if not cart_ids or not isinstance(cart_ids, list) or status is None:
             return jsonify({"success": False, "message": "Missing cart_id or status"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
-        current_time = datetime.now(ist)
         # If status is 2 (preparing) and chef_id is provided, update chef_id
-        if status == 2 and chef_id:
-            cursor.execute("""
-                UPDATE cart SET status = %s, chef_id = %s, order_updated_at = %s, order_created_at = order_created_at WHERE cart_id = %s
-            """, (status, chef_id, current_time, cart_id))
-        else:
-            cursor.execute("""
-                UPDATE cart SET status = %s, order_updated_at = %s, order_created_at = order_created_at WHERE cart_id = %s
-            """, (status, current_time, cart_id))
+        set_columns = {'chef_id': chef_id} if int(status) == 2 and chef_id else None
+        transition = order_lifecycle.move(cursor, int(status), cart_ids=cart_ids, set_columns=set_columns)
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Status updated"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -692,7 +986,7 @@ def get_kitchen_orders():
         if manager_id:
             if org_id:
                 cursor.execute("""
-                    SELECT c.*, m.item_name, m.item_price, u.name as server_name
+                    SELECT c.*, u.name as server_name
                     FROM cart c 
                     JOIN menu m ON c.item_id = m.item_id 
                     JOIN users u ON c.server_id = u.user_uid
@@ -701,9 +995,8 @@ def get_kitchen_orders():
                 """, (manager_id, org_id))
             else:
                 cursor.execute("""
-                    SELECT c.*, m.item_name, m.item_price, u.name as server_name
+                    SELECT c.*, u.name as server_name
                     FROM cart c 
-                    JOIN menu m ON c.item_id = m.item_id 
                     JOIN users u ON c.server_id = u.user_uid
                     WHERE c.status IN (1, 2, 3) AND c.manager_id = %s
                     ORDER BY c.order_created_at ASC
@@ -711,7 +1004,7 @@ def get_kitchen_orders():
         else:
             if org_id:
                 cursor.execute("""
-                    SELECT c.*, m.item_name, m.item_price, u.name as server_name
+                    SELECT c.*, u.name as server_name
                     FROM cart c 
                     JOIN menu m ON c.item_id = m.item_id 
                     JOIN users u ON c.server_id = u.user_uid
@@ -720,9 +1013,8 @@ def get_kitchen_orders():
                 """, (org_id,))
             else:
                 cursor.execute("""
-                    SELECT c.*, m.item_name, m.item_price, u.name as server_name
+                    SELECT c.*, u.name as server_name
                     FROM cart c 
-                    JOIN menu m ON c.item_id = m.item_id 
                     JOIN users u ON c.server_id = u.user_uid
                     WHERE c.status IN (1, 2, 3)
                     ORDER BY c.order_created_at ASC
@@ -738,6 +1030,58 @@ def get_kitchen_orders():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 
+@app.route('/kitchen/stream', methods=['GET'])
+def kitchen_stream():
+    # Server-Sent Events: one 'snapshot' of the open kitchen lines, then
+    # 'upsert'/'remove' deltas as lines move, with a keep-alive comment when idle
+    manager_id = request.args.get('manager_id')
+    org_id = request.args.get('org_id')
+    
+    # Subscribe before reading the snapshot so no transition falls in between
+    subscription = kitchen_feed.subscribe(manager_id, org_id)
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        conditions = ["c.status IN (1, 2, 3)"]
+        params = []
+        if manager_id:
+            conditions.append("c.manager_id = %s")
+            params.append(manager_id)
+        if org_id:
+            conditions.append("m.org_id = %s")
+            params.append(org_id)
+        
+        cursor.execute(KITCHEN_ROWS_QUERY + " WHERE " + " AND ".join(conditions) + " ORDER BY c.order_created_at ASC", params)
+        snapshot = cursor.fetchall()
+        
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        kitchen_feed.unsubscribe(subscription)
+        return jsonify({"success": False, "message": "Server error"}), 500
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+    
+    def events():
+        try:
+            yield sse('snapshot', snapshot)
+            # An overflowed subscriber missed deltas; ending the stream makes
+            # the display reconnect and start again from a fresh snapshot
+            while not subscription.overflowed:
+                event = subscription.get()
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield sse(event['type'], event)
+        finally:
+            kitchen_feed.unsubscribe(subscription)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 
 @app.route('/cart/send-to-bill', methods=['POST'])
 def send_to_bill():
@@ -771,19 +1115,18 @@ def send_to_bill():
                 INSERT INTO customer_info (order_id, customer_name, customer_phone) 
                 VALUES (%s, %s, %s)
             """, (order_id, customer_name, customer_phone))
+            order_headers.set_customer(cursor, order_id, customer_name, customer_phone)
         
-        current_time = datetime.now(ist)
         # Update all served items to billed status (5)
-        cursor.execute("""
-            UPDATE cart SET status = 5, order_updated_at = %s, order_created_at = order_created_at 
-            WHERE table_id = %s AND server_id = %s AND status = 4
-        """, (current_time, table_id, server_id))
+        transition = order_lifecycle.move(cursor, 5, "table_id = %s AND server_id = %s AND status = 4", (table_id, server_id))
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Order sent to bill"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -804,116 +1147,88 @@ def send_notification():
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
+def _dashboard_filters():
+    from_date = request.args.get('from_date')
+    to_date = request.args.get('to_date')
+    server_id = request.args.get('server_id')
+    # A manager filter becomes the list of that manager's staff
+    staff_ids = user_hierarchy.staff_ids(request.args.get('manager_id'))
+    return from_date, to_date, datetime.now(ist).date(), server_id, staff_ids
+
+def _overview_panel(cursor, filters):
+    # Totals - only status 6 (completed), closed days come from the rollup
+    overview = sales_rollup.overview(cursor, *filters)
+    
+    # Orders by status
+    status_data = [{'status': 6, 'count': overview['total_items']}] if overview['total_items'] else []
+    return {"overview": overview, "status_breakdown": status_data}
+
+def _status_counts_panel(cursor, filters):
+    from_date, to_date, today, server_id, staff_ids = filters
+    
+    date_condition, params = date_range_condition("order_created_at", from_date, to_date, default=today)
+    
+    # Add server/manager filter if provided
+    filter_condition = ""
+    if server_id:
+        filter_condition = " AND (server_id = %s OR chef_id = %s)"
+        params.extend([server_id, server_id])
+    elif staff_ids is not None:
+        filter_condition = f" AND server_id IN ({','.join(['%s'] * len(staff_ids))})" if staff_ids else " AND 1 = 0"
+        params.extend(staff_ids)
+    
+    # Open statuses are read live, completed orders come from the rollup
+    cursor.execute(f"""
+        SELECT 
+            CASE 
+                WHEN status = 0 THEN 'Cart'
+                WHEN status = 1 THEN 'Kitchen'
+                WHEN status = 2 THEN 'Preparing'
+                WHEN status = 3 THEN 'Ready'
+                WHEN status = 4 THEN 'Served'
+                WHEN status = 5 THEN 'Billed'
+                ELSE 'Unknown'
+            END as status_name,
+            status,
+            COUNT(DISTINCT order_id) as count
+        FROM cart
+        WHERE {date_condition} AND status IN (0, 1, 2, 3, 4, 5){filter_condition}
+        GROUP BY status
+        ORDER BY status
+    """, params)
+    status_data = cursor.fetchall()
+    
+    completed_count = sales_rollup.completed_order_count(cursor, from_date, to_date, today, server_id, staff_ids)
+    if completed_count:
+        status_data.append({'status_name': 'Completed', 'status': 6, 'count': completed_count})
+    
+    return status_data
+
 @app.route('/dashboard_insights/overview', methods=['GET'])
+@cached_report()
 def dashboard_insights_overview():
     try:
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        server_id = request.args.get('server_id')
-        manager_id = request.args.get('manager_id')
-        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
-        
-        # Add server filter if provided
-        server_condition = ""
-        if server_id:
-            server_condition = " AND (c.server_id = %s OR c.chef_id = %s)"
-            params.extend([server_id, server_id])
-        elif manager_id:
-            server_condition = " AND c.server_id IN (SELECT user_uid FROM users WHERE parent_uid = %s)"
-            params.append(manager_id)
-        
-        # Total orders - only status 6 (completed)
-        cursor.execute(f"""
-            SELECT COUNT(DISTINCT order_id) as total_orders,
-                   COUNT(*) as total_items,
-                   COALESCE(SUM(c.item_qty * m.item_price), 0) as total_revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
-            WHERE {date_condition} AND c.status = 6{server_condition}
-        """, params)
-        overview = cursor.fetchone()
-        
-        # Ensure overview has default values if null
-        if not overview or overview['total_orders'] is None:
-            overview = {
-                'total_orders': 0,
-                'total_items': 0,
-                'total_revenue': 0
-            }
-        
-        # Orders by status
-        cursor.execute(f"""
-            SELECT status, COUNT(*) as count
-            FROM cart c
-            WHERE {date_condition} AND status = 6{server_condition}
-            GROUP BY status
-        """, params)
-        status_data = cursor.fetchall()
+        overview_data = _overview_panel(cursor, _dashboard_filters())
         
         cursor.close()
         conn.close()
         
-        return jsonify({
-            "success": True, 
-            "data": {
-                "overview": overview,
-                "status_breakdown": status_data
-            }
-        })
+        return jsonify({"success": True, "data": overview_data})
     except Exception as e:
 
         return jsonify({"success": False, "message": f"Server error: {str(e)}"}), 500
 
 @app.route('/dashboard_insights/popular_items', methods=['GET'])
+@cached_report()
 def dashboard_insights_popular_items():
     try:
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        server_id = request.args.get('server_id')
-        manager_id = request.args.get('manager_id')
-        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
-        
-        # Add server/manager filter if provided
-        filter_condition = ""
-        if server_id:
-            filter_condition = " AND (c.server_id = %s OR c.chef_id = %s)"
-            params.extend([server_id, server_id])
-        elif manager_id:
-            filter_condition = " AND c.server_id IN (SELECT user_uid FROM users WHERE parent_uid = %s)"
-            params.append(manager_id)
-        
-        cursor.execute(f"""
-            SELECT m.item_name, SUM(c.item_qty) as total_quantity,
-                   COUNT(*) as order_count,
-                   SUM(c.item_qty * m.item_price) as revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
-            WHERE {date_condition} AND c.status = 6{filter_condition}
-            GROUP BY c.item_id, m.item_name
-            ORDER BY total_quantity DESC
-            LIMIT 10
-        """, params)
-        popular_items = cursor.fetchall()
+        popular_items = sales_rollup.popular_items(cursor, *_dashboard_filters())
         
         cursor.close()
         conn.close()
@@ -923,45 +1238,13 @@ def dashboard_insights_popular_items():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/hourly_orders', methods=['GET'])
+@cached_report()
 def dashboard_insights_hourly_orders():
     try:
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        server_id = request.args.get('server_id')
-        manager_id = request.args.get('manager_id')
-        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
-        
-        # Add server/manager filter if provided
-        filter_condition = ""
-        if server_id:
-            filter_condition = " AND (c.server_id = %s OR c.chef_id = %s)"
-            params.extend([server_id, server_id])
-        elif manager_id:
-            filter_condition = " AND c.server_id IN (SELECT user_uid FROM users WHERE parent_uid = %s)"
-            params.append(manager_id)
-        
-        cursor.execute(f"""
-            SELECT HOUR(c.order_created_at) as hour,
-                   COUNT(DISTINCT c.order_id) as orders,
-                   COUNT(*) as items,
-                   SUM(c.item_qty * m.item_price) as revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
-            WHERE {date_condition} AND c.status = 6{filter_condition}
-            GROUP BY HOUR(c.order_created_at)
-            ORDER BY hour
-        """, params)
-        hourly_data = cursor.fetchall()
+        hourly_data = sales_rollup.hourly_orders(cursor, *_dashboard_filters())
         
         cursor.close()
         conn.close()
@@ -971,46 +1254,13 @@ def dashboard_insights_hourly_orders():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/table_performance', methods=['GET'])
+@cached_report()
 def dashboard_insights_table_performance():
     try:
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        server_id = request.args.get('server_id')
-        manager_id = request.args.get('manager_id')
-        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
-        
-        # Add server/manager filter if provided
-        filter_condition = ""
-        if server_id:
-            filter_condition = " AND (c.server_id = %s OR c.chef_id = %s)"
-            params.extend([server_id, server_id])
-        elif manager_id:
-            filter_condition = " AND c.server_id IN (SELECT user_uid FROM users WHERE parent_uid = %s)"
-            params.append(manager_id)
-        
-        cursor.execute(f"""
-            SELECT c.table_id,
-                   COUNT(DISTINCT c.order_id) as total_orders,
-                   COUNT(*) as total_items,
-                   SUM(c.item_qty * m.item_price) as revenue,
-                   AVG(c.item_qty * m.item_price) as avg_order_value
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
-            WHERE {date_condition} AND c.status = 6{filter_condition}
-            GROUP BY c.table_id
-            ORDER BY revenue DESC
-        """, params)
-        table_data = cursor.fetchall()
+        table_data = sales_rollup.table_performance(cursor, *_dashboard_filters())
         
         cursor.close()
         conn.close()
@@ -1020,46 +1270,13 @@ def dashboard_insights_table_performance():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/server_performance', methods=['GET'])
+@cached_report()
 def dashboard_insights_server_performance():
     try:
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        server_id = request.args.get('server_id')
-        manager_id = request.args.get('manager_id')
-        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
-        
-        # Add server/manager filter if provided
-        filter_condition = ""
-        if server_id:
-            filter_condition = " AND (c.server_id = %s OR c.chef_id = %s)"
-            params.extend([server_id, server_id])
-        elif manager_id:
-            filter_condition = " AND c.server_id IN (SELECT user_uid FROM users WHERE parent_uid = %s)"
-            params.append(manager_id)
-        
-        cursor.execute(f"""
-            SELECT u.name as server_name, c.server_id,
-                   COUNT(DISTINCT c.order_id) as total_orders,
-                   COUNT(*) as total_items,
-                   SUM(c.item_qty * m.item_price) as revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
-            LEFT JOIN users u ON c.server_id = u.user_uid
-            WHERE {date_condition} AND c.status = 6{filter_condition}
-            GROUP BY c.server_id, u.name
-            ORDER BY revenue DESC
-        """, params)
-        server_data = cursor.fetchall()
+        server_data = sales_rollup.server_performance(cursor, *_dashboard_filters())
         
         cursor.close()
         conn.close()
@@ -1069,44 +1286,13 @@ def dashboard_insights_server_performance():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/payment_mode_revenue', methods=['GET'])
+@cached_report()
 def dashboard_insights_payment_mode_revenue():
     try:
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        server_id = request.args.get('server_id')
-        manager_id = request.args.get('manager_id')
-        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s"
-            params = [current_date]
-        
-        # Add server filter if provided
-        server_condition = ""
-        if server_id:
-            server_condition = " AND (c.server_id = %s OR c.chef_id = %s)"
-            params.extend([server_id, server_id])
-        elif manager_id:
-            server_condition = " AND c.server_id IN (SELECT user_uid FROM users WHERE parent_uid = %s)"
-            params.append(manager_id)
-        
-        cursor.execute(f"""
-            SELECT pm.mode as payment_mode,
-                   SUM(c.item_qty * m.item_price) as revenue
-            FROM cart c
-            JOIN menu m ON c.item_id = m.item_id
-            JOIN payment_mode pm ON c.order_id = pm.order_id
-            WHERE {date_condition} AND c.status = 6{server_condition}
-            GROUP BY pm.mode
-            ORDER BY revenue DESC
-        """, params)
-        payment_data = cursor.fetchall()
+        payment_data = sales_rollup.payment_mode_revenue(cursor, *_dashboard_filters())
         
         cursor.close()
         conn.close()
@@ -1116,53 +1302,13 @@ def dashboard_insights_payment_mode_revenue():
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/dashboard_insights/status_counts', methods=['GET'])
+@cached_report(statuses=None)
 def dashboard_insights_status_counts():
     try:
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        server_id = request.args.get('server_id')
-        manager_id = request.args.get('manager_id')
-        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        if from_date and to_date:
-            date_condition = "DATE(order_created_at) BETWEEN %s AND %s"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(order_created_at) = %s"
-            params = [current_date]
-        
-        # Add server/manager filter if provided
-        filter_condition = ""
-        if server_id:
-            filter_condition = " AND (server_id = %s OR chef_id = %s)"
-            params.extend([server_id, server_id])
-        elif manager_id:
-            filter_condition = " AND server_id IN (SELECT user_uid FROM users WHERE parent_uid = %s)"
-            params.append(manager_id)
-        
-        cursor.execute(f"""
-            SELECT 
-                CASE 
-                    WHEN status = 0 THEN 'Cart'
-                    WHEN status = 1 THEN 'Kitchen'
-                    WHEN status = 2 THEN 'Preparing'
-                    WHEN status = 3 THEN 'Ready'
-                    WHEN status = 4 THEN 'Served'
-                    WHEN status = 5 THEN 'Billed'
-                    WHEN status = 6 THEN 'Completed'
-                    ELSE 'Unknown'
-                END as status_name,
-                status,
-                COUNT(DISTINCT order_id) as count
-            FROM cart
-            WHERE {date_condition}{filter_condition}
-            GROUP BY status
-            ORDER BY status
-        """, params)
-        status_data = cursor.fetchall()
+        status_data = _status_counts_panel(cursor, _dashboard_filters())
         
         cursor.close()
         conn.close()
@@ -1171,7 +1317,64 @@ def dashboard_insights_status_counts():
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
+@app.route('/dashboard_insights/all', methods=['GET'])
+@cached_report(statuses=None)
+def dashboard_insights_all():
+    # Every /dashboard_insights panel in one response, computed in parallel
+    # with one pooled connection per panel; timings_ms shows what each took
+    try:
+        filters = _dashboard_filters()
+        
+        panels = {
+            'overview': lambda cursor: _overview_panel(cursor, filters),
+            'popular_items': lambda cursor: sales_rollup.popular_items(cursor, *filters),
+            'hourly_orders': lambda cursor: sales_rollup.hourly_orders(cursor, *filters),
+            'table_performance': lambda cursor: sales_rollup.table_performance(cursor, *filters),
+            'server_performance': lambda cursor: sales_rollup.server_performance(cursor, *filters),
+            'payment_mode_revenue': lambda cursor: sales_rollup.payment_mode_revenue(cursor, *filters),
+            'status_counts': lambda cursor: _status_counts_panel(cursor, filters)
+        }
+        
+        started = time.perf_counter()
+        try:
+            data, timings = dashboard_panels.run(panel_db_connector(), panels)
+        except PoolTimeout:
+            g.pool_timeout = True
+            raise
+        
+        return jsonify({
+            "success": True,
+            "data": data,
+            "timings_ms": timings,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+    except Exception as e:
+        return jsonify({"success": False, "message": "Server error"}), 500
+
+@app.route('/dashboard_insights/analytics', methods=['GET'])
+@cached_report()
+def dashboard_insights_analytics():
+    # Every dashboard panel for one org from a single read of its completed lines
+    try:
+        org_id = request.args.get('org_id')
+        if not org_id:
+            return jsonify({"success": False, "message": "org_id is required"}), 400
+        from_date, to_date, today, server_id, staff_ids = _dashboard_filters()
+        
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        panels = analytics_cache.panels(cursor, org_id, from_date, to_date, today, server_id, staff_ids)
+        
+        cursor.close()
+        conn.close()
+        
+        return jsonify({"success": True, "data": panels})
+    except Exception as e:
+        return jsonify({"success": False, "message": "Server error"}), 500
+
 @app.route('/categories/popular', methods=['GET'])
+@cached_report(dated=False)
 def get_popular_categories():
     try:
         org_id = request.args.get('org_id')
@@ -1184,7 +1387,7 @@ def get_popular_categories():
                 SELECT m.item_cat as category, 
                        SUM(c.item_qty) as total_quantity,
                        COUNT(DISTINCT c.order_id) as total_orders,
-                       SUM(c.item_qty * m.item_price) as revenue
+                       SUM(c.item_qty * c.item_price) as revenue
                 FROM cart c
                 JOIN menu m ON c.item_id = m.item_id
                 WHERE c.status = 5 AND m.org_id = %s
@@ -1196,7 +1399,7 @@ def get_popular_categories():
                 SELECT m.item_cat as category, 
                        SUM(c.item_qty) as total_quantity,
                        COUNT(DISTINCT c.order_id) as total_orders,
-                       SUM(c.item_qty * m.item_price) as revenue
+                       SUM(c.item_qty * c.item_price) as revenue
                 FROM cart c
                 JOIN menu m ON c.item_id = m.item_id
                 WHERE c.status = 5
@@ -1307,6 +1510,7 @@ def add_member():
                 """, (final_org, org_name, org_address, org_phone, org_gst, org_fssai, org_table_nos, 1))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -1356,113 +1560,62 @@ def get_biller_orders():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Get orders with status 5 (sent to bill) grouped by order_id with customer info and server name
+        # Orders with lines sent to bill (status 5) come from their headers
+        conditions, params = ["o.status = 5"], []
         if manager_id:
-            if org_id:
-                cursor.execute("""
-                    SELECT c.order_id, c.table_id, c.server_id, c.order_created_at,
-                           c.item_id, SUM(c.item_qty) as item_qty,
-                           m.item_name, m.item_price,
-                           (SUM(c.item_qty) * m.item_price) as total,
-                           ci.customer_name, ci.customer_phone,
-                           u.name as server_name,
-                           MIN(c.cart_id) as cart_id
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    JOIN users u ON c.server_id = u.user_uid
-                    LEFT JOIN customer_info ci ON c.order_id = ci.order_id
-                    WHERE c.status = 5 AND c.manager_id = %s AND m.org_id = %s
-                    GROUP BY c.order_id, c.table_id, c.server_id, c.order_created_at, 
-                             c.item_id, m.item_name, m.item_price, 
-                             ci.customer_name, ci.customer_phone, u.name
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """, (manager_id, org_id))
-            else:
-                cursor.execute("""
-                    SELECT c.order_id, c.table_id, c.server_id, c.order_created_at,
-                           c.item_id, SUM(c.item_qty) as item_qty,
-                           m.item_name, m.item_price,
-                           (SUM(c.item_qty) * m.item_price) as total,
-                           ci.customer_name, ci.customer_phone,
-                           u.name as server_name,
-                           MIN(c.cart_id) as cart_id
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    JOIN users u ON c.server_id = u.user_uid
-                    LEFT JOIN customer_info ci ON c.order_id = ci.order_id
-                    WHERE c.status = 5 AND c.manager_id = %s
-                    GROUP BY c.order_id, c.table_id, c.server_id, c.order_created_at, 
-                             c.item_id, m.item_name, m.item_price, 
-                             ci.customer_name, ci.customer_phone, u.name
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """, (manager_id,))
-        else:
-            if org_id:
-                cursor.execute("""
-                    SELECT c.order_id, c.table_id, c.server_id, c.order_created_at,
-                           c.item_id, SUM(c.item_qty) as item_qty,
-                           m.item_name, m.item_price,
-                           (SUM(c.item_qty) * m.item_price) as total,
-                           ci.customer_name, ci.customer_phone,
-                           u.name as server_name,
-                           MIN(c.cart_id) as cart_id
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    JOIN users u ON c.server_id = u.user_uid
-                    LEFT JOIN customer_info ci ON c.order_id = ci.order_id
-                    WHERE c.status = 5 AND m.org_id = %s
-                    GROUP BY c.order_id, c.table_id, c.server_id, c.order_created_at, 
-                             c.item_id, m.item_name, m.item_price, 
-                             ci.customer_name, ci.customer_phone, u.name
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """, (org_id,))
-            else:
-                cursor.execute("""
-                    SELECT c.order_id, c.table_id, c.server_id, c.order_created_at,
-                           c.item_id, SUM(c.item_qty) as item_qty,
-                           m.item_name, m.item_price,
-                           (SUM(c.item_qty) * m.item_price) as total,
-                           ci.customer_name, ci.customer_phone,
-                           u.name as server_name,
-                           MIN(c.cart_id) as cart_id
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    JOIN users u ON c.server_id = u.user_uid
-                    LEFT JOIN customer_info ci ON c.order_id = ci.order_id
-                    WHERE c.status = 5
-                    GROUP BY c.order_id, c.table_id, c.server_id, c.order_created_at, 
-                             c.item_id, m.item_name, m.item_price, 
-                             ci.customer_name, ci.customer_phone, u.name
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """)
+            conditions.append("o.manager_id = %s")
+            params.append(manager_id)
+        if org_id:
+            conditions.append("o.org_id = %s")
+            params.append(org_id)
         
-        cart_items = cursor.fetchall()
+        cursor.execute(f"""
+            SELECT o.order_id, o.table_id, o.server_id, o.created_at,
+                   o.customer_name, o.customer_phone, u.name as server_name
+            FROM orders o
+            JOIN users u ON o.server_id = u.user_uid
+            WHERE {' AND '.join(conditions)}
+            ORDER BY o.created_at DESC, o.order_id
+        """, params)
         
-        # Group items by order_id
         orders = {}
-        for item in cart_items:
-            order_id = item['order_id']
-            if order_id not in orders:
-                orders[order_id] = {
-                    'order_id': order_id,
-                    'table_id': item['table_id'],
-                    'server_id': item['server_id'],
-                    'server_name': item['server_name'],
-                    'order_created_at': item['order_created_at'].isoformat() if item['order_created_at'] else None,
-                    'customer_name': item['customer_name'],
-                    'customer_phone': item['customer_phone'],
-                    'items': [],
-                    'total_amount': 0
-                }
+        for header in cursor.fetchall():
+            orders[header['order_id']] = {
+                'order_id': header['order_id'],
+                'table_id': header['table_id'],
+                'server_id': header['server_id'],
+                'server_name': header['server_name'],
+                'order_created_at': header['created_at'].isoformat() if header['created_at'] else None,
+                'customer_name': header['customer_name'],
+                'customer_phone': header['customer_phone'],
+                'items': [],
+                'total_amount': 0
+            }
+        
+        # Billed lines of those orders, one entry per item
+        if orders:
+            placeholders = ','.join(['%s'] * len(orders))
+            cursor.execute(f"""
+                SELECT c.order_id, c.item_id, SUM(c.item_qty) as item_qty,
+                       c.item_name, c.item_price,
+                       (SUM(c.item_qty) * c.item_price) as total,
+                       MIN(c.cart_id) as cart_id
+                FROM cart c
+                WHERE c.order_id IN ({placeholders}) AND c.status = 5
+                GROUP BY c.order_id, c.item_id, c.item_name, c.item_price
+                ORDER BY c.order_id, MIN(c.id)
+            """, list(orders))
             
-            orders[order_id]['items'].append({
-                'cart_id': item['cart_id'],
-                'item_name': item['item_name'],
-                'item_qty': item['item_qty'],
-                'item_price': item['item_price'],
-                'total': item['total']
-            })
-            orders[order_id]['total_amount'] += item['total']
+            for item in cursor.fetchall():
+                order = orders[item['order_id']]
+                order['items'].append({
+                    'cart_id': item['cart_id'],
+                    'item_name': item['item_name'],
+                    'item_qty': item['item_qty'],
+                    'item_price': item['item_price'],
+                    'total': item['total']
+                })
+                order['total_amount'] += item['total'] or 0
         
         cursor.close()
         conn.close()
@@ -1490,11 +1643,19 @@ def save_payment_mode():
             INSERT INTO payment_mode (order_id, mode, org_id, billed_by) 
             VALUES (%s, %s, %s, %s)
         """, (order_id, mode, org_id, billed_by))
+        order_headers.set_payment(cursor, order_id, mode, billed_by)
+        cursor.execute("SELECT created_at FROM orders WHERE order_id = %s", (order_id,))
+        header = cursor.fetchone()
         
         conn.commit()
         cursor.close()
         conn.close()
         
+        # The payment panel of an already completed order changes
+        if header and header[0]:
+            analytics_cache.invalidate(org_id, days={header[0].date()})
+            report_cache.invalidate(order_dates={header[0].date()})
+        
         return jsonify({"success": True, "message": "Payment mode saved"})
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
@@ -1509,24 +1670,24 @@ def complete_order():
             return jsonify({"success": False, "message": "Missing order_id"}), 400
         
         conn = get_db_connection()
-        cursor = conn.cursor()
+        cursor = conn.cursor(dictionary=True)
         
-        current_time = datetime.now(ist)
-        # Update order status to 6 (completed)
-        cursor.execute("""
-            UPDATE cart SET status = 6, order_updated_at = %s, order_created_at = order_created_at 
-            WHERE order_id = %s AND status = 5
-        """, (current_time, order_id))
+        # Update order status to 6 (completed); the lines are locked and
+        # rolled up exactly once by the lifecycle subscriber
+        transition = order_lifecycle.move(cursor, 6, "status = 5", order_ids=[order_id])
         
-        conn.commit()
+        order_lifecycle.commit(conn, cursor, transition)
         cursor.close()
         conn.close()
         
         return jsonify({"success": True, "message": "Order completed successfully"})
+    except InvalidTransition as e:
+        return jsonify({"success": False, "message": str(e)}), 409
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
 @app.route('/completed_orders', methods=['GET'])
+@cached_report()
 def get_completed_orders():
     try:
         from_date = request.args.get('from_date')
@@ -1537,90 +1698,60 @@ def get_completed_orders():
         cursor = conn.cursor(dictionary=True)
         
         # Build date condition
-        if from_date and to_date:
-            date_condition = "DATE(c.order_created_at) BETWEEN %s AND %s AND"
-            params = [from_date, to_date]
-        else:
-            current_date = datetime.now(ist).date()
-            date_condition = "DATE(c.order_created_at) = %s AND"
-            params = [current_date]
+        date_condition, params = date_range_condition("o.created_at", from_date, to_date, default=datetime.now(ist).date())
+        # Orders with any completed line, see order_headers
+        conditions = [date_condition, "o.completed_line_count > 0"]
         
         org_id = request.args.get('org_id')
         
-        # Get completed orders with their items
+        # For managers (role 3), only show orders from their staff
         if manager_id:
-            # For managers (role 3), only show orders from their staff
-            if org_id:
-                cursor.execute(f"""
-                    SELECT c.order_id, c.table_id, c.order_created_at,
-                           c.cart_id, c.item_id, c.item_qty,
-                           m.item_name, m.item_price,
-                           (c.item_qty * m.item_price) as total
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    JOIN users u ON c.server_id = u.user_uid
-                    WHERE {date_condition} c.status = 6 AND u.parent_uid = %s AND m.org_id = %s
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """, params + [manager_id, org_id])
-            else:
-                cursor.execute(f"""
-                    SELECT c.order_id, c.table_id, c.order_created_at,
-                           c.cart_id, c.item_id, c.item_qty,
-                           m.item_name, m.item_price,
-                           (c.item_qty * m.item_price) as total
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    JOIN users u ON c.server_id = u.user_uid
-                    WHERE {date_condition} c.status = 6 AND u.parent_uid = %s
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """, params + [manager_id])
-        else:
-            if org_id:
-                cursor.execute(f"""
-                    SELECT c.order_id, c.table_id, c.order_created_at,
-                           c.cart_id, c.item_id, c.item_qty,
-                           m.item_name, m.item_price,
-                           (c.item_qty * m.item_price) as total
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    WHERE {date_condition} c.status = 6 AND m.org_id = %s
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """, params + [org_id])
-            else:
-                cursor.execute(f"""
-                    SELECT c.order_id, c.table_id, c.order_created_at,
-                           c.cart_id, c.item_id, c.item_qty,
-                           m.item_name, m.item_price,
-                           (c.item_qty * m.item_price) as total
-                    FROM cart c
-                    JOIN menu m ON c.item_id = m.item_id
-                    WHERE {date_condition} c.status = 6
-                    ORDER BY c.order_created_at DESC, c.order_id
-                """, params)
-        
-        cart_items = cursor.fetchall()
-        
-        # Group items by order_id
+            conditions.append("o.manager_id = %s")
+            params.append(manager_id)
+        if org_id:
+            conditions.append("o.org_id = %s")
+            params.append(org_id)
+        
+        # Completed orders from their headers
+        cursor.execute(f"""
+            SELECT o.order_id, o.table_id, o.created_at, o.completed_amount
+            FROM orders o
+            WHERE {' AND '.join(conditions)}
+            ORDER BY o.created_at DESC, o.order_id
+        """, params)
+        
         orders_dict = {}
-        for item in cart_items:
-            order_id = item['order_id']
-            if order_id not in orders_dict:
-                orders_dict[order_id] = {
-                    'id': len(orders_dict) + 1,  # Simple ID for frontend
-                    'order_id': order_id,
-                    'table_number': str(item['table_id']),
-                    'created_at': item['order_created_at'].isoformat() if item['order_created_at'] else None,
-                    'items': [],
-                    'total_amount': 0
-                }
+        for header in cursor.fetchall():
+            orders_dict[header['order_id']] = {
+                'id': len(orders_dict) + 1,  # Simple ID for frontend
+                'order_id': header['order_id'],
+                'table_number': str(header['table_id']),
+                'created_at': header['created_at'].isoformat() if header['created_at'] else None,
+                'items': [],
+                'total_amount': float(header['completed_amount'])
+            }
+        
+        # Their items; past days are archived to cart_history, so completed
+        # lines are read through cart_reporting
+        if orders_dict:
+            placeholders = ','.join(['%s'] * len(orders_dict))
+            cursor.execute(f"""
+                SELECT c.order_id, c.item_qty, c.item_name, c.item_price,
+                       (c.item_qty * c.item_price) as total
+                FROM cart_reporting c
+                WHERE c.order_id IN ({placeholders}) AND c.status = 6
+                ORDER BY c.order_created_at DESC
+            """, list(orders_dict))
             
-            orders_dict[order_id]['items'].append({
-                'item_name': item['item_name'],
-                'quantity': item['item_qty'],
-                'price': float(item['item_price']),
-                'total': float(item['total'])
-            })
-            orders_dict[order_id]['total_amount'] += float(item['total'])
+            for item in cursor.fetchall():
+                orders_dict[item['order_id']]['items'].append({
+                    'item_name': item['item_name'],
+                    'quantity': item['item_qty'],
+                    # Unknown for lines whose menu item was deleted before
+                    # prices were copied onto cart lines
+                    'price': float(item['item_price'] or 0),
+                    'total': float(item['total'] or 0)
+                })
         
         orders = list(orders_dict.values())
         
@@ -1643,20 +1774,21 @@ def get_categories():
     try:
         org_id = request.args.get('org_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        def load_categories():
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
         
-        if org_id:
-            cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE item_cat IS NOT NULL AND item_cat != '' AND org_id = %s ORDER BY item_cat", (org_id,))
-        else:
-            cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE item_cat IS NOT NULL AND item_cat != '' ORDER BY item_cat")
-        categories = cursor.fetchall()
+            if org_id:
+                cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE item_cat IS NOT NULL AND item_cat != '' AND org_id = %s ORDER BY item_cat", (org_id,))
+            else:
+                cursor.execute("SELECT DISTINCT item_cat FROM menu WHERE item_cat IS NOT NULL AND item_cat != '' ORDER BY item_cat")
+            categories = cursor.fetchall()
         
-        cursor.close()
-        conn.close()
+            cursor.close()
+            conn.close()
+            return [cat['item_cat'] for cat in categories]
         
-        category_list = [cat['item_cat'] for cat in categories]
-        return jsonify({"success": True, "data": category_list})
+        return _menu_response(menu_cache.key('menu/categories', org_id), load_categories)
     except Exception as e:
         return jsonify({"success": False, "message": "Server error"}), 500
 
@@ -1679,17 +1811,15 @@ def get_org_info():
 @app.route('/org/tables/<user_uid>', methods=['GET'])
 def get_org_tables(user_uid):
     try:
+        org_id = user_hierarchy.org_of(user_uid)
+        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        cursor.execute("""
-            SELECT oi.org_table_nos 
-            FROM users u 
-            JOIN org_info oi ON u.org = oi.org_id 
-            WHERE u.user_uid = %s
-        """, (user_uid,))
-        
-        result = cursor.fetchone()
+        result = None
+        if org_id is not None:
+            cursor.execute("SELECT org_table_nos FROM org_info WHERE org_id = %s", (org_id,))
+            result = cursor.fetchone()
         cursor.close()
         conn.close()
         
@@ -1715,17 +1845,18 @@ def get_org_tables(user_uid):
 @app.route('/org/info/<user_uid>', methods=['GET'])
 def get_org_info_by_user(user_uid):
     try:
+        org_id = user_hierarchy.org_of(user_uid)
+        
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        cursor.execute("""
-            SELECT oi.org_name, oi.org_address, oi.org_phone, oi.org_gst, oi.org_fssai 
-            FROM users u 
-            JOIN org_info oi ON u.org = oi.org_id 
-            WHERE u.user_uid = %s
-        """, (user_uid,))
-        
-        result = cursor.fetchone()
+        result = None
+        if org_id is not None:
+            cursor.execute("""
+                SELECT org_name, org_address, org_phone, org_gst, org_fssai
+                FROM org_info WHERE org_id = %s
+            """, (org_id,))
+            result = cursor.fetchone()
         cursor.close()
         conn.close()
         
@@ -1752,6 +1883,109 @@ def get_org_info_by_user(user_uid):
             'message': str(e)
         }), 500
 
+def _export_query(cursor, from_date, to_date, export_type):
+    # Get org name for filename
+    cursor.execute("SELECT org_name FROM org_info WHERE org_status = 1 LIMIT 1")
+    org_result = cursor.fetchall()
+    org_name = org_result[0]['org_name'].replace(' ', '_') if org_result else 'Restaurant'
+    
+    if export_type == 'summary':
+        # Summary export query, one header row per order
+        query = """
+            SELECT
+                o.order_id,
+                us.name as server_name,
+                uc.name as chef_name,
+                o.completed_amount as bill_amount,
+                o.payment_mode,
+                o.completed_at as order_completed_date,
+                o.customer_name,
+                o.customer_phone
+            FROM orders o
+            LEFT JOIN users us ON o.server_id = us.user_uid
+            LEFT JOIN users uc ON o.chef_id = uc.user_uid
+            WHERE o.created_at >= %s AND o.created_at < %s 
+            AND o.completed_line_count > 0
+            ORDER BY o.completed_at DESC
+        """
+        
+        header = ['Order ID', 'Customer Name', 'Customer Phone', 'Server Name', 'Chef Name', 'Bill Amount', 'Payment Mode', 'Order Completed Date']
+        
+        def format_row(row):
+            return [
+                row['order_id'],
+                row['customer_name'] or 'N/A',
+                row['customer_phone'] or 'N/A',
+                row['server_name'] or 'N/A',
+                row['chef_name'] or 'N/A',
+                row['bill_amount'],
+                row['payment_mode'] or 'N/A',
+                row['order_completed_date']
+            ]
+        
+        filename = f"{org_name}_summary_export_{from_date}_{to_date}.csv"
+    else:
+        # Full export query (existing)
+        query = """
+            SELECT 
+                c.order_id,
+                c.table_id,
+                u.name as server_name,
+                c.item_name,
+                m.item_cat,
+                c.item_qty,
+                c.item_price,
+                (c.item_qty * c.item_price) as total_price,
+                DATE(c.order_created_at) as order_date,
+                TIME(c.order_created_at) as order_time,
+                CASE 
+                    WHEN c.status = 6 THEN 'Completed'
+                    WHEN c.status = 5 THEN 'Billed'
+                    WHEN c.status = 4 THEN 'Served'
+                    ELSE 'Other'
+                END as status
+            FROM cart_reporting c
+            JOIN menu m ON c.item_id = m.item_id
+            LEFT JOIN users u ON c.server_id = u.user_uid
+            WHERE c.order_created_at >= %s AND c.order_created_at < %s 
+            AND c.status = 6
+            ORDER BY c.order_created_at DESC, c.order_id
+        """
+        
+        header = ['Order ID', 'Table', 'Server', 'Item Name', 'Category', 'Quantity', 'Unit Price', 'Total Price', 'Order Date', 'Order Time', 'Status']
+        
+        def format_row(row):
+            return [
+                row['order_id'],
+                row['table_id'],
+                row['server_name'] or 'N/A',
+                row['item_name'],
+                row['item_cat'],
+                row['item_qty'],
+                row['item_price'],
+                row['total_price'],
+                row['order_date'],
+                row['order_time'],
+                row['status']
+            ]
+        
+        filename = f"{org_name}_full_export_{from_date}_{to_date}.csv"
+    
+    return query, list(day_bounds(from_date, to_date)), header, format_row, filename
+
+def _open_export(from_date, to_date, export_type):
+    # Background exports use a dedicated connection so they never hold one of
+    # the pooled connections that order-taking requests depend on
+    conn = mysql.connector.connect(**db_cred)
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        query, params, header, format_row, filename = _export_query(cursor, from_date, to_date, export_type)
+        cursor.execute(query, params)
+    except Exception:
+        conn.close()
+        raise
+    return cursor, conn, header, format_row, filename
+
 @app.route('/export/orders', methods=['POST'])
 def export_orders():
     try:
@@ -1763,131 +1997,35 @@ def export_orders():
         if not from_date or not to_date:
             return jsonify({"success": False, "message": "Missing from_date or to_date"}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        if data.get('async'):
+            # Closed date ranges never change, so their report file can be reused
+            closed_range = str(to_date) < datetime.now(ist).date().isoformat()
+            key = f"restaurant:{export_type}:{from_date}:{to_date}" if closed_range else None
+            job = export_jobs.submit(
+                lambda: _open_export(from_date, to_date, export_type),
+                compress=bool(data.get('compress')),
+                key=key
+            )
+            return jsonify({"success": True, "job": export_jobs.job_status(job)}), 202
         
-        # Get org name for filename
-        cursor.execute("SELECT org_name FROM org_info WHERE org_status = 1 LIMIT 1")
-        org_result = cursor.fetchone()
-        org_name = org_result['org_name'].replace(' ', '_') if org_result else 'Restaurant'
+        conn = get_db_connection()
+        # Unbuffered cursor: rows are streamed from the server as the CSV is written
+        cursor = conn.cursor(dictionary=True, buffered=False)
         
-        if export_type == 'summary':
-            # Summary export query
-            query = """
-                SELECT DISTINCT
-                    c.order_id,
-                    us.name as server_name,
-                    uc.name as chef_name,
-                    SUM(c.item_qty * m.item_price) as bill_amount,
-                    pm.mode as payment_mode,
-                    c.order_updated_at as order_completed_date,
-                    ci.customer_name,
-                    ci.customer_phone
-                FROM cart c
-                JOIN menu m ON c.item_id = m.item_id
-                LEFT JOIN users us ON c.server_id = us.user_uid
-                LEFT JOIN users uc ON c.chef_id = uc.user_uid
-                LEFT JOIN payment_mode pm ON c.order_id = pm.order_id
-                LEFT JOIN customer_info ci ON c.order_id = ci.order_id
-                WHERE DATE(c.order_created_at) BETWEEN %s AND %s 
-                AND c.status = 6
-                GROUP BY c.order_id, us.name, uc.name, pm.mode, c.order_updated_at, ci.customer_name, ci.customer_phone
-                ORDER BY c.order_updated_at DESC
-            """
-            
-            cursor.execute(query, [from_date, to_date])
-            results = cursor.fetchall()
-            
-            if not results:
-                conn.close()
-                return jsonify({"success": False, "message": "No data found for the selected dates"}), 404
-            
-            # Convert to CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow(['Order ID', 'Customer Name', 'Customer Phone', 'Server Name', 'Chef Name', 'Bill Amount', 'Payment Mode', 'Order Completed Date'])
-            
-            # Write data
-            for row in results:
-                writer.writerow([
-                    row['order_id'],
-                    row['customer_name'] or 'N/A',
-                    row['customer_phone'] or 'N/A',
-                    row['server_name'] or 'N/A',
-                    row['chef_name'] or 'N/A',
-                    row['bill_amount'],
-                    row['payment_mode'] or 'N/A',
-                    row['order_completed_date']
-                ])
-            
-            filename = f"{org_name}_summary_export_{from_date}_{to_date}.csv"
-        else:
-            # Full export query (existing)
-            query = """
-                SELECT 
-                    c.order_id,
-                    c.table_id,
-                    u.name as server_name,
-                    m.item_name,
-                    m.item_cat,
-                    c.item_qty,
-                    m.item_price,
-                    (c.item_qty * m.item_price) as total_price,
-                    DATE(c.order_created_at) as order_date,
-                    TIME(c.order_created_at) as order_time,
-                    CASE 
-                        WHEN c.status = 6 THEN 'Completed'
-                        WHEN c.status = 5 THEN 'Billed'
-                        WHEN c.status = 4 THEN 'Served'
-                        ELSE 'Other'
-                    END as status
-                FROM cart c
-                JOIN menu m ON c.item_id = m.item_id
-                LEFT JOIN users u ON c.server_id = u.user_uid
-                WHERE DATE(c.order_created_at) BETWEEN %s AND %s 
-                AND c.status = 6
-                ORDER BY c.order_created_at DESC, c.order_id
-            """
-            
-            cursor.execute(query, [from_date, to_date])
-            results = cursor.fetchall()
-            
-            if not results:
-                conn.close()
-                return jsonify({"success": False, "message": "No data found for the selected dates"}), 404
-            
-            # Convert to CSV
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write header
-            writer.writerow(['Order ID', 'Table', 'Server', 'Item Name', 'Category', 'Quantity', 'Unit Price', 'Total Price', 'Order Date', 'Order Time', 'Status'])
-            
-            # Write data
-            for row in results:
-                writer.writerow([
-                    row['order_id'],
-                    row['table_id'],
-                    row['server_name'] or 'N/A',
-                    row['item_name'],
-                    row['item_cat'],
-                    row['item_qty'],
-                    row['item_price'],
-                    row['total_price'],
-                    row['order_date'],
-                    row['order_time'],
-                    row['status']
-                ])
-            
-            filename = f"{org_name}_full_export_{from_date}_{to_date}.csv"
+        query, params, header, format_row, filename = _export_query(cursor, from_date, to_date, export_type)
+        cursor.execute(query, params)
         
-        conn.close()
-        output.seek(0)
+        # Read the first batch up front so an empty range can still answer 404
+        first_batch = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not first_batch:
+            cursor.close()
+            conn.close()
+            return jsonify({"success": False, "message": "No data found for the selected dates"}), 404
         
+        # The generator closes the cursor and connection once the download finishes
+        detach_db_connection(conn)
         return Response(
-            output.getvalue(),
+            csv_chunks(cursor, conn, header, format_row, first_batch),
             mimetype="text/csv",
             headers={"Content-disposition": f"attachment; filename={filename}"}
         )
@@ -1895,6 +2033,34 @@ def export_orders():
     except Exception as e:
         return jsonify({"success": False, "message": f"Export error: {str(e)}"}), 500
 
+@app.route('/export/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    job = export_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Export job not found"}), 404
+    return jsonify({"success": True, "job": export_jobs.job_status(job)})
+
+@app.route('/export/jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    job = export_jobs.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Export job not found"}), 404
+    if job['status'] != 'done':
+        return jsonify({"success": False, "message": f"Export job is {job['status']}"}), 409
+    
+    path = export_jobs.finished_file(job)
+    if not path:
+        return jsonify({"success": False, "message": "Export file has expired"}), 410
+    
+    # conditional=True lets clients resume with HTTP Range requests
+    return send_file(
+        path,
+        mimetype='application/gzip' if job['compress'] else 'text/csv',
+        as_attachment=True,
+        download_name=job['download_name'],
+        conditional=True
+    )
+
 # Get users by role
 @app.route('/users', methods=['GET'])
 def get_users():
@@ -1931,14 +2097,15 @@ def get_attendance(user_id):
         
         query = """
         SELECT DATE(order_created_at) as order_date, SUM(item_qty) as item_count
-        FROM cart 
+        FROM cart_reporting 
         WHERE (server_id = %s OR chef_id = %s)
-        AND YEAR(order_created_at) = %s 
-        AND MONTH(order_created_at) = %s
+        AND order_created_at >= %s 
+        AND order_created_at < %s
         GROUP BY DATE(order_created_at)
         """
         
-        cursor.execute(query, (user_id, user_id, year, month))
+        month_start, month_end = month_bounds(year, month)
+        cursor.execute(query, (user_id, user_id, month_start, month_end))
         results = cursor.fetchall()
         
         attendance = {}
@@ -1961,28 +2128,7 @@ def get_staff():
     try:
         parent_uid = request.args.get('parent_uid')
         
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        if parent_uid:
-            cursor.execute("""
-                SELECT s.user_uid, s.name, s.phone, s.area, s.pincode, s.status, s.parent_uid, m.name as manager_name
-                FROM users s
-                LEFT JOIN users m ON s.parent_uid = m.user_uid
-                WHERE s.role = 4 AND s.parent_uid = %s
-            """, (parent_uid,))
-        else:
-            cursor.execute("""
-                SELECT s.user_uid, s.name, s.phone, s.area, s.pincode, s.status, s.parent_uid, m.name as manager_name
-                FROM users s
-                LEFT JOIN users m ON s.parent_uid = m.user_uid
-                WHERE s.role = 4
-            """)
-        
-        staff = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        staff = user_hierarchy.staff(parent_uid, fields=('user_uid', 'name', 'phone', 'area', 'pincode', 'status', 'parent_uid'))
         
         return jsonify({'success': True, 'data': staff})
     except Exception as e:
@@ -2113,6 +2259,7 @@ def update_client():
             """, (user_uid,))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -2137,6 +2284,7 @@ def delete_client(user_uid):
         cursor.execute("DELETE FROM org_info WHERE org_id = %s", (user_uid,))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -2174,6 +2322,7 @@ def update_staff():
             """, (name, phone, area, pincode, status, user_uid))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -2195,6 +2344,7 @@ def delete_staff(user_uid):
             return jsonify({'success': False, 'message': 'Staff not found'}), 404
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -2268,6 +2418,7 @@ def update_manager():
             """, (name, phone, area, pincode, status, user_uid))
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -2289,6 +2440,7 @@ def delete_manager(user_uid):
             return jsonify({'success': False, 'message': 'Manager not found'}), 404
         
         conn.commit()
+        user_hierarchy.invalidate()
         cursor.close()
         conn.close()
         
@@ -2306,7 +2458,8 @@ def get_client_dashboard():
         conn = get_db_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Get all clients with organization info
+        # Get all clients with organization info, staff counts and revenue in one pass.
+        # Revenue comes from sales_rollup, which holds every completed line.
         cursor.execute("""
             SELECT 
                 c.name,
@@ -2315,47 +2468,39 @@ def get_client_dashboard():
                 u.created_at as onboard_date,
                 oi.org_name,
                 oi.org_address as address,
-                oi.org_phone as phone
+                oi.org_phone as phone,
+                COALESCE(member_counts.managers_count, 0) as managers_count,
+                COALESCE(member_counts.staff_count, 0) as staff_count,
+                COALESCE(org_revenue.revenue, 0) as total_revenue
             FROM clients c
             LEFT JOIN users u ON c.org_id = u.user_uid AND u.role = 2
             LEFT JOIN org_info oi ON c.org_id = oi.org_id
+            LEFT JOIN (
+                SELECT org, SUM(role = 3) as managers_count, SUM(role = 4) as staff_count
+                FROM users
+                WHERE role IN (3, 4)
+                GROUP BY org
+            ) member_counts ON member_counts.org = c.org_id
+            LEFT JOIN (
+                SELECT u3.org, SUM(r.revenue) as revenue
+                FROM sales_rollup r
+                JOIN users u3 ON r.server_id = u3.user_uid
+                GROUP BY u3.org
+            ) org_revenue ON org_revenue.org = c.org_id
             ORDER BY c.name
         """)
         
         clients = cursor.fetchall()
         
-        # Format the data with separate queries for counts
         formatted_clients = []
         for client in clients:
-            org_id = client['org_id']
-            
-            # Count managers
-            cursor.execute("SELECT COUNT(*) as count FROM users WHERE org = %s AND role = 3", (org_id,))
-            managers_result = cursor.fetchone()
-            managers_count = managers_result['count'] if managers_result else 0
-            
-            # Count staff
-            cursor.execute("SELECT COUNT(*) as count FROM users WHERE org = %s AND role = 4", (org_id,))
-            staff_result = cursor.fetchone()
-            staff_count = staff_result['count'] if staff_result else 0
-            
-            # Calculate revenue
-            cursor.execute("""
-                SELECT COALESCE(SUM(cart.item_qty * menu.item_price), 0) as revenue
-                FROM cart 
-                JOIN menu ON cart.item_id = menu.item_id 
-                JOIN users u3 ON cart.server_id = u3.user_uid 
-                WHERE u3.org = %s AND cart.status = 6
-            """, (org_id,))
-            revenue_result = cursor.fetchone()
-            total_revenue = revenue_result['revenue'] if revenue_result else 0
-            
+            total_revenue = client['total_revenue']
             formatted_clients.append({
                 'name': client['name'],
                 'org_id': client['org_id'],
                 'no_of_users': client['no_of_users'],
-                'managers_count': managers_count,
-                'staff_count': staff_count,
+                'managers_count': int(client['managers_count']),
+                'staff_count': int(client['staff_count']),
                 'total_revenue': float(total_revenue) if total_revenue else 0,
                 'onboard_date': client['onboard_date'].strftime('%Y-%m-%d') if client['onboard_date'] else 'N/A',
                 'org_name': client['org_name'],
@@ -2372,4 +2517,6 @@ def get_client_dashboard():
 
 if __name__ == '__main__':
     initialize_connection_pool()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    user_hierarchy.warm()
+    # Development server only; production runs wsgi:app under gunicorn
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -0,0 +1,123 @@
+import os
+from datetime import date, datetime
+
+from date_ranges import day_bounds
+
+# Moves completed cart lines into the month-partitioned cart_history table
+# (see schema_updates.sql). Only lines ordered before today are moved, so the
+# live paths and today's dashboard figures, which read cart directly, never
+# miss a row; reports over past days read the cart_reporting view. Lines are
+# moved in batches, each its own transaction, so the job never holds locks on
+# the live table for long.
+ARCHIVE_BATCH_SIZE = int(os.environ.get('CART_ARCHIVE_BATCH', 1000))
+# Monthly partitions are created this many months ahead of the current one
+PARTITION_MONTHS_AHEAD = int(os.environ.get('CART_HISTORY_MONTHS_AHEAD', 3))
+# Whole months older than this are dropped from cart_history; 0 keeps everything
+HISTORY_RETENTION_MONTHS = int(os.environ.get('CART_HISTORY_RETENTION_MONTHS', 0))
+
+COMPLETED_STATUS = {'restaurant': 6, 'billing': 2}
+
+COLUMNS = ('id', 'order_id', 'cart_id', 'item_id', 'item_name', 'item_price', 'item_qty', 'table_id',
+           'server_id', 'chef_id', 'manager_id', 'order_created_at', 'order_updated_at', 'status')
+
+# MySQL's TO_DAYS() counts from year 0, Python's toordinal() from year 1
+TO_DAYS_OFFSET = 365
+
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_completed(conn, completed_status, today, now, batch_size=ARCHIVE_BATCH_SIZE):
+    # Returns the number of lines moved
+    before = day_bounds(today)[0]
+    columns = ', '.join(COLUMNS)
+    cursor = conn.cursor()
+    moved = 0
+    while True:
+        cursor.execute("""
+            SELECT id FROM cart
+            WHERE status = %s AND order_created_at < %s
+            ORDER BY order_created_at LIMIT %s FOR UPDATE
+        """, (completed_status, before, batch_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            conn.commit()
+            break
+
+        placeholders = ','.join(['%s'] * len(ids))
+        cursor.execute(f"""
+            INSERT INTO cart_history ({columns}, archived_at)
+            SELECT {columns}, %s FROM cart WHERE id IN ({placeholders})
+        """, [now] + ids)
+        cursor.execute(f"DELETE FROM cart WHERE id IN ({placeholders})", ids)
+        conn.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+    cursor.close()
+    return moved
+
+
+def _partitions(cursor):
+    # {name: upper bound as a date, or None for MAXVALUE}
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'cart_history'
+    """)
+    partitions = {}
+    for name, description in cursor.fetchall():
+        if description == 'MAXVALUE':
+            partitions[name] = None
+        else:
+            partitions[name] = date.fromordinal(int(description) - TO_DAYS_OFFSET)
+    return partitions
+
+
+def ensure_partitions(conn, today, months_ahead=PARTITION_MONTHS_AHEAD):
+    # Splits p_future so every month up to months_ahead has its own
+    # partition. p_future is normally empty, so the split is instant.
+    cursor = conn.cursor()
+    bounds = [bound for bound in _partitions(cursor).values() if bound is not None]
+    highest = max(bounds) if bounds else None
+    created = []
+    month = _add_months(today, 0)
+    while month <= _add_months(today, months_ahead):
+        bound = _add_months(month, 1)
+        if highest is None or bound > highest:
+            name = f"p{month:%Y%m}"
+            cursor.execute(f"""
+                ALTER TABLE cart_history REORGANIZE PARTITION p_future INTO (
+                    PARTITION {name} VALUES LESS THAN (TO_DAYS('{bound.isoformat()}')),
+                    PARTITION p_future VALUES LESS THAN MAXVALUE
+                )
+            """)
+            created.append(name)
+            highest = bound
+        month = bound
+    cursor.close()
+    return created
+
+
+def drop_expired_partitions(conn, today, retention_months=HISTORY_RETENTION_MONTHS):
+    # Drops partitions whose whole range is older than retention_months
+    if not retention_months:
+        return []
+    cutoff = _add_months(today, -retention_months)
+    cursor = conn.cursor()
+    expired = sorted(name for name, bound in _partitions(cursor).items()
+                     if bound is not None and bound <= cutoff)
+    if expired:
+        cursor.execute(f"ALTER TABLE cart_history DROP PARTITION {', '.join(expired)}")
+    cursor.close()
+    return expired
+
+
+def run(conn, app_name, now=None):
+    now = now or datetime.now()
+    today = now.date()
+    created = ensure_partitions(conn, today)
+    moved = archive_completed(conn, COMPLETED_STATUS[app_name], today, now)
+    dropped = drop_expired_partitions(conn, today)
+    return {'moved': moved, 'partitions_created': created, 'partitions_dropped': dropped}
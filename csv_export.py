@@ -0,0 +1,43 @@
+import csv
+import io
+
+# Rows are pulled from an unbuffered cursor in batches and written out as they
+# arrive, so an export never holds more than one batch in memory.
+EXPORT_BATCH_SIZE = 500
+
+
+def csv_chunks(cursor, conn, header, format_row, first_batch=None, batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    exhausted = False
+    try:
+        writer.writerow(header)
+        batch = first_batch if first_batch is not None else cursor.fetchmany(batch_size)
+        while batch:
+            for row in batch:
+                writer.writerow(format_row(row))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            batch = cursor.fetchmany(batch_size)
+        exhausted = True
+    finally:
+        if exhausted:
+            cursor.close()
+            conn.close()
+        else:
+            # The client went away mid-download: reading the rest of the
+            # unbuffered result would pull the whole export, so the connection
+            # is dropped with it unread
+            _abandon(conn)
+
+
+def _abandon(conn):
+    discard = getattr(conn, 'discard', None)
+    try:
+        if discard is not None:
+            discard()
+        else:
+            conn.shutdown()
+    except Exception:
+        pass
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Runs independent dashboard panels side by side, each on its own pooled
+# connection. DASHBOARD_PANEL_WORKERS threads are shared by every request in
+# the process, so a burst of dashboard loads can hold at most that many
+# connections between them; panels beyond it queue for a free thread.
+DASHBOARD_PANEL_WORKERS = int(os.environ.get('DASHBOARD_PANEL_WORKERS', 4))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Created lazily so each forked worker process gets its own threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DASHBOARD_PANEL_WORKERS, thread_name_prefix='panel')
+        return _executor
+
+
+def _run_panel(connect, panel):
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        try:
+            return panel(cursor), (time.perf_counter() - started) * 1000
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def run(connect, panels):
+    # panels is {name: function(cursor)}; returns ({name: result},
+    # {name: milliseconds}). The timing includes the wait for a connection.
+    # The first panel to fail raises here once every panel has finished.
+    executor = _get_executor()
+    futures = {name: executor.submit(_run_panel, connect, panel) for name, panel in panels.items()}
+    data, timings = {}, {}
+    error = None
+    for name, future in futures.items():
+        try:
+            data[name], elapsed = future.result()
+            timings[name] = round(elapsed, 2)
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+    return data, timings
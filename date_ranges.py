@@ -0,0 +1,36 @@
+from datetime import date, datetime, timedelta
+
+# order_created_at holds Asia/Kolkata wall-clock time, so a calendar day in IST
+# is the half-open range [day 00:00, next day 00:00). Comparing the bare column
+# against these bounds lets MySQL use the (status, order_created_at) index,
+# which DATE(order_created_at) / YEAR() / MONTH() filters defeat.
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), '%Y-%m-%d').date()
+
+
+def day_bounds(from_date, to_date=None):
+    start = _to_date(from_date)
+    end = _to_date(to_date) if to_date else start
+    return (datetime.combine(start, datetime.min.time()),
+            datetime.combine(end + timedelta(days=1), datetime.min.time()))
+
+
+def month_bounds(year, month):
+    year, month = int(year), int(month)
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def date_range_condition(column, from_date, to_date=None, default=None):
+    # Falls back to the single day `default` when no range was requested
+    if not (from_date and to_date):
+        from_date, to_date = default, None
+    start, end = day_bounds(from_date, to_date)
+    return f"{column} >= %s AND {column} < %s", [start, end]
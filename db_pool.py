@@ -0,0 +1,237 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+# MySQL connection pool shared by the request handlers. Up to DB_POOL_SIZE
+# connections are kept open; under load up to DB_POOL_MAX_OVERFLOW more are
+# opened and closed again when returned. A caller that finds every connection
+# in use waits up to DB_POOL_TIMEOUT seconds before PoolTimeout is raised.
+# Idle connections are pinged before reuse once they have sat for
+# DB_POOL_PING_AFTER seconds and replaced after DB_POOL_RECYCLE seconds, so a
+# server-side wait_timeout never hands a dead connection to a request.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', 30))
+# A connection checked out for longer than this is logged as a likely leak
+DB_POOL_LEAK_SECONDS = float(os.environ.get('DB_POOL_LEAK_SECONDS', 30))
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    # Wraps a raw connection so close() hands it back to the pool; everything
+    # else (cursor, commit, rollback...) goes straight to the connection
+    def __init__(self, pool, raw, created_at, owner):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._owner = owner
+        self._checked_out_at = time.monotonic()
+        self._leak_reported = False
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"Connection already returned to the pool ({name})")
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(self, raw)
+
+    def discard(self):
+        # Drops the connection instead of returning it, for results that are
+        # better abandoned than read to the end (an interrupted export)
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(self, raw, reset=False)
+
+
+class ConnectionPool:
+    def __init__(self, connect, name, size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW,
+                 timeout=DB_POOL_TIMEOUT, recycle=DB_POOL_RECYCLE, ping_after=DB_POOL_PING_AFTER,
+                 leak_seconds=DB_POOL_LEAK_SECONDS):
+        # connect() opens a new raw connection; nothing is opened until the
+        # first checkout, so creating a pool never fails
+        self.connect = connect
+        self.name = name
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.leak_seconds = leak_seconds
+
+        self._idle = collections.deque()
+        self._in_use = set()
+        self._open = 0
+        self._cond = threading.Condition()
+
+        self.checked_out = 0
+        self.exhausted = 0
+        self.created = 0
+        self.recycled = 0
+        self.ping_failures = 0
+        self.leaks = 0
+        self._wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self._wait_sum = 0.0
+
+    def get_connection(self, owner=None):
+        # owner (usually the Flask endpoint) only shows up in leak reports
+        self._report_leaks()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.exhausted += 1
+                    holders = sorted(str(conn._owner) for conn in self._in_use)
+                    raise PoolTimeout(f"No connection free in {self.name} after {self.timeout}s (held by {holders})")
+                self._cond.wait(remaining)
+            self._record_wait(time.monotonic() - started)
+            self.checked_out += 1
+
+        try:
+            raw, created_at = self._validate(entry)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self.checked_out -= 1
+                self._cond.notify()
+            raise
+        conn = PooledConnection(self, raw, created_at, owner)
+        with self._cond:
+            self._in_use.add(conn)
+        return conn
+
+    def _validate(self, entry):
+        now = time.monotonic()
+        if entry is not None:
+            raw, created_at, last_used = entry
+            if now - created_at > self.recycle:
+                with self._cond:
+                    self.recycled += 1
+                self._close_quietly(raw)
+            elif now - last_used > self.ping_after:
+                try:
+                    raw.ping()
+                    return raw, created_at
+                except Exception:
+                    with self._cond:
+                        self.ping_failures += 1
+                    self._close_quietly(raw)
+            else:
+                return raw, created_at
+
+        raw = self.connect()
+        with self._cond:
+            self.created += 1
+        return raw, now
+
+    def _report_leaks(self):
+        now = time.monotonic()
+        with self._cond:
+            leaked = [conn for conn in self._in_use
+                      if not conn._leak_reported and now - conn._checked_out_at > self.leak_seconds]
+            for conn in leaked:
+                conn._leak_reported = True
+                self.leaks += 1
+        for conn in leaked:
+            logger.warning("%s: connection held by %s for %.1fs and not returned yet",
+                           self.name, conn._owner, now - conn._checked_out_at)
+
+    def _release(self, conn, raw, reset=True):
+        # Uncommitted work and unread results are discarded so the next
+        # borrower starts clean; a connection that cannot be reset, or is
+        # released with reset=False, is dropped
+        healthy = reset
+        try:
+            if reset and raw.unread_result:
+                raw.consume_results()
+            if reset and raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+
+        held = time.monotonic() - conn._checked_out_at
+        if held > self.leak_seconds and not conn._leak_reported:
+            logger.warning("%s: connection held by %s for %.1fs", self.name, conn._owner, held)
+
+        with self._cond:
+            self._in_use.discard(conn)
+            self.checked_out -= 1
+            keep = healthy and len(self._idle) < self.size
+            if keep:
+                self._idle.append((raw, conn._created_at, time.monotonic()))
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if not keep:
+            self._close_quietly(raw, abrupt=not reset)
+
+    def _close_quietly(self, raw, abrupt=False):
+        # abrupt closes the socket without the QUIT handshake, which a
+        # connection with unread results cannot complete
+        try:
+            if abrupt and hasattr(raw, 'shutdown'):
+                raw.shutdown()
+            else:
+                raw.close()
+        except Exception:
+            pass
+
+    def _record_wait(self, seconds):
+        self._wait_sum += seconds
+        for index, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self._wait_counts[index] += 1
+                return
+        self._wait_counts[-1] += 1
+
+    def stats(self):
+        with self._cond:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(WAIT_BUCKETS + ('+Inf',), self._wait_counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                'name': self.name,
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'timeout_seconds': self.timeout,
+                'open': self._open,
+                'idle': len(self._idle),
+                'checked_out': self.checked_out,
+                'overflow': max(0, self._open - self.size),
+                'exhausted': self.exhausted,
+                'created': self.created,
+                'recycled': self.recycled,
+                'ping_failures': self.ping_failures,
+                'leaks': self.leaks,
+                'leak_threshold_seconds': self.leak_seconds,
+                'wait_seconds': {
+                    'count': cumulative,
+                    'sum': round(self._wait_sum, 6),
+                    'buckets': buckets
+                }
+            }
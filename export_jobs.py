@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from csv_export import csv_chunks
+from metrics import EXPORT_BUCKETS, Histogram
+
+# Asynchronous /export/orders jobs. A local worker pool writes the CSV to
+# EXPORT_DIR and the job metadata is kept next to it as JSON, so any worker
+# process on the host can report status and serve the finished file.
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.abspath('exports'))
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+EXPORT_RETENTION_SECONDS = int(os.environ.get('EXPORT_RETENTION_SECONDS', 24 * 60 * 60))
+
+_job_id_pattern = re.compile(r'^[0-9a-f]{32,40}$')
+_executor = None
+_executor_lock = threading.Lock()
+
+# Jobs run by this process, for /metrics
+durations = {'done': Histogram(EXPORT_BUCKETS), 'failed': Histogram(EXPORT_BUCKETS)}
+finished = {'done': 0, 'failed': 0}
+_metrics_lock = threading.Lock()
+
+
+def _get_executor():
+    # Created lazily so each forked worker process gets its own threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+        return _executor
+
+
+def _meta_path(job_id):
+    return os.path.join(EXPORT_DIR, f"{job_id}.json")
+
+
+def _save(job):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp_path = f"{_meta_path(job['job_id'])}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, _meta_path(job['job_id']))
+
+
+def get_job(job_id):
+    if not _job_id_pattern.match(job_id or ''):
+        return None
+    try:
+        with open(_meta_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def file_path(job):
+    return os.path.join(EXPORT_DIR, job['file_name'])
+
+
+def finished_file(job):
+    path = file_path(job)
+    return path if job['status'] == 'done' and os.path.exists(path) else None
+
+
+def purge_expired():
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_RETENTION_SECONDS
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def submit(open_export, compress=False, key=None):
+    # open_export() runs on the worker thread and returns
+    # (cursor, conn, header, format_row, filename) with the query executed.
+    # Jobs with a key (exports of closed date ranges) are reused while their
+    # file is still on disk instead of being generated again.
+    purge_expired()
+
+    if key:
+        job_id = hashlib.sha1(f"{key}:{compress}".encode()).hexdigest()
+        existing = get_job(job_id)
+        if existing and existing['status'] in ('queued', 'running'):
+            return existing
+        if existing and finished_file(existing):
+            return existing
+    else:
+        job_id = uuid.uuid4().hex
+
+    job = {
+        'job_id': job_id,
+        'status': 'queued',
+        'compress': compress,
+        'file_name': f"{job_id}.csv.gz" if compress else f"{job_id}.csv",
+        'download_name': None,
+        'size': None,
+        'error': None,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+    }
+    _save(job)
+    _get_executor().submit(_run, job, open_export)
+    return job
+
+
+def _run(job, open_export):
+    job['status'] = 'running'
+    job['started_at'] = time.time()
+    _save(job)
+
+    tmp_path = f"{file_path(job)}.{uuid.uuid4().hex}.tmp"
+    try:
+        cursor, conn, header, format_row, filename = open_export()
+        opener = gzip.open if job['compress'] else open
+        with opener(tmp_path, 'wt', newline='') as f:
+            for chunk in csv_chunks(cursor, conn, header, format_row):
+                f.write(chunk)
+        os.replace(tmp_path, file_path(job))
+
+        job['status'] = 'done'
+        job['download_name'] = f"{filename}.gz" if job['compress'] else filename
+        job['size'] = os.path.getsize(file_path(job))
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    finally:
+        job['finished_at'] = time.time()
+        _save(job)
+        durations[job['status']].observe(job['finished_at'] - job['started_at'])
+        with _metrics_lock:
+            finished[job['status']] += 1
+
+
+def job_status(job):
+    status = {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'compressed': job['compress'],
+        'size': job['size'],
+        'error': job['error'],
+    }
+    if job['finished_at'] and job['started_at']:
+        status['duration_seconds'] = round(job['finished_at'] - job['started_at'], 3)
+    return status
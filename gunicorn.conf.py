@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+
+# gunicorn settings for wsgi:app (see wsgi.py). Every value can be overridden
+# from the environment.
+#
+# Sizing: each worker process serves up to GUNICORN_THREADS requests at once
+# and keeps its own MySQL pool. A request holds at most one connection at a
+# time (cart id blocks are reserved before it takes its own), so threads
+# connections cover the request threads; the pool defaults to threads + 1 and
+# the overflow absorbs /dashboard_insights/all panel threads. Keep
+#
+#     workers * (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW) < MySQL max_connections
+#
+# /kitchen/stream holds a thread for as long as a kitchen display is
+# connected, and its updates only reach displays attached to the worker that
+# made the change; serve it from a separate single-worker instance with enough
+# threads for the displays.
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+preload_app = True
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# Read by db_pool when the app is imported below, so set them first
+os.environ.setdefault('DB_POOL_SIZE', str(threads + 1))
+os.environ.setdefault('DB_POOL_MAX_OVERFLOW', '2')
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.init_worker()
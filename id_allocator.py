@@ -0,0 +1,66 @@
+import threading
+
+# ORD_/CRT_ ids are handed out from the id_sequences table (see schema_updates.sql).
+# Each worker reserves a block of numbers at a time so most allocations never
+# touch the database, and the sequence row is bumped atomically so two workers
+# can never receive the same number.
+DEFAULT_BLOCK_SIZE = 50
+
+
+class IdAllocator:
+    def __init__(self, name, block_size=DEFAULT_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def _reserve_block(self, get_connection, size):
+        # Runs on its own connection and commits straight away so the
+        # sequence row lock is never held for the caller's transaction.
+        # Callers reserve before taking their own connection, so a request
+        # never holds two pooled connections at once.
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE id_sequences SET next_value = LAST_INSERT_ID(next_value + %s) WHERE name = %s",
+                (size, self.name)
+            )
+            if cursor.rowcount == 0:
+                cursor.close()
+                raise RuntimeError(f"Missing id_sequences row for {self.name}")
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            end = cursor.fetchone()[0]
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        return end - size, end
+
+    def next_id(self, get_connection):
+        return self.reserve(get_connection, 1)[0]
+
+    def reserve(self, get_connection, count):
+        with self._lock:
+            numbers = []
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve_block(
+                        get_connection, max(self.block_size, count - len(numbers))
+                    )
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+        return [f"{self.name}_{number}" for number in numbers]
+
+
+def take_id(cursor, name):
+    # Takes one id inside the caller's transaction, the way the add_to_cart
+    # procedures do. LAST_INSERT_ID(expr) comes back in the UPDATE's OK packet,
+    # so this is a single round trip; the sequence row stays locked until the
+    # caller commits.
+    cursor.execute("UPDATE id_sequences SET next_value = LAST_INSERT_ID(next_value + 1) WHERE name = %s", (name,))
+    if cursor.rowcount == 0:
+        raise RuntimeError(f"Missing id_sequences row for {name}")
+    return f"{name}_{cursor.lastrowid - 1}"
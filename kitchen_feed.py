@@ -0,0 +1,76 @@
+import queue
+import threading
+
+# In-process fan-out for the kitchen display. Handlers publish the cart rows
+# they just moved, and each /kitchen/stream subscriber receives only the rows
+# for its manager/org: an 'upsert' while the line is in the kitchen (status
+# 1-3) and a 'remove' once it leaves. Subscribers in other worker processes
+# are not notified, so the stream needs a single worker (or a sticky route per
+# manager) to see every transition.
+KITCHEN_STATUSES = (1, 2, 3)
+HEARTBEAT_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def _normalize(value):
+    return None if value in (None, '') else str(value)
+
+
+class Subscription:
+    def __init__(self, manager_id=None, org_id=None):
+        self.manager_id = _normalize(manager_id)
+        self.org_id = _normalize(org_id)
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, row):
+        if self.manager_id and _normalize(row.get('manager_id')) != self.manager_id:
+            return False
+        if self.org_id and _normalize(row.get('item_org_id')) != self.org_id:
+            return False
+        return True
+
+    def get(self, timeout=HEARTBEAT_SECONDS):
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class KitchenFeed:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, manager_id=None, org_id=None):
+        subscription = Subscription(manager_id, org_id)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def publish(self, rows):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for row in rows:
+            if int(row['status']) in KITCHEN_STATUSES:
+                event = {'type': 'upsert', 'cart_id': row['cart_id'], 'item': row}
+            else:
+                event = {'type': 'remove', 'cart_id': row['cart_id'], 'status': int(row['status'])}
+            for subscription in subscribers:
+                if not subscription.matches(row):
+                    continue
+                try:
+                    subscription.events.put_nowait(event)
+                except queue.Full:
+                    # A stalled client: the stream ends and the display
+                    # reconnects, picking up a fresh snapshot
+                    subscription.overflowed = True
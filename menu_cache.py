@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Per-process cache for the menu read endpoints. Entries are keyed by
+# (endpoint, org_id, manager_id, status filter) and dropped for an org whenever
+# one of its menu items is written. Other worker processes only notice a
+# write once their copy expires, so the TTL bounds cross-process staleness.
+MENU_CACHE_TTL = int(os.environ.get('MENU_CACHE_TTL', 60))
+
+
+def _normalize(value):
+    return None if value in (None, '') else str(value)
+
+
+class MenuCache:
+    def __init__(self, ttl=MENU_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def key(self, endpoint, org_id=None, manager_id=None, status_filter=None):
+        return (endpoint, _normalize(org_id), _normalize(manager_id), _normalize(status_filter))
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] > now:
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+
+        data = loader()
+        etag = hashlib.sha1(json.dumps(data, default=str, sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            self._entries[key] = (data, etag, now + self.ttl)
+        return data, etag
+
+    def invalidate(self, org_id=None):
+        # Writes that are not scoped to an org clear every entry
+        org_id = _normalize(org_id)
+        with self._lock:
+            if org_id is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[1] in (org_id, None)]:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                'entries': len(self._entries),
+                'ttl_seconds': self.ttl
+            }
@@ -0,0 +1,179 @@
+import bisect
+import threading
+import time
+
+from flask import Response, g, request
+
+# Prometheus text exposition for /metrics, written by hand so the apps need no
+# extra dependency. Per-request work is one perf_counter() pair and a couple of
+# dict updates under a lock; everything else (pool, caches, order statuses,
+# export jobs) is read from collectors when the endpoint is scraped.
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+EXPORT_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        # ([(le, cumulative count), ...], sum, count) with '+Inf' last
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, series = 0, []
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            series.append((bound, cumulative))
+        return series, total, cumulative
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def family(name, metric_type, help_text, samples):
+    # samples: [(labels dict or None, value), ...]
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return lines
+
+
+def histogram_family(name, help_text, series):
+    # series: [(labels dict or None, Histogram.snapshot()), ...]
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, (buckets, total, count) in series:
+        labels = labels or {}
+        for bound, cumulative in buckets:
+            lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {round(total, 6)}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+    return lines
+
+
+class Metrics:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._requests = {}
+        self._latency = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def install(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def collector(self, callback):
+        # callback() returns a list of exposition lines; a failing collector
+        # is skipped so one broken source never hides the rest
+        self._collectors.append(callback)
+        return callback
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+
+    def _finish(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        key = (endpoint, request.method, response.status_code)
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                histogram = self._latency[endpoint] = Histogram(REQUEST_BUCKETS)
+        histogram.observe(seconds)
+        return response
+
+    def render(self):
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = sorted(self._latency.items())
+
+        lines = family(f"{self.prefix}_http_requests_total", 'counter', 'Requests handled, by route, method and status', [
+            ({'endpoint': endpoint, 'method': method, 'status': status}, count)
+            for (endpoint, method, status), count in requests
+        ])
+        lines += histogram_family(f"{self.prefix}_http_request_duration_seconds", 'Request latency by route', [
+            ({'endpoint': endpoint}, histogram.snapshot()) for endpoint, histogram in latency
+        ])
+        for callback in self._collectors:
+            try:
+                lines += callback()
+            except Exception:
+                continue
+        return '\n'.join(lines) + '\n'
+
+    def response(self):
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+
+def pool_lines(prefix, stats):
+    wait = stats['wait_seconds']
+    buckets = [(bound if bound == '+Inf' else float(bound), count) for bound, count in wait['buckets'].items()]
+    labels = {'pool': stats['name']}
+    lines = []
+    for key, metric_type, help_text in (
+        ('size', 'gauge', 'Connections kept open when idle'),
+        ('open', 'gauge', 'Connections currently open'),
+        ('idle', 'gauge', 'Open connections waiting in the pool'),
+        ('checked_out', 'gauge', 'Connections currently in use'),
+        ('overflow', 'gauge', 'Open connections beyond the pool size'),
+    ):
+        lines += family(f"{prefix}_db_pool_{key}", metric_type, help_text, [(labels, stats[key])])
+    for key, help_text in (
+        ('exhausted', 'Checkouts that timed out waiting for a connection'),
+        ('created', 'Connections opened'),
+        ('recycled', 'Connections replaced for age'),
+        ('ping_failures', 'Idle connections found dead on checkout'),
+        ('leaks', 'Connections held past the leak threshold'),
+    ):
+        lines += family(f"{prefix}_db_pool_{key}_total", 'counter', help_text, [(labels, stats[key])])
+    lines += histogram_family(f"{prefix}_db_pool_wait_seconds", 'Time spent waiting for a pooled connection', [
+        (labels, (buckets, wait['sum'], wait['count']))
+    ])
+    return lines
+
+
+def cache_lines(prefix, caches):
+    # caches is {cache name: stats()}; one family per figure with a sample per
+    # cache, since a family may only be declared once per exposition
+    lines = []
+    for key, name, metric_type, help_text in (
+        ('hits', 'hits_total', 'counter', 'Cache lookups answered from memory'),
+        ('misses', 'misses_total', 'counter', 'Cache lookups that went to the database'),
+        ('entries', 'entries', 'gauge', 'Entries currently cached'),
+    ):
+        lines += family(f"{prefix}_cache_{name}", metric_type, help_text, [
+            ({'cache': cache_name}, stats[key]) for cache_name, stats in sorted(caches.items())
+        ])
+    return lines
+
+
+def export_job_lines(prefix, durations, finished):
+    lines = histogram_family(f"{prefix}_export_job_duration_seconds", 'Time to write an export file', [
+        ({'status': status}, histogram.snapshot()) for status, histogram in sorted(durations.items())
+    ])
+    lines += family(f"{prefix}_export_jobs_total", 'counter', 'Export jobs finished, by outcome', [
+        ({'status': status}, count) for status, count in sorted(finished.items())
+    ])
+    return lines
@@ -0,0 +1,157 @@
+# One row per order in the orders table (see schema_updates.sql) with the
+# facts order lists need: table, staff, customer, payment mode, line and item
+# counts, totals and timestamps. Handlers that change an order's lines update
+# its header inside the same transaction from the lines that changed: an add
+# or a quantity change applies that line's deltas, a removal takes the line
+# back out, and a status transition recomputes only the status from the
+# order's lines still in cart (idx_cart_order_id), never the cart_reporting
+# view. Customer and payment details are copied in as they are saved.
+#
+# completed_* count the lines completed so far: record_completed() adds lines
+# as they are completed and later quantity changes or removals of a completed
+# line are applied to them as well, so the nightly archive can move completed
+# lines to cart_history without touching the header.
+#
+# A header's status is the furthest status any open line has reached, or
+# completed once no line is open: an order with billed lines is on the
+# biller's list even while a late dish is still in the kitchen. Completed
+# order lists take every order with completed_line_count > 0 and show only
+# its completed lines and completed_amount, so a partially completed order is
+# listed with what has been completed so far, as when the lists read cart.
+
+
+def read_lines(cursor, cart_ids):
+    # Needs a dictionary cursor; call it before the lines change or are deleted
+    if not cart_ids:
+        return []
+    placeholders = ','.join(['%s'] * len(cart_ids))
+    cursor.execute(f"""
+        SELECT cart_id, order_id, item_qty, item_price, status FROM cart WHERE cart_id IN ({placeholders})
+    """, list(cart_ids))
+    return cursor.fetchall()
+
+
+def apply_lines(cursor, changes, completed_status):
+    # changes are (cart_id, new_lines, qty_delta) for lines just inserted (1)
+    # or whose quantity changed (0); the line's status, price and staff are
+    # read from cart. The first line of a new order creates its header.
+    if not changes:
+        return
+    cursor.executemany("""
+        INSERT INTO orders (order_id, org_id, manager_id, table_id, server_id, chef_id, status,
+                            line_count, item_count, total_amount, created_at, updated_at)
+        SELECT c.order_id, m.org_id, c.manager_id, c.table_id, c.server_id, c.chef_id, c.status,
+               %s, %s, %s * COALESCE(c.item_price, 0), c.order_created_at, c.order_updated_at
+        FROM cart c
+        LEFT JOIN menu m ON c.item_id = m.item_id
+        WHERE c.cart_id = %s
+        ON DUPLICATE KEY UPDATE
+            status = IF(VALUES(status) = %s, status,
+                        IF(line_count > completed_line_count, GREATEST(status, VALUES(status)), VALUES(status))),
+            completed_line_count = completed_line_count + IF(VALUES(status) = %s, VALUES(line_count), 0),
+            completed_item_count = completed_item_count + IF(VALUES(status) = %s, VALUES(item_count), 0),
+            completed_amount = completed_amount + IF(VALUES(status) = %s, VALUES(total_amount), 0),
+            line_count = line_count + VALUES(line_count),
+            item_count = item_count + VALUES(item_count),
+            total_amount = total_amount + VALUES(total_amount),
+            updated_at = GREATEST(COALESCE(updated_at, VALUES(updated_at)), VALUES(updated_at))
+    """, [(new_lines, qty_delta, qty_delta, cart_id) + (completed_status,) * 4
+          for cart_id, new_lines, qty_delta in changes])
+
+
+def remove_lines(cursor, lines, completed_status):
+    # lines as read_lines() returned them before they were deleted
+    if not lines:
+        return
+    params = []
+    for line in lines:
+        item_qty = line['item_qty'] or 0
+        amount = item_qty * (line['item_price'] or 0)
+        completed = int(int(line['status']) == completed_status)
+        params.append((item_qty, amount, completed, completed * item_qty, completed * amount, line['order_id']))
+    cursor.executemany("""
+        UPDATE orders
+        SET line_count = line_count - 1, item_count = item_count - %s, total_amount = total_amount - %s,
+            completed_line_count = completed_line_count - %s,
+            completed_item_count = completed_item_count - %s,
+            completed_amount = completed_amount - %s
+        WHERE order_id = %s
+    """, params)
+
+    order_ids = [line['order_id'] for line in lines]
+    refresh_status(cursor, order_ids, completed_status)
+    remove_empty(cursor, order_ids, completed_status)
+
+
+def remove_empty(cursor, order_ids, completed_status):
+    # refresh_status() finds no line for an order with none left in cart, so
+    # its header is closed here, or dropped when none of its lines was ever
+    # completed
+    order_ids = sorted({order_id for order_id in order_ids if order_id})
+    if not order_ids:
+        return
+    placeholders = ','.join(['%s'] * len(order_ids))
+    cursor.execute(f"""
+        DELETE FROM orders
+        WHERE order_id IN ({placeholders}) AND completed_line_count = 0
+        AND NOT EXISTS (SELECT 1 FROM cart c WHERE c.order_id = orders.order_id)
+    """, order_ids)
+    cursor.execute(f"""
+        UPDATE orders SET status = %s
+        WHERE order_id IN ({placeholders})
+        AND NOT EXISTS (SELECT 1 FROM cart c WHERE c.order_id = orders.order_id)
+    """, [completed_status] + order_ids)
+
+
+def refresh_status(cursor, order_ids, completed_status, updated_at=None):
+    # After lines changed status or were removed: the furthest open status
+    # and the assigned chef, from the order's lines still in cart
+    order_ids = sorted({order_id for order_id in order_ids if order_id})
+    if not order_ids:
+        return
+    placeholders = ','.join(['%s'] * len(order_ids))
+    cursor.execute(f"""
+        UPDATE orders o
+        JOIN (
+            SELECT c.order_id, MAX(IF(c.status <> %s, c.status, NULL)) as open_status, MAX(c.chef_id) as chef_id
+            FROM cart c
+            WHERE c.order_id IN ({placeholders})
+            GROUP BY c.order_id
+        ) lines ON lines.order_id = o.order_id
+        SET o.status = COALESCE(lines.open_status, %s),
+            o.chef_id = COALESCE(lines.chef_id, o.chef_id),
+            o.updated_at = COALESCE(%s, o.updated_at)
+    """, [completed_status] + order_ids + [completed_status, updated_at])
+
+
+def record_completed(cursor, cart_ids, completed_at):
+    # Call from the transition to completed, before refresh_status()
+    if not cart_ids:
+        return
+    placeholders = ','.join(['%s'] * len(cart_ids))
+    cursor.execute(f"""
+        UPDATE orders o
+        JOIN (
+            SELECT c.order_id, COUNT(*) as line_count, COALESCE(SUM(c.item_qty), 0) as item_count,
+                   COALESCE(SUM(c.item_qty * c.item_price), 0) as amount
+            FROM cart c
+            WHERE c.cart_id IN ({placeholders})
+            GROUP BY c.order_id
+        ) done ON done.order_id = o.order_id
+        SET o.completed_line_count = o.completed_line_count + done.line_count,
+            o.completed_item_count = o.completed_item_count + done.item_count,
+            o.completed_amount = o.completed_amount + done.amount,
+            o.completed_at = %s
+    """, list(cart_ids) + [completed_at])
+
+
+def set_customer(cursor, order_id, customer_name, customer_phone):
+    cursor.execute("""
+        UPDATE orders SET customer_name = %s, customer_phone = %s WHERE order_id = %s
+    """, (customer_name, customer_phone, order_id))
+
+
+def set_payment(cursor, order_id, mode, billed_by):
+    cursor.execute("""
+        UPDATE orders SET payment_mode = %s, billed_by = %s WHERE order_id = %s
+    """, (mode, billed_by, order_id))
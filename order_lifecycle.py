@@ -0,0 +1,120 @@
+import logging
+
+# Central place for cart line status changes. Each app builds one
+# OrderLifecycle with its allowed edges; handlers call move() for any number of
+# lines inside their transaction and commit() instead of conn.commit().
+# Subscribers registered with on_transition() run inside the transaction (the
+# sales rollup), after_commit() subscribers run once it is durable (the kitchen
+# feed, caches).
+
+RESTAURANT_EDGES = {0: {1}, 1: {2}, 2: {3}, 3: {4}, 4: {5}, 5: {6}}
+BILLING_EDGES = {0: {1}, 1: {0, 2}}
+
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+class Transition:
+    def __init__(self, to_status, rows, updated_at):
+        self.to_status = to_status
+        self.rows = rows
+        self.updated_at = updated_at
+
+    @property
+    def cart_ids(self):
+        return [row['cart_id'] for row in self.rows]
+
+    def by_order(self):
+        orders = {}
+        for row in self.rows:
+            orders.setdefault(row['order_id'], []).append(row['cart_id'])
+        return orders
+
+    def order_dates(self):
+        # Days the moved lines were ordered on
+        return {row['order_created_at'].date() for row in self.rows if row['order_created_at']}
+
+    def __bool__(self):
+        return bool(self.rows)
+
+
+class OrderLifecycle:
+    def __init__(self, edges, clock):
+        self.edges = edges
+        self.clock = clock
+        self._in_transaction = []
+        self._after_commit = []
+
+    def on_transition(self, callback):
+        self._in_transaction.append(callback)
+        return callback
+
+    def after_commit(self, callback):
+        self._after_commit.append(callback)
+        return callback
+
+    def move(self, cursor, to_status, where=None, params=(), cart_ids=None, order_ids=None, set_columns=None):
+        # Moves every line matched by where/cart_ids/order_ids to to_status in
+        # one UPDATE. Needs a dictionary cursor. Lines already at to_status are
+        # skipped so retries are harmless; any other line without an edge to
+        # to_status raises InvalidTransition and nothing is written.
+        conditions, values = [], []
+        if where:
+            conditions.append(f"({where})")
+            values.extend(params)
+        for column, ids in (('cart_id', cart_ids), ('order_id', order_ids)):
+            if ids is not None:
+                if not ids:
+                    return Transition(to_status, [], None)
+                conditions.append(f"{column} IN ({','.join(['%s'] * len(ids))})")
+                values.extend(ids)
+        if not conditions:
+            raise ValueError("move() needs where, cart_ids or order_ids")
+
+        cursor.execute(f"""
+            SELECT cart_id, order_id, status, order_created_at FROM cart
+            WHERE {' AND '.join(conditions)} FOR UPDATE
+        """, values)
+        rows = [row for row in cursor.fetchall() if int(row['status']) != to_status]
+
+        for row in rows:
+            if to_status not in self.edges.get(int(row['status']), ()):
+                raise InvalidTransition(f"Cannot move {row['cart_id']} from status {row['status']} to {to_status}")
+
+        transition = Transition(to_status, rows, self.clock())
+        if not rows:
+            return transition
+
+        assignments = ["status = %s", "order_updated_at = %s", "order_created_at = order_created_at"]
+        assignment_values = [to_status, transition.updated_at]
+        for column, value in (set_columns or {}).items():
+            assignments.append(f"{column} = %s")
+            assignment_values.append(value)
+
+        placeholders = ','.join(['%s'] * len(rows))
+        cursor.execute(f"""
+            UPDATE cart SET {', '.join(assignments)}
+            WHERE cart_id IN ({placeholders})
+        """, assignment_values + transition.cart_ids)
+
+        for callback in self._in_transaction:
+            callback(cursor, transition)
+        return transition
+
+    def commit(self, conn, cursor, *transitions):
+        conn.commit()
+        # The transition is durable from here on: a failing subscriber is
+        # logged and the others still run, but the request does not fail
+        for transition in transitions:
+            if not transition:
+                continue
+            for callback in self._after_commit:
+                try:
+                    callback(cursor, transition)
+                except Exception:
+                    logger.exception("after_commit subscriber %s failed for a move to status %s",
+                                     callback.__name__, transition.to_status)
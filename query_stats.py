@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+
+# Per-request SQL accounting. Connections handed out during a request are
+# wrapped so every statement is timed and fetched rows are counted; when the
+# request finishes its wall time, statement count, DB time and rows are added
+# to a per-endpoint window, and requests slower than SLOW_REQUEST_MS are logged
+# as one JSON line with their statements grouped by normalized SQL.
+# Connections used by worker threads on a request's behalf (dashboard panels)
+# are instrumented with that request's stats explicitly, since the threads
+# have no request context of their own.
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+STATS_WINDOW = int(os.environ.get('QUERY_STATS_WINDOW', 1000))
+SLOW_LOG_QUERIES = 10
+
+logger = logging.getLogger(__name__)
+
+_in_list = re.compile(r"IN\s*\(\s*%s(?:\s*,\s*%s)*\s*\)", re.IGNORECASE)
+_values_list = re.compile(r"(VALUES\s*\([^)]*\))(?:\s*,\s*\([^)]*\))+", re.IGNORECASE)
+_string_literal = re.compile(r"'(?:[^'\\]|\\.)*'")
+_number_literal = re.compile(r"\b\d+(?:\.\d+)?\b")
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _whitespace.sub(' ', sql).strip()
+    sql = _in_list.sub('IN (...)', sql)
+    sql = _values_list.sub(r'\1, ...', sql)
+    sql = _string_literal.sub('?', sql)
+    return _number_literal.sub('?', sql)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.queries = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds):
+        sql = normalize_sql(sql)
+        with self._lock:
+            self.statements += 1
+            self.db_seconds += seconds
+            entry = self.queries.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_rows(self, rows):
+        with self._lock:
+            self.rows += rows
+
+
+def _current():
+    return g.get('query_stats') if has_request_context() else None
+
+
+class TimedCursor:
+    def __init__(self, cursor, stats=None):
+        self._cursor = cursor
+        self._request_stats = stats
+
+    def _stats(self):
+        return self._request_stats if self._request_stats is not None else _current()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _timed(self, method, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        finally:
+            stats = self._stats()
+            if stats is not None:
+                stats.record(operation, time.perf_counter() - started)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.executemany, operation, *args, **kwargs)
+
+    def callproc(self, procname, *args, **kwargs):
+        return self._timed(self._cursor.callproc, procname, *args, **kwargs)
+
+    def _count(self, rows):
+        stats = self._stats()
+        if stats is not None:
+            stats.add_rows(rows)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count(len(rows))
+        return rows
+
+
+class TimedConnection:
+    def __init__(self, conn, stats=None):
+        self._conn = conn
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._stats)
+
+    def close(self):
+        self._conn.close()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class QueryStats:
+    def __init__(self, window=STATS_WINDOW, slow_ms=SLOW_REQUEST_MS):
+        self.window = window
+        self.slow_ms = slow_ms
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def install(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def instrument(self, conn, stats=None):
+        # stats defaults to the current request's when statements run
+        return TimedConnection(conn, stats)
+
+    def current(self):
+        # The current request's stats, to hand to instrument() from threads
+        # working on its behalf
+        return _current()
+
+    def _start(self):
+        g.query_stats = RequestStats()
+
+    def _finish(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        wall_ms = (time.perf_counter() - stats.started) * 1000
+        db_ms = stats.db_seconds * 1000
+        endpoint = request.endpoint or 'unmatched'
+
+        with self._lock:
+            samples = self._endpoints.get(endpoint)
+            if samples is None:
+                samples = self._endpoints[endpoint] = deque(maxlen=self.window)
+            samples.append((wall_ms, stats.statements, db_ms, stats.rows, response.status_code >= 500))
+
+        if wall_ms >= self.slow_ms:
+            queries = sorted(stats.queries.items(), key=lambda item: item[1][1], reverse=True)
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'endpoint': endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'wall_ms': round(wall_ms, 1),
+                'sql_count': stats.statements,
+                'db_ms': round(db_ms, 1),
+                'rows': stats.rows,
+                'queries': [
+                    {'sql': sql, 'count': count, 'ms': round(seconds * 1000, 1)}
+                    for sql, (count, seconds) in queries[:SLOW_LOG_QUERIES]
+                ]
+            }))
+        return response
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {name: list(samples) for name, samples in self._endpoints.items()}
+
+        report = {}
+        for name, samples in endpoints.items():
+            walls = sorted(sample[0] for sample in samples)
+            count = len(samples)
+            report[name] = {
+                'requests': count,
+                'errors': sum(1 for sample in samples if sample[4]),
+                'wall_ms_p50': round(_percentile(walls, 0.50), 1),
+                'wall_ms_p95': round(_percentile(walls, 0.95), 1),
+                'wall_ms_p99': round(_percentile(walls, 0.99), 1),
+                'wall_ms_max': round(walls[-1], 1),
+                'avg_sql_count': round(sum(sample[1] for sample in samples) / count, 2),
+                'avg_db_ms': round(sum(sample[2] for sample in samples) / count, 1),
+                'avg_rows': round(sum(sample[3] for sample in samples) / count, 1),
+            }
+        return report
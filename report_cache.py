@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from date_ranges import _to_date
+
+# Per-process cache for report responses (dashboards, completed orders,
+# popular categories), keyed by endpoint and query string, so by org,
+# manager/server filter, date range and page. A range that ends before
+# yesterday is closed: its orders are done, so the response is kept until
+# evicted. A range reaching yesterday or today is live: it is dropped as soon
+# as this process commits a status change the report watches on a line
+# ordered inside the range, and after REPORT_CACHE_LIVE_TTL seconds so changes
+# committed by other worker processes show up too. Requests for an entry that
+# is being computed wait for that computation instead of repeating it.
+REPORT_CACHE_LIVE_TTL = float(os.environ.get('REPORT_CACHE_LIVE_TTL', 30))
+REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', 2000))
+
+
+class _Load:
+    # A computation other requests for the same key can wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ReportCache:
+    def __init__(self, live_ttl=REPORT_CACHE_LIVE_TTL, max_entries=REPORT_CACHE_MAX_ENTRIES):
+        self.live_ttl = live_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def key(self, endpoint, args):
+        return (endpoint, tuple(sorted((name, value) for name, value in args.items(multi=True))))
+
+    def date_range(self, from_date, to_date, today):
+        # The (first, last) days a report covers; reports default to today
+        if from_date and to_date:
+            return _to_date(from_date), _to_date(to_date)
+        return today, today
+
+    def get_or_load(self, key, days, today, statuses, loader, cacheable=lambda result: True):
+        # days is the report's (first, last) day or None when it is not
+        # limited to a date range; statuses are the status changes that
+        # invalidate it (None for any)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (entry['expires'] is None or entry['expires'] > now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['result']
+
+            load = self._loading.get(key)
+            if load is None:
+                load = self._loading[key] = _Load()
+                generation = self._generation
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if not leader:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.result
+
+        try:
+            load.result = loader()
+        except Exception as e:
+            load.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._loading.get(key) is load:
+                    del self._loading[key]
+                # Skipped if an invalidation ran while this was computed
+                if load.error is None and generation == self._generation and cacheable(load.result):
+                    closed = days is not None and days[1] < today - timedelta(days=1)
+                    self._entries[key] = {
+                        'result': load.result,
+                        'days': days,
+                        'statuses': statuses,
+                        'expires': None if closed else now + self.live_ttl
+                    }
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            load.done.set()
+        return load.result
+
+    def invalidate(self, status=None, order_dates=None):
+        # Drops the entries watching status whose range covers one of
+        # order_dates; without arguments every entry goes
+        with self._lock:
+            self._generation += 1
+            # Later requests start a fresh computation
+            self._loading.clear()
+            for key, entry in list(self._entries.items()):
+                if status is not None and entry['statuses'] is not None and status not in entry['statuses']:
+                    continue
+                days = entry['days']
+                if order_dates is not None and days is not None:
+                    if not any(days[0] <= day <= days[1] for day in order_dates):
+                        continue
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                'entries': len(self._entries),
+                'live_ttl_seconds': self.live_ttl
+            }
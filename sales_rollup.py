@@ -0,0 +1,291 @@
+from datetime import datetime, timedelta
+
+from date_ranges import day_bounds
+
+# Completed (status 6) cart lines are folded into sales_rollup when
+# complete_order closes an order. Dashboards read closed days from the rollup
+# and only aggregate raw cart rows for today, which is still taking orders.
+# Distinct orders cannot be summed across rollup buckets (an order spans
+# several items, hours, servers and chefs), so complete_order also writes one
+# sales_rollup_orders row per order and (hour, table, server, chef) it touched,
+# and every order count is a COUNT(DISTINCT order_id) over that table for the
+# whole range, today included, at the grain of the dashboard's filter. A
+# payment mode can be saved after the order completes, so it is not frozen
+# into either table: payment revenue joins those rows to the order header.
+
+
+def record_completed_lines(cursor, order_id, cart_ids):
+    # Expects a dictionary cursor inside the transaction that completed the lines
+    if not cart_ids:
+        return
+
+    placeholders = ','.join(['%s'] * len(cart_ids))
+
+    cursor.execute(f"""
+        SELECT m.org_id, c.order_created_at, c.item_id, c.table_id, c.server_id, c.chef_id,
+               c.item_name, c.item_qty, c.item_price
+        FROM cart c
+        LEFT JOIN menu m ON c.item_id = m.item_id
+        WHERE c.cart_id IN ({placeholders})
+    """, list(cart_ids))
+    lines = cursor.fetchall()
+
+    buckets = {}
+    item_names = {}
+    order_rows = {}
+    for line in lines:
+        created_at = line['order_created_at']
+        grain = (created_at.date(), created_at.hour, line['table_id'] or 0,
+                 line['server_id'] or 0, line['chef_id'] or 0)
+        key = (line['org_id'] or 0, created_at.date(), created_at.hour, line['item_id'],
+               line['table_id'] or 0, line['server_id'] or 0, line['chef_id'] or 0)
+        item_qty = line['item_qty'] or 0
+        revenue = item_qty * (line['item_price'] or 0)
+        bucket = buckets.setdefault(key, [0, 0, 0])
+        bucket[0] += item_qty
+        bucket[1] += 1
+        bucket[2] += revenue
+        item_names[key] = line['item_name']
+        order_key = (order_id, line['org_id'] or 0) + grain
+        order_rows[order_key] = order_rows.get(order_key, 0) + revenue
+
+    if not buckets:
+        return
+
+    cursor.executemany("""
+        INSERT INTO sales_rollup (org_id, sale_date, sale_hour, item_id, table_id, server_id, chef_id,
+                                  item_qty, line_count, revenue, item_name)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE item_qty = item_qty + VALUES(item_qty),
+                                line_count = line_count + VALUES(line_count),
+                                revenue = revenue + VALUES(revenue),
+                                item_name = COALESCE(VALUES(item_name), item_name)
+    """, [key + tuple(values) + (item_names[key],) for key, values in buckets.items()])
+
+    # An order completed in two billing rounds adds to the same rows
+    cursor.executemany("""
+        INSERT INTO sales_rollup_orders (order_id, org_id, sale_date, sale_hour, table_id, server_id, chef_id, revenue)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE revenue = revenue + VALUES(revenue)
+    """, [key + (revenue,) for key, revenue in sorted(order_rows.items())])
+
+
+def _days(from_date, to_date, today):
+    # Dashboards default to today
+    if from_date and to_date:
+        return (datetime.strptime(str(from_date), '%Y-%m-%d').date(),
+                datetime.strptime(str(to_date), '%Y-%m-%d').date())
+    return today, today
+
+
+def split_range(from_date, to_date, today):
+    # Returns the closed-day range served by the rollup (or None) and whether
+    # today's raw rows need to be aggregated as well.
+    start, end = _days(from_date, to_date, today)
+    rollup_end = min(end, today - timedelta(days=1))
+    rollup_range = (start, rollup_end) if start <= rollup_end else None
+    include_today = start <= today <= end
+    return rollup_range, include_today
+
+
+def _staff_filter(alias, server_id, staff_ids):
+    # staff_ids is a manager's staff (see user_hierarchy); None means no filter
+    if server_id:
+        return f" AND ({alias}.server_id = %s OR {alias}.chef_id = %s)", [server_id, server_id]
+    if staff_ids is not None:
+        if not staff_ids:
+            return " AND 1 = 0", []
+        return f" AND {alias}.server_id IN ({','.join(['%s'] * len(staff_ids))})", list(staff_ids)
+    return "", []
+
+
+def _collect(cursor, rollup_query, raw_query, from_date, to_date, today, server_id, staff_ids):
+    rollup_range, include_today = split_range(from_date, to_date, today)
+    results = []
+
+    if rollup_range:
+        filter_condition, filter_params = _staff_filter('r', server_id, staff_ids)
+        cursor.execute(rollup_query.format(filter=filter_condition),
+                       [rollup_range[0], rollup_range[1]] + filter_params)
+        results.append(cursor.fetchall())
+
+    if include_today:
+        filter_condition, filter_params = _staff_filter('c', server_id, staff_ids)
+        cursor.execute(raw_query.format(filter=filter_condition), list(day_bounds(today)) + filter_params)
+        results.append(cursor.fetchall())
+
+    return results
+
+
+def _order_counts(cursor, column, from_date, to_date, today, server_id, staff_ids):
+    # {value of column: distinct completed orders}, or {None: total} without
+    # a column. Read for the whole range so an order spanning midnight is
+    # counted once.
+    start, end = _days(from_date, to_date, today)
+    filter_condition, filter_params = _staff_filter('o', server_id, staff_ids)
+    select = f"o.{column} as value, " if column else "NULL as value, "
+    group = f" GROUP BY o.{column}" if column else ""
+    cursor.execute(f"""
+        SELECT {select}COUNT(DISTINCT o.order_id) as orders
+        FROM sales_rollup_orders o
+        WHERE o.sale_date BETWEEN %s AND %s{filter_condition}{group}
+    """, [start, end] + filter_params)
+    return {row['value']: row['orders'] for row in cursor.fetchall()}
+
+
+def _merge(results, key, sum_fields):
+    merged = {}
+    for rows in results:
+        for row in rows:
+            row_key = row[key]
+            if row_key not in merged:
+                merged[row_key] = dict(row)
+                continue
+            for field in sum_fields:
+                merged[row_key][field] = (merged[row_key][field] or 0) + (row[field] or 0)
+    return list(merged.values())
+
+
+def overview(cursor, from_date, to_date, today, server_id=None, staff_ids=None):
+    results = _collect(cursor, """
+        SELECT COALESCE(SUM(r.line_count), 0) as total_items,
+               COALESCE(SUM(r.revenue), 0) as total_revenue
+        FROM sales_rollup r
+        WHERE r.sale_date BETWEEN %s AND %s{filter}
+    """, """
+        SELECT COUNT(*) as total_items,
+               COALESCE(SUM(c.item_qty * c.item_price), 0) as total_revenue
+        FROM cart c
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6{filter}
+    """, from_date, to_date, today, server_id, staff_ids)
+
+    totals = {'total_items': 0, 'total_revenue': 0}
+    for rows in results:
+        for row in rows:
+            for field in totals:
+                totals[field] += row[field] or 0
+    orders = _order_counts(cursor, None, from_date, to_date, today, server_id, staff_ids)
+    totals['total_orders'] = orders.get(None, 0)
+    return totals
+
+
+def popular_items(cursor, from_date, to_date, today, server_id=None, staff_ids=None):
+    results = _collect(cursor, """
+        SELECT r.item_id, MAX(r.item_name) as item_name, SUM(r.item_qty) as total_quantity,
+               SUM(r.line_count) as order_count,
+               SUM(r.revenue) as revenue
+        FROM sales_rollup r
+        WHERE r.sale_date BETWEEN %s AND %s{filter}
+        GROUP BY r.item_id
+    """, """
+        SELECT c.item_id, MAX(c.item_name) as item_name, SUM(c.item_qty) as total_quantity,
+               COUNT(*) as order_count,
+               SUM(c.item_qty * c.item_price) as revenue
+        FROM cart c
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6{filter}
+        GROUP BY c.item_id
+    """, from_date, to_date, today, server_id, staff_ids)
+
+    items = _merge(results, 'item_id', ('total_quantity', 'order_count', 'revenue'))
+    items.sort(key=lambda item: item['total_quantity'] or 0, reverse=True)
+    return [{key: value for key, value in item.items() if key != 'item_id'} for item in items[:10]]
+
+
+def hourly_orders(cursor, from_date, to_date, today, server_id=None, staff_ids=None):
+    results = _collect(cursor, """
+        SELECT r.sale_hour as hour,
+               SUM(r.line_count) as items,
+               SUM(r.revenue) as revenue
+        FROM sales_rollup r
+        WHERE r.sale_date BETWEEN %s AND %s{filter}
+        GROUP BY r.sale_hour
+    """, """
+        SELECT HOUR(c.order_created_at) as hour,
+               COUNT(*) as items,
+               SUM(c.item_qty * c.item_price) as revenue
+        FROM cart c
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6{filter}
+        GROUP BY HOUR(c.order_created_at)
+    """, from_date, to_date, today, server_id, staff_ids)
+
+    hours = _merge(results, 'hour', ('items', 'revenue'))
+    orders = _order_counts(cursor, 'sale_hour', from_date, to_date, today, server_id, staff_ids)
+    for row in hours:
+        row['orders'] = orders.get(row['hour'], 0)
+    hours.sort(key=lambda row: row['hour'])
+    return hours
+
+
+def table_performance(cursor, from_date, to_date, today, server_id=None, staff_ids=None):
+    results = _collect(cursor, """
+        SELECT NULLIF(r.table_id, 0) as table_id,
+               SUM(r.line_count) as total_items,
+               SUM(r.revenue) as revenue
+        FROM sales_rollup r
+        WHERE r.sale_date BETWEEN %s AND %s{filter}
+        GROUP BY r.table_id
+    """, """
+        SELECT c.table_id,
+               COUNT(*) as total_items,
+               SUM(c.item_qty * c.item_price) as revenue
+        FROM cart c
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6{filter}
+        GROUP BY c.table_id
+    """, from_date, to_date, today, server_id, staff_ids)
+
+    tables = _merge(results, 'table_id', ('total_items', 'revenue'))
+    orders = _order_counts(cursor, 'table_id', from_date, to_date, today, server_id, staff_ids)
+    for table in tables:
+        table['total_orders'] = orders.get(table['table_id'] or 0, 0)
+        # Same figure as AVG(line revenue) over the table's lines
+        table['avg_order_value'] = (table['revenue'] or 0) / table['total_items'] if table['total_items'] else 0
+    tables.sort(key=lambda row: row['revenue'] or 0, reverse=True)
+    return tables
+
+
+def server_performance(cursor, from_date, to_date, today, server_id=None, staff_ids=None):
+    results = _collect(cursor, """
+        SELECT u.name as server_name, NULLIF(r.server_id, 0) as server_id,
+               SUM(r.line_count) as total_items,
+               SUM(r.revenue) as revenue
+        FROM sales_rollup r
+        LEFT JOIN users u ON r.server_id = u.user_uid
+        WHERE r.sale_date BETWEEN %s AND %s{filter}
+        GROUP BY r.server_id, u.name
+    """, """
+        SELECT u.name as server_name, c.server_id,
+               COUNT(*) as total_items,
+               SUM(c.item_qty * c.item_price) as revenue
+        FROM cart c
+        LEFT JOIN users u ON c.server_id = u.user_uid
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6{filter}
+        GROUP BY c.server_id, u.name
+    """, from_date, to_date, today, server_id, staff_ids)
+
+    servers = _merge(results, 'server_id', ('total_items', 'revenue'))
+    orders = _order_counts(cursor, 'server_id', from_date, to_date, today, server_id, staff_ids)
+    for server in servers:
+        server['total_orders'] = orders.get(server['server_id'] or 0, 0)
+    servers.sort(key=lambda row: row['revenue'] or 0, reverse=True)
+    return servers
+
+
+def payment_mode_revenue(cursor, from_date, to_date, today, server_id=None, staff_ids=None):
+    # Whole range from sales_rollup_orders, by the mode on the order header
+    start, end = _days(from_date, to_date, today)
+    filter_condition, filter_params = _staff_filter('o', server_id, staff_ids)
+    cursor.execute(f"""
+        SELECT h.payment_mode, SUM(o.revenue) as revenue
+        FROM sales_rollup_orders o
+        JOIN orders h ON h.order_id = o.order_id
+        WHERE o.sale_date BETWEEN %s AND %s AND h.payment_mode <> ''{filter_condition}
+        GROUP BY h.payment_mode
+    """, [start, end] + filter_params)
+
+    modes = cursor.fetchall()
+    modes.sort(key=lambda row: row['revenue'] or 0, reverse=True)
+    return modes
+
+
+def completed_order_count(cursor, from_date, to_date, today, server_id=None, staff_ids=None):
+    return _order_counts(cursor, None, from_date, to_date, today, server_id, staff_ids).get(None, 0)
@@ -23,4 +23,487 @@ INSERT IGNORE INTO `user_role` (`role_id`, `description`) VALUES
 
 -- Sample data for testing (optional)
 -- INSERT INTO `users` (`name`, `phone`, `password`, `area`, `pincode`, `user_uid`, `parent_uid`, `role`, `org`, `status`, `no_of_users`) VALUES
--- ('Super Admin', '9999999999', 'admin123', 'Admin Area', '000000', 1, 0, 1, 1, 'active', 100);
\ No newline at end of file
+-- ('Super Admin', '9999999999', 'admin123', 'Admin Area', '000000', 1, 0, 1, 1, 'active', 100);
+
+-- Id sequences for ORD_/CRT_ ids handed out by id_allocator.py
+CREATE TABLE IF NOT EXISTS `id_sequences` (
+  `name` varchar(20) PRIMARY KEY,
+  `next_value` bigint NOT NULL
+);
+
+-- Seed each sequence past the highest id already in use
+INSERT IGNORE INTO `id_sequences` (`name`, `next_value`)
+SELECT 'ORD', COALESCE(MAX(CAST(SUBSTRING(`order_id`, 5) AS UNSIGNED)), 0) + 1
+FROM `cart` WHERE `order_id` LIKE 'ORD\_%';
+
+INSERT IGNORE INTO `id_sequences` (`name`, `next_value`)
+SELECT 'CRT', COALESCE(MAX(CAST(SUBSTRING(`cart_id`, 5) AS UNSIGNED)), 0) + 1
+FROM `cart` WHERE `cart_id` LIKE 'CRT\_%';
+
+
+-- Daily sales rollup maintained by complete_order (see sales_rollup.py)
+CREATE TABLE IF NOT EXISTS `sales_rollup` (
+  `org_id` int(11) NOT NULL DEFAULT 0,
+  `sale_date` date NOT NULL,
+  `sale_hour` tinyint NOT NULL,
+  `item_id` char(10) NOT NULL,
+  `table_id` int(11) NOT NULL DEFAULT 0,
+  `server_id` int(11) NOT NULL DEFAULT 0,
+  `chef_id` int(11) NOT NULL DEFAULT 0,
+  `item_qty` int(11) NOT NULL DEFAULT 0,
+  `line_count` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`sale_date`, `org_id`, `sale_hour`, `item_id`, `table_id`, `server_id`, `chef_id`),
+  KEY `idx_sales_rollup_server` (`server_id`, `sale_date`),
+  KEY `idx_sales_rollup_chef` (`chef_id`, `sale_date`)
+);
+
+-- One-time backfill of orders completed before the rollup existed.
+-- Run once, before deploying the code that writes to sales_rollup.
+INSERT INTO `sales_rollup` (`org_id`, `sale_date`, `sale_hour`, `item_id`, `table_id`, `server_id`, `chef_id`,
+                            `item_qty`, `line_count`, `revenue`)
+SELECT `org_id`, `sale_date`, `sale_hour`, `item_id`, `table_id`, `server_id`, `chef_id`,
+       SUM(`item_qty`), COUNT(*), SUM(`line_revenue`)
+FROM (
+  SELECT COALESCE(m.org_id, 0) AS `org_id`,
+         DATE(c.order_created_at) AS `sale_date`,
+         HOUR(c.order_created_at) AS `sale_hour`,
+         c.item_id,
+         COALESCE(c.table_id, 0) AS `table_id`,
+         COALESCE(c.server_id, 0) AS `server_id`,
+         COALESCE(c.chef_id, 0) AS `chef_id`,
+         c.item_qty,
+         c.item_qty * m.item_price AS `line_revenue`
+  FROM cart c
+  JOIN menu m ON c.item_id = m.item_id
+  WHERE c.status = 6
+) completed_lines
+GROUP BY `org_id`, `sale_date`, `sale_hour`, `item_id`, `table_id`, `server_id`, `chef_id`;
+
+-- Completed orders at the grain dashboards filter and group them by, so order
+-- counts are COUNT(DISTINCT order_id) here rather than sums of rollup buckets.
+-- revenue is the order's completed revenue in that row; the payment panel
+-- sums it by the payment mode on the order header (orders, below), since a
+-- mode saved after completion must still move the revenue
+CREATE TABLE IF NOT EXISTS `sales_rollup_orders` (
+  `order_id` varchar(20) NOT NULL,
+  `org_id` int(11) NOT NULL DEFAULT 0,
+  `sale_date` date NOT NULL,
+  `sale_hour` tinyint NOT NULL,
+  `table_id` int(11) NOT NULL DEFAULT 0,
+  `server_id` int(11) NOT NULL DEFAULT 0,
+  `chef_id` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`order_id`, `sale_date`, `sale_hour`, `table_id`, `server_id`, `chef_id`),
+  KEY `idx_sales_rollup_orders_date` (`sale_date`),
+  KEY `idx_sales_rollup_orders_server` (`server_id`, `sale_date`),
+  KEY `idx_sales_rollup_orders_chef` (`chef_id`, `sale_date`)
+);
+
+-- One-time backfill, run together with the sales_rollup one
+INSERT IGNORE INTO `sales_rollup_orders` (`order_id`, `org_id`, `sale_date`, `sale_hour`, `table_id`, `server_id`,
+                                          `chef_id`, `revenue`)
+SELECT c.order_id, COALESCE(MAX(m.org_id), 0), DATE(c.order_created_at), HOUR(c.order_created_at),
+       COALESCE(c.table_id, 0), COALESCE(c.server_id, 0), COALESCE(c.chef_id, 0),
+       COALESCE(SUM(c.item_qty * m.item_price), 0)
+FROM cart c
+LEFT JOIN menu m ON c.item_id = m.item_id
+WHERE c.status = 6
+GROUP BY c.order_id, DATE(c.order_created_at), HOUR(c.order_created_at),
+         COALESCE(c.table_id, 0), COALESCE(c.server_id, 0), COALESCE(c.chef_id, 0);
+
+
+-- Secondary indexes for the cart access paths used by both apps.
+-- status is compared numerically everywhere (status = 6, status IN (1, 2, 3)),
+-- so it must be an integer column for the (status, ...) indexes to be usable.
+ALTER TABLE `cart` MODIFY `status` tinyint NOT NULL DEFAULT 0;
+
+ALTER TABLE `cart`
+  ADD INDEX `idx_cart_status_created` (`status`, `order_created_at`),
+  ADD INDEX `idx_cart_table_server_status` (`table_id`, `server_id`, `status`),
+  ADD INDEX `idx_cart_manager_status` (`manager_id`, `status`),
+  ADD INDEX `idx_cart_order_id` (`order_id`),
+  ADD INDEX `idx_cart_cart_id` (`cart_id`),
+  ADD INDEX `idx_cart_server_created` (`server_id`, `order_created_at`),
+  ADD INDEX `idx_cart_chef_created` (`chef_id`, `order_created_at`);
+
+ALTER TABLE `payment_mode` ADD INDEX `idx_payment_mode_order_id` (`order_id`);
+ALTER TABLE `customer_info` ADD INDEX `idx_customer_info_order_id` (`order_id`);
+
+
+-- One open (status 0) line per item: per table and server in the restaurant
+-- app, per manager in the billing app (table_id is NULL there). Lines outside
+-- the cart get a NULL key, which the unique index ignores.
+-- Merge existing duplicate open lines first so the unique key can be built.
+CREATE TEMPORARY TABLE `open_line_merge` AS
+SELECT IF(`table_id` IS NULL, CONCAT('M', `manager_id`, ':', `item_id`),
+          CONCAT('T', `table_id`, ':', `server_id`, ':', `item_id`)) AS `line_key`,
+       MIN(`id`) AS `keep_id`, SUM(`item_qty`) AS `total_qty`
+FROM `cart` WHERE `status` = 0
+GROUP BY `line_key` HAVING COUNT(*) > 1;
+
+UPDATE `cart` c JOIN `open_line_merge` m ON c.`id` = m.`keep_id`
+SET c.`item_qty` = m.`total_qty`, c.`order_created_at` = c.`order_created_at`;
+
+DELETE c FROM `cart` c
+JOIN `open_line_merge` m
+  ON m.`line_key` = IF(c.`table_id` IS NULL, CONCAT('M', c.`manager_id`, ':', c.`item_id`),
+                       CONCAT('T', c.`table_id`, ':', c.`server_id`, ':', c.`item_id`))
+WHERE c.`status` = 0 AND c.`id` <> m.`keep_id`;
+
+DROP TEMPORARY TABLE `open_line_merge`;
+
+ALTER TABLE `cart`
+  ADD COLUMN `open_line_key` varchar(64) GENERATED ALWAYS AS (
+    IF(`status` = 0,
+       IF(`table_id` IS NULL, CONCAT('M', `manager_id`, ':', `item_id`),
+          CONCAT('T', `table_id`, ':', `server_id`, ':', `item_id`)),
+       NULL)
+  ) STORED,
+  ADD UNIQUE KEY `uq_cart_open_line` (`open_line_key`);
+
+-- add_to_cart in one round trip. The caller passes a cart_id from its
+-- IdAllocator block; a new ORD_ id is only taken from id_sequences when the
+-- table (or manager) has no open order. A tap on an item already in the cart
+-- adds to that line's quantity and the passed cart_id goes unused.
+-- Returns one row: cart_id, order_id, inserted (0 when an existing line grew).
+DROP PROCEDURE IF EXISTS `restaurant_add_to_cart`;
+DROP PROCEDURE IF EXISTS `billing_add_to_cart`;
+
+DELIMITER //
+
+CREATE PROCEDURE `restaurant_add_to_cart`(
+  IN p_item_id varchar(20), IN p_item_qty int, IN p_table_id int, IN p_server_id int,
+  IN p_chef_id int, IN p_manager_id int, IN p_status tinyint, IN p_cart_id varchar(20), IN p_now datetime
+)
+BEGIN
+  DECLARE v_order_id varchar(20) DEFAULT NULL;
+  DECLARE v_rows int;
+
+  SELECT `order_id` INTO v_order_id FROM `cart`
+  WHERE `table_id` = p_table_id AND `server_id` = p_server_id AND `status` < 5
+  ORDER BY `order_created_at` DESC LIMIT 1;
+
+  IF v_order_id IS NULL THEN
+    UPDATE `id_sequences` SET `next_value` = LAST_INSERT_ID(`next_value` + 1) WHERE `name` = 'ORD';
+    SET v_order_id = CONCAT('ORD_', LAST_INSERT_ID() - 1);
+  END IF;
+
+  INSERT INTO `cart` (`order_id`, `cart_id`, `item_id`, `item_qty`, `table_id`, `server_id`, `chef_id`,
+                      `manager_id`, `order_created_at`, `order_updated_at`, `status`)
+  VALUES (v_order_id, p_cart_id, p_item_id, p_item_qty, p_table_id, p_server_id, p_chef_id,
+          p_manager_id, p_now, p_now, p_status)
+  ON DUPLICATE KEY UPDATE `item_qty` = `item_qty` + VALUES(`item_qty`),
+                          `order_updated_at` = VALUES(`order_updated_at`),
+                          `order_created_at` = `order_created_at`;
+  SET v_rows = ROW_COUNT();
+
+  IF v_rows = 1 THEN
+    SELECT p_cart_id AS `cart_id`, v_order_id AS `order_id`, 1 AS `inserted`;
+  ELSE
+    SELECT `cart_id`, `order_id`, 0 AS `inserted` FROM `cart`
+    WHERE `open_line_key` = CONCAT('T', p_table_id, ':', p_server_id, ':', p_item_id);
+  END IF;
+END //
+
+CREATE PROCEDURE `billing_add_to_cart`(
+  IN p_item_id varchar(20), IN p_item_qty int, IN p_manager_id int, IN p_cart_id varchar(20), IN p_now datetime
+)
+BEGIN
+  DECLARE v_order_id varchar(20) DEFAULT NULL;
+  DECLARE v_rows int;
+
+  SELECT `order_id` INTO v_order_id FROM `cart`
+  WHERE `manager_id` = p_manager_id AND `status` = 0
+  LIMIT 1;
+
+  IF v_order_id IS NULL THEN
+    UPDATE `id_sequences` SET `next_value` = LAST_INSERT_ID(`next_value` + 1) WHERE `name` = 'ORD';
+    SET v_order_id = CONCAT('ORD_', LAST_INSERT_ID() - 1);
+  END IF;
+
+  INSERT INTO `cart` (`order_id`, `cart_id`, `item_id`, `item_qty`, `order_created_at`, `order_updated_at`,
+                      `manager_id`, `status`)
+  VALUES (v_order_id, p_cart_id, p_item_id, p_item_qty, p_now, p_now, p_manager_id, 0)
+  ON DUPLICATE KEY UPDATE `item_qty` = `item_qty` + VALUES(`item_qty`),
+                          `order_updated_at` = VALUES(`order_updated_at`),
+                          `order_created_at` = `order_created_at`;
+  SET v_rows = ROW_COUNT();
+
+  IF v_rows = 1 THEN
+    SELECT p_cart_id AS `cart_id`, v_order_id AS `order_id`, 1 AS `inserted`;
+  ELSE
+    SELECT `cart_id`, `order_id`, 0 AS `inserted` FROM `cart`
+    WHERE `open_line_key` = CONCAT('M', p_manager_id, ':', p_item_id);
+  END IF;
+END //
+
+DELIMITER ;
+
+
+-- Completed cart lines (status 6 in the restaurant app, 2 in the billing app)
+-- are moved here by scripts/archive_cart.py once their day is over, so the
+-- live cart table only holds open orders and today's completed ones.
+-- Partitioned by month of order_created_at: reports over a date range only
+-- read the months they cover, and old months can be dropped whole. MySQL
+-- only partitions on TO_DAYS() of a DATETIME, so the timestamps are
+-- DATETIME here, and every unique key has to include order_created_at.
+-- The archive job adds next months' partitions ahead of time by splitting
+-- p_future.
+CREATE TABLE IF NOT EXISTS `cart_history` (
+  `id` int(11) NOT NULL,
+  `order_id` varchar(20),
+  `cart_id` varchar(20),
+  `item_id` char(10),
+  `item_qty` int(11),
+  `table_id` int(11),
+  `server_id` int(11),
+  `chef_id` int(11),
+  `manager_id` int(11),
+  `order_created_at` datetime NOT NULL,
+  `order_updated_at` datetime,
+  `status` tinyint NOT NULL,
+  `archived_at` datetime NOT NULL,
+  PRIMARY KEY (`id`, `order_created_at`),
+  KEY `idx_cart_history_status_created` (`status`, `order_created_at`),
+  KEY `idx_cart_history_order_id` (`order_id`),
+  KEY `idx_cart_history_manager_created` (`manager_id`, `order_created_at`),
+  KEY `idx_cart_history_server_created` (`server_id`, `order_created_at`),
+  KEY `idx_cart_history_chef_created` (`chef_id`, `order_created_at`)
+)
+PARTITION BY RANGE (TO_DAYS(`order_created_at`)) (
+  PARTITION `p_before` VALUES LESS THAN (TO_DAYS('2026-01-01')),
+  PARTITION `p202601` VALUES LESS THAN (TO_DAYS('2026-02-01')),
+  PARTITION `p202602` VALUES LESS THAN (TO_DAYS('2026-03-01')),
+  PARTITION `p202603` VALUES LESS THAN (TO_DAYS('2026-04-01')),
+  PARTITION `p202604` VALUES LESS THAN (TO_DAYS('2026-05-01')),
+  PARTITION `p202605` VALUES LESS THAN (TO_DAYS('2026-06-01')),
+  PARTITION `p202606` VALUES LESS THAN (TO_DAYS('2026-07-01')),
+  PARTITION `p202607` VALUES LESS THAN (TO_DAYS('2026-08-01')),
+  PARTITION `p202608` VALUES LESS THAN (TO_DAYS('2026-09-01')),
+  PARTITION `p202609` VALUES LESS THAN (TO_DAYS('2026-10-01')),
+  PARTITION `p202610` VALUES LESS THAN (TO_DAYS('2026-11-01')),
+  PARTITION `p202611` VALUES LESS THAN (TO_DAYS('2026-12-01')),
+  PARTITION `p_future` VALUES LESS THAN MAXVALUE
+);
+
+-- Reports that cover past days (completed orders, exports, attendance and
+-- the billing dashboards) read this view instead of cart. The date and status
+-- filters are pushed into both halves of the UNION (MySQL 8.0.29+), so the
+-- history half is pruned to the months asked for.
+CREATE OR REPLACE VIEW `cart_reporting` AS
+SELECT `id`, `order_id`, `cart_id`, `item_id`, `item_qty`, `table_id`, `server_id`, `chef_id`, `manager_id`,
+       `order_created_at`, `order_updated_at`, `status`
+FROM `cart`
+UNION ALL
+SELECT `id`, `order_id`, `cart_id`, `item_id`, `item_qty`, `table_id`, `server_id`, `chef_id`, `manager_id`,
+       `order_created_at`, `order_updated_at`, `status`
+FROM `cart_history`;
+
+-- customer_info and payment_mode rows outlive their cart lines once an order
+-- is archived, so they can no longer reference cart. The names below are the
+-- ones MySQL generates; check SHOW CREATE TABLE if yours differ.
+ALTER TABLE `customer_info` DROP FOREIGN KEY `customer_info_ibfk_1`;
+ALTER TABLE `payment_mode` DROP FOREIGN KEY `payment_mode_ibfk_1`;
+
+
+-- Order headers maintained by order_headers.py alongside the cart lines, so
+-- order lists (biller, completed orders, summary exports) scan one indexed
+-- row per order instead of grouping lines. status follows the app's line
+-- numbering: the furthest status an open line has reached, or completed once
+-- no line is open. The completed_* columns count the lines completed so far
+-- (completed_at is when the last of them was); completed order lists take
+-- every order with completed_line_count > 0.
+CREATE TABLE IF NOT EXISTS `orders` (
+  `order_id` varchar(20) PRIMARY KEY,
+  `org_id` int(11),
+  `manager_id` int(11),
+  `table_id` int(11),
+  `server_id` int(11),
+  `chef_id` int(11),
+  `status` tinyint NOT NULL DEFAULT 0,
+  `line_count` int(11) NOT NULL DEFAULT 0,
+  `item_count` int(11) NOT NULL DEFAULT 0,
+  `total_amount` decimal(14,2) NOT NULL DEFAULT 0,
+  `completed_line_count` int(11) NOT NULL DEFAULT 0,
+  `completed_item_count` int(11) NOT NULL DEFAULT 0,
+  `completed_amount` decimal(14,2) NOT NULL DEFAULT 0,
+  `customer_name` varchar(50),
+  `customer_phone` varchar(20),
+  `payment_mode` varchar(100),
+  `billed_by` int(11),
+  `created_at` datetime,
+  `updated_at` datetime,
+  `completed_at` datetime,
+  KEY `idx_orders_status_created` (`status`, `created_at`),
+  KEY `idx_orders_manager_status` (`manager_id`, `status`, `created_at`),
+  KEY `idx_orders_org_status` (`org_id`, `status`, `created_at`),
+  KEY `idx_orders_created` (`created_at`)
+);
+
+-- Backfill from the existing lines. Completed is 6 in the restaurant app's
+-- database and 2 in the billing app's; set it before running.
+SET @completed_status = 6;
+
+INSERT IGNORE INTO `orders` (`order_id`, `org_id`, `manager_id`, `table_id`, `server_id`, `chef_id`, `status`,
+                             `line_count`, `item_count`, `total_amount`, `completed_line_count`,
+                             `completed_item_count`, `completed_amount`, `created_at`, `updated_at`, `completed_at`)
+SELECT c.order_id, MAX(m.org_id), MAX(c.manager_id), MAX(c.table_id), MAX(c.server_id), MAX(c.chef_id),
+       COALESCE(MAX(IF(c.status <> @completed_status, c.status, NULL)), @completed_status),
+       COUNT(*), COALESCE(SUM(c.item_qty), 0), COALESCE(SUM(c.item_qty * m.item_price), 0),
+       SUM(c.status = @completed_status),
+       COALESCE(SUM(IF(c.status = @completed_status, c.item_qty, 0)), 0),
+       COALESCE(SUM(IF(c.status = @completed_status, c.item_qty * m.item_price, 0)), 0),
+       MIN(c.order_created_at), MAX(c.order_updated_at),
+       MAX(IF(c.status = @completed_status, c.order_updated_at, NULL))
+FROM cart_reporting c
+LEFT JOIN menu m ON c.item_id = m.item_id
+WHERE c.order_id IS NOT NULL
+GROUP BY c.order_id;
+
+UPDATE `orders` o
+JOIN `customer_info` ci ON ci.id = (SELECT MAX(id) FROM `customer_info` WHERE order_id = o.order_id)
+SET o.customer_name = ci.customer_name, o.customer_phone = ci.customer_phone;
+
+UPDATE `orders` o
+JOIN `payment_mode` pm ON pm.id = (SELECT MAX(id) FROM `payment_mode` WHERE order_id = o.order_id)
+SET o.payment_mode = pm.mode, o.billed_by = pm.billed_by;
+
+
+-- Each cart line keeps the item name and unit price it was ordered at, so
+-- reports read revenue from the line instead of joining the live menu, and a
+-- later price change no longer rewrites past sales. Existing lines are filled
+-- from the current menu right here, and lines the previous release writes
+-- during the rollout by scripts/backfill_cart_prices.py; reports never join
+-- menu for names or prices. Lines whose item was already deleted from the
+-- menu have no record of their price and stay NULL. sales_rollup keeps the
+-- item name next to its figures for the same reason.
+ALTER TABLE `cart`
+  ADD COLUMN `item_name` varchar(100) AFTER `item_id`,
+  ADD COLUMN `item_price` int(11) AFTER `item_name`;
+
+ALTER TABLE `cart_history`
+  ADD COLUMN `item_name` varchar(100) AFTER `item_id`,
+  ADD COLUMN `item_price` int(11) AFTER `item_name`;
+
+UPDATE `cart` c
+JOIN `menu` m ON c.item_id = m.item_id
+SET c.item_name = m.item_name, c.item_price = m.item_price, c.order_created_at = c.order_created_at
+WHERE c.item_price IS NULL;
+
+UPDATE `cart_history` c
+JOIN `menu` m ON c.item_id = m.item_id
+SET c.item_name = m.item_name, c.item_price = m.item_price, c.order_created_at = c.order_created_at
+WHERE c.item_price IS NULL;
+
+ALTER TABLE `sales_rollup` ADD COLUMN `item_name` varchar(100) AFTER `item_id`;
+
+UPDATE `sales_rollup` r
+JOIN `menu` m ON r.item_id = m.item_id
+SET r.item_name = m.item_name
+WHERE r.item_name IS NULL;
+
+CREATE OR REPLACE VIEW `cart_reporting` AS
+SELECT `id`, `order_id`, `cart_id`, `item_id`, `item_name`, `item_price`, `item_qty`, `table_id`, `server_id`,
+       `chef_id`, `manager_id`, `order_created_at`, `order_updated_at`, `status`
+FROM `cart`
+UNION ALL
+SELECT `id`, `order_id`, `cart_id`, `item_id`, `item_name`, `item_price`, `item_qty`, `table_id`, `server_id`,
+       `chef_id`, `manager_id`, `order_created_at`, `order_updated_at`, `status`
+FROM `cart_history`;
+
+-- add_to_cart now copies the item's name and price onto a new line; a line
+-- that grows keeps the price it was first ordered at.
+DROP PROCEDURE IF EXISTS `restaurant_add_to_cart`;
+DROP PROCEDURE IF EXISTS `billing_add_to_cart`;
+
+DELIMITER //
+
+CREATE PROCEDURE `restaurant_add_to_cart`(
+  IN p_item_id varchar(20), IN p_item_qty int, IN p_table_id int, IN p_server_id int,
+  IN p_chef_id int, IN p_manager_id int, IN p_status tinyint, IN p_cart_id varchar(20), IN p_now datetime
+)
+BEGIN
+  DECLARE v_order_id varchar(20) DEFAULT NULL;
+  DECLARE v_item_name varchar(100) DEFAULT NULL;
+  DECLARE v_item_price int DEFAULT NULL;
+  DECLARE v_rows int;
+
+  SELECT `order_id` INTO v_order_id FROM `cart`
+  WHERE `table_id` = p_table_id AND `server_id` = p_server_id AND `status` < 5
+  ORDER BY `order_created_at` DESC LIMIT 1;
+
+  IF v_order_id IS NULL THEN
+    -- The ORD row stays locked until commit, so order creation is serialised;
+    -- the locking read then sees an order another add opened meanwhile
+    UPDATE `id_sequences` SET `next_value` = LAST_INSERT_ID(`next_value` + 1) WHERE `name` = 'ORD';
+    SELECT `order_id` INTO v_order_id FROM `cart`
+    WHERE `table_id` = p_table_id AND `server_id` = p_server_id AND `status` < 5
+    ORDER BY `order_created_at` DESC LIMIT 1 FOR UPDATE;
+    IF v_order_id IS NULL THEN
+      SET v_order_id = CONCAT('ORD_', LAST_INSERT_ID() - 1);
+    END IF;
+  END IF;
+
+  SELECT `item_name`, `item_price` INTO v_item_name, v_item_price FROM `menu` WHERE `item_id` = p_item_id;
+
+  INSERT INTO `cart` (`order_id`, `cart_id`, `item_id`, `item_name`, `item_price`, `item_qty`, `table_id`,
+                      `server_id`, `chef_id`, `manager_id`, `order_created_at`, `order_updated_at`, `status`)
+  VALUES (v_order_id, p_cart_id, p_item_id, v_item_name, v_item_price, p_item_qty, p_table_id,
+          p_server_id, p_chef_id, p_manager_id, p_now, p_now, p_status)
+  ON DUPLICATE KEY UPDATE `item_qty` = `item_qty` + VALUES(`item_qty`),
+                          `order_updated_at` = VALUES(`order_updated_at`),
+                          `order_created_at` = `order_created_at`;
+  SET v_rows = ROW_COUNT();
+
+  IF v_rows = 1 THEN
+    SELECT p_cart_id AS `cart_id`, v_order_id AS `order_id`, 1 AS `inserted`;
+  ELSE
+    SELECT `cart_id`, `order_id`, 0 AS `inserted` FROM `cart`
+    WHERE `open_line_key` = CONCAT('T', p_table_id, ':', p_server_id, ':', p_item_id);
+  END IF;
+END //
+
+CREATE PROCEDURE `billing_add_to_cart`(
+  IN p_item_id varchar(20), IN p_item_qty int, IN p_manager_id int, IN p_cart_id varchar(20), IN p_now datetime
+)
+BEGIN
+  DECLARE v_order_id varchar(20) DEFAULT NULL;
+  DECLARE v_item_name varchar(100) DEFAULT NULL;
+  DECLARE v_item_price int DEFAULT NULL;
+  DECLARE v_rows int;
+
+  SELECT `order_id` INTO v_order_id FROM `cart`
+  WHERE `manager_id` = p_manager_id AND `status` = 0
+  LIMIT 1;
+
+  IF v_order_id IS NULL THEN
+    -- See restaurant_add_to_cart
+    UPDATE `id_sequences` SET `next_value` = LAST_INSERT_ID(`next_value` + 1) WHERE `name` = 'ORD';
+    SELECT `order_id` INTO v_order_id FROM `cart`
+    WHERE `manager_id` = p_manager_id AND `status` = 0
+    LIMIT 1 FOR UPDATE;
+    IF v_order_id IS NULL THEN
+      SET v_order_id = CONCAT('ORD_', LAST_INSERT_ID() - 1);
+    END IF;
+  END IF;
+
+  SELECT `item_name`, `item_price` INTO v_item_name, v_item_price FROM `menu` WHERE `item_id` = p_item_id;
+
+  INSERT INTO `cart` (`order_id`, `cart_id`, `item_id`, `item_name`, `item_price`, `item_qty`,
+                      `order_created_at`, `order_updated_at`, `manager_id`, `status`)
+  VALUES (v_order_id, p_cart_id, p_item_id, v_item_name, v_item_price, p_item_qty, p_now, p_now, p_manager_id, 0)
+  ON DUPLICATE KEY UPDATE `item_qty` = `item_qty` + VALUES(`item_qty`),
+                          `order_updated_at` = VALUES(`order_updated_at`),
+                          `order_created_at` = `order_created_at`;
+  SET v_rows = ROW_COUNT();
+
+  IF v_rows = 1 THEN
+    SELECT p_cart_id AS `cart_id`, v_order_id AS `order_id`, 1 AS `inserted`;
+  ELSE
+    SELECT `cart_id`, `order_id`, 0 AS `inserted` FROM `cart`
+    WHERE `open_line_key` = CONCAT('M', p_manager_id, ':', p_item_id);
+  END IF;
+END //
+
+DELIMITER ;
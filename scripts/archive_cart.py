@@ -0,0 +1,42 @@
+# Moves completed cart lines ordered before today into cart_history, keeps
+# cart_history's monthly partitions ahead of the calendar and drops months past
+# CART_HISTORY_RETENTION_MONTHS (see cart_archive.py). Run it from the
+# repository root once a night, after closing, for each app's database:
+#
+#     30 3 * * * cd /srv/billingapp && python -m scripts.archive_cart restaurant
+#
+# The argument is the app whose status numbering applies: restaurant or billing.
+
+import sys
+from datetime import datetime
+
+import mysql.connector
+import pytz
+
+import cart_archive
+import db_config
+
+ist = pytz.timezone('Asia/Kolkata')
+
+
+def main(argv):
+    if len(argv) != 1 or argv[0] not in cart_archive.COMPLETED_STATUS:
+        print(f"usage: python -m scripts.archive_cart {{{'|'.join(cart_archive.COMPLETED_STATUS)}}}")
+        return 2
+
+    conn = mysql.connector.connect(**db_config.db_config_cred_react_natvie())
+    try:
+        result = cart_archive.run(conn, argv[0], now=datetime.now(ist))
+    finally:
+        conn.close()
+
+    print(f"Moved {result['moved']} completed lines to cart_history")
+    if result['partitions_created']:
+        print(f"Created partitions: {', '.join(result['partitions_created'])}")
+    if result['partitions_dropped']:
+        print(f"Dropped partitions: {', '.join(result['partitions_dropped'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,77 @@
+# Fills item_name and item_price on cart and cart_history lines that have no
+# snapshot, from the current menu (the best record of what was charged), and
+# item_name on sales_rollup rows. The migration in schema_updates.sql already
+# fills every existing row; this catches rows written by the previous release
+# while a rollout is in progress, since reports read the snapshot only. Lines that already carry a snapshot are never touched, so it is
+# safe to rerun and to run while the apps are serving. Run it from the
+# repository root once every worker runs the new code:
+#
+#     python -m scripts.backfill_cart_prices
+#
+# Work is split into id ranges of BACKFILL_BATCH_SIZE lines, each committed on
+# its own so row locks on the live cart table are held only briefly.
+
+import os
+import sys
+
+import mysql.connector
+
+import db_config
+
+BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 5000))
+TABLES = ('cart', 'cart_history')
+
+
+def backfill(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table} WHERE item_price IS NULL")
+    low, high = cursor.fetchone()
+    updated = 0
+    if low is not None:
+        for start in range(low, high + 1, BATCH_SIZE):
+            cursor.execute(f"""
+                UPDATE {table} c
+                JOIN menu m ON c.item_id = m.item_id
+                SET c.item_name = m.item_name, c.item_price = m.item_price,
+                    c.order_created_at = c.order_created_at
+                WHERE c.id >= %s AND c.id < %s AND c.item_price IS NULL
+            """, (start, start + BATCH_SIZE))
+            updated += cursor.rowcount
+            conn.commit()
+
+    cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE item_price IS NULL")
+    missing = cursor.fetchone()[0]
+    cursor.close()
+    return updated, missing
+
+
+def backfill_rollup_names(conn):
+    # sales_rollup holds a row per item and hour, not per line, so one
+    # statement is enough
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE sales_rollup r
+        JOIN menu m ON r.item_id = m.item_id
+        SET r.item_name = m.item_name
+        WHERE r.item_name IS NULL
+    """)
+    updated = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    return updated
+
+
+def main():
+    conn = mysql.connector.connect(**db_config.db_config_cred_react_natvie())
+    try:
+        for table in TABLES:
+            updated, missing = backfill(conn, table)
+            print(f"{table}: filled {updated} lines, {missing} still without a price (item no longer on the menu)")
+        print(f"sales_rollup: named {backfill_rollup_names(conn)} rows")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# Benchmarks GET /client-dashboard at 10, 100 and 1000 tenants against a
+# scratch database, next to the old per-client (3N+1 queries) loop for
+# comparison. Both are timed the same way: as requests through the Flask test
+# client, each taking its connection from the app's pool. The scratch database is dropped and recreated on every run, so
+# never point BENCH_DATABASE at real data:
+#
+#     BENCH_DATABASE=restaurant_bench python -m scripts.bench_client_dashboard
+
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+from flask import jsonify
+
+import app_restaurant
+import db_config
+from db_pool import ConnectionPool
+
+CLIENT_COUNTS = (10, 100, 1000)
+MANAGERS_PER_CLIENT = 2
+STAFF_PER_CLIENT = 6
+ROLLUP_DAYS_PER_CLIENT = 30
+RUNS = 5
+
+SCHEMA = [
+    """CREATE TABLE clients (
+        id int AUTO_INCREMENT PRIMARY KEY, name varchar(100), org_id int, no_of_users int
+    )""",
+    """CREATE TABLE users (
+        id int AUTO_INCREMENT PRIMARY KEY, name varchar(255), user_uid int, parent_uid int,
+        role int, org int, status varchar(10), created_at timestamp NULL,
+        KEY idx_users_uid (user_uid), KEY idx_users_org_role (org, role)
+    )""",
+    """CREATE TABLE org_info (
+        id int AUTO_INCREMENT PRIMARY KEY, org_id int, org_name varchar(100),
+        org_address varchar(500), org_phone varchar(20), KEY idx_org_info_org (org_id)
+    )""",
+    """CREATE TABLE menu (
+        id int AUTO_INCREMENT PRIMARY KEY, item_id char(10) UNIQUE, item_name varchar(100),
+        item_price int, org_id int
+    )""",
+    """CREATE TABLE cart (
+        id int AUTO_INCREMENT PRIMARY KEY, order_id char(12), cart_id char(12), item_id char(10),
+        item_qty int, server_id int, status tinyint, order_created_at timestamp NULL,
+        KEY idx_cart_server_created (server_id, order_created_at)
+    )""",
+    """CREATE TABLE sales_rollup (
+        org_id int NOT NULL, sale_date date NOT NULL, sale_hour tinyint NOT NULL,
+        item_id char(10) NOT NULL, table_id int NOT NULL, server_id int NOT NULL,
+        chef_id int NOT NULL,
+        item_qty int NOT NULL, line_count int NOT NULL, revenue decimal(14,2) NOT NULL,
+        PRIMARY KEY (sale_date, org_id, sale_hour, item_id, table_id, server_id, chef_id)
+    )""",
+]
+
+
+def legacy_client_dashboard(cursor):
+    # The handler's loop before it became one grouped query
+    cursor.execute("""
+        SELECT c.name, c.org_id, c.no_of_users, u.created_at as onboard_date,
+               oi.org_name, oi.org_address as address, oi.org_phone as phone
+        FROM clients c
+        LEFT JOIN users u ON c.org_id = u.user_uid AND u.role = 2
+        LEFT JOIN org_info oi ON c.org_id = oi.org_id
+        ORDER BY c.name
+    """)
+    formatted_clients = []
+    for client in cursor.fetchall():
+        cursor.execute("SELECT COUNT(*) as count FROM users WHERE org = %s AND role = 3", (client['org_id'],))
+        managers_count = cursor.fetchone()['count']
+        cursor.execute("SELECT COUNT(*) as count FROM users WHERE org = %s AND role = 4", (client['org_id'],))
+        staff_count = cursor.fetchone()['count']
+        cursor.execute("""
+            SELECT COALESCE(SUM(cart.item_qty * menu.item_price), 0) as revenue
+            FROM cart
+            JOIN menu ON cart.item_id = menu.item_id
+            JOIN users u3 ON cart.server_id = u3.user_uid
+            WHERE u3.org = %s AND cart.status = 6
+        """, (client['org_id'],))
+        total_revenue = cursor.fetchone()['revenue']
+        formatted_clients.append({
+            'name': client['name'],
+            'org_id': client['org_id'],
+            'no_of_users': client['no_of_users'],
+            'managers_count': managers_count,
+            'staff_count': staff_count,
+            'total_revenue': float(total_revenue) if total_revenue else 0,
+            'onboard_date': client['onboard_date'].strftime('%Y-%m-%d') if client['onboard_date'] else 'N/A',
+            'org_name': client['org_name'],
+            'address': client['address'],
+            'phone': client['phone']
+        })
+    return formatted_clients
+
+
+def legacy_client_dashboard_view():
+    conn = app_restaurant.get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    clients = legacy_client_dashboard(cursor)
+    cursor.close()
+    conn.close()
+    return jsonify({'success': True, 'data': clients})
+
+
+def seed(cursor, client_count):
+    for table in ('clients', 'users', 'org_info', 'menu', 'cart', 'sales_rollup'):
+        cursor.execute(f"TRUNCATE TABLE {table}")
+
+    cursor.executemany("INSERT INTO menu (item_id, item_name, item_price, org_id) VALUES (%s, %s, %s, %s)",
+                       [(f"I{n}", f"Item {n}", 50 + n, 0) for n in range(20)])
+
+    start_day = datetime.now() - timedelta(days=ROLLUP_DAYS_PER_CLIENT)
+    next_uid = client_count + 1
+    for org in range(1, client_count + 1):
+        cursor.execute("INSERT INTO clients (name, org_id, no_of_users) VALUES (%s, %s, %s)",
+                       (f"Client {org:04d}", org, 20))
+        cursor.execute("INSERT INTO org_info (org_id, org_name, org_address, org_phone) VALUES (%s, %s, %s, %s)",
+                       (org, f"Org {org}", "Address", "9999999999"))
+        members = [(f"Client {org}", org, 0, 2, org, 'active', start_day)]
+        staff_uids = []
+        for role, count in ((3, MANAGERS_PER_CLIENT), (4, STAFF_PER_CLIENT)):
+            for _ in range(count):
+                members.append((f"User {next_uid}", next_uid, org, role, org, 'active', start_day))
+                if role == 4:
+                    staff_uids.append(next_uid)
+                next_uid += 1
+        cursor.executemany("""
+            INSERT INTO users (name, user_uid, parent_uid, role, org, status, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, members)
+
+        cart_rows, rollup_rows = [], []
+        for day in range(ROLLUP_DAYS_PER_CLIENT):
+            created = start_day + timedelta(days=day, hours=20)
+            server_id = staff_uids[day % len(staff_uids)]
+            item = day % 20
+            cart_rows.append((f"ORD_{org}_{day}", f"CRT_{org}_{day}", f"I{item}", 2, server_id, 6, created))
+            rollup_rows.append((org, created.date(), 20, f"I{item}", 1, server_id, 0,
+                                2, 1, 2 * (50 + item)))
+        cursor.executemany("""
+            INSERT INTO cart (order_id, cart_id, item_id, item_qty, server_id, status, order_created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, cart_rows)
+        cursor.executemany("""
+            INSERT INTO sales_rollup (org_id, sale_date, sale_hour, item_id, table_id, server_id, chef_id,
+                                      item_qty, line_count, revenue)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, rollup_rows)
+
+
+def time_runs(fn):
+    samples = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    database = os.environ.get('BENCH_DATABASE', 'restaurant_bench')
+    cred = dict(db_config.db_config_cred_react_natvie())
+    cred.pop('database', None)
+
+    conn = mysql.connector.connect(**cred)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.execute(f"CREATE DATABASE `{database}`")
+    cursor.execute(f"USE `{database}`")
+    for statement in SCHEMA:
+        cursor.execute(statement)
+
+    # Give the app a pool on the scratch database, and serve the legacy loop
+    # next to the real endpoint so both pay for the checkout and the JSON
+    bench_cred = dict(cred, database=database)
+    app_restaurant.connection_pool = ConnectionPool(lambda: mysql.connector.connect(**bench_cred),
+                                                    name="bench_pool")
+    app_restaurant.app.add_url_rule('/bench/legacy-client-dashboard', 'bench_legacy_client_dashboard',
+                                    legacy_client_dashboard_view)
+    client = app_restaurant.app.test_client()
+
+    print(f"{'clients':>8} {'grouped query (ms)':>20} {'legacy 3N+1 (ms)':>18}")
+    for client_count in CLIENT_COUNTS:
+        seed(cursor, client_count)
+        conn.commit()
+
+        def get(path):
+            response = client.get(path)
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+        grouped_ms = time_runs(lambda: get('/client-dashboard'))
+        legacy_ms = time_runs(lambda: get('/bench/legacy-client-dashboard'))
+        print(f"{client_count:>8} {grouped_ms:>20.1f} {legacy_ms:>18.1f}")
+
+    cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+    cursor.close()
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
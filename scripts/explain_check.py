@@ -0,0 +1,84 @@
+# Runs EXPLAIN for the cart access paths used by app.py and app_restaurant.py
+# and fails if MySQL is not picking one of the indexes added in
+# schema_updates.sql. Run it from the repository root against a database with
+# realistic data (on a near-empty table the optimizer prefers full scans):
+#
+#     python -m scripts.explain_check
+
+import sys
+from datetime import datetime
+
+import mysql.connector
+
+import db_config
+from date_ranges import day_bounds, month_bounds
+
+today = datetime.now().date()
+today_start, today_end = day_bounds(today)
+month_start, month_end = month_bounds(today.year, today.month)
+
+CHECKS = [
+    ("dashboard_insights/* (today's raw rows)", """
+        SELECT COUNT(DISTINCT c.order_id), SUM(c.item_qty * m.item_price)
+        FROM cart c JOIN menu m ON c.item_id = m.item_id
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6
+    """, [today_start, today_end], {'idx_cart_status_created'}),
+    ("dashboard_insights/status_counts", """
+        SELECT status, COUNT(DISTINCT order_id) FROM cart
+        WHERE order_created_at >= %s AND order_created_at < %s AND status IN (0, 1, 2, 3, 4, 5)
+        GROUP BY status
+    """, [today_start, today_end], {'idx_cart_status_created'}),
+    ("completed_orders / export/orders", """
+        SELECT c.order_id, c.item_qty, m.item_price
+        FROM cart c JOIN menu m ON c.item_id = m.item_id
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6
+        ORDER BY c.order_created_at DESC
+    """, [month_start, month_end], {'idx_cart_status_created'}),
+    ("completed_orders / export/orders (archived days)", """
+        SELECT c.order_id, c.item_qty, m.item_price
+        FROM cart_history c JOIN menu m ON c.item_id = m.item_id
+        WHERE c.order_created_at >= %s AND c.order_created_at < %s AND c.status = 6
+        ORDER BY c.order_created_at DESC
+    """, [month_start, month_end], {'idx_cart_history_status_created'}),
+    ("attendance/<user_id>", """
+        SELECT DATE(order_created_at), SUM(item_qty) FROM cart
+        WHERE (server_id = %s OR chef_id = %s) AND order_created_at >= %s AND order_created_at < %s
+        GROUP BY DATE(order_created_at)
+    """, [1, 1, month_start, month_end], {'idx_cart_server_created', 'idx_cart_chef_created',
+                                          'idx_cart_server_created,idx_cart_chef_created'}),
+    ("cart/items, cart/send-to-kitchen, cart/send-to-bill", """
+        SELECT * FROM cart WHERE table_id = %s AND server_id = %s AND status < 5
+    """, [1, 1], {'idx_cart_table_server_status'}),
+    ("kitchen/orders, biller/orders (restaurant), cart/items (billing)", """
+        SELECT * FROM cart WHERE manager_id = %s AND status IN (1, 2, 3)
+    """, [1], {'idx_cart_manager_status', 'idx_cart_status_created'}),
+    ("biller/complete-order", """
+        SELECT cart_id FROM cart WHERE order_id = %s AND status = 5
+    """, ['ORD_1'], {'idx_cart_order_id'}),
+    ("cart/update, cart/mark-served, cart/update-status", """
+        SELECT * FROM cart WHERE cart_id = %s
+    """, ['CRT_1'], {'idx_cart_cart_id'}),
+]
+
+
+def main():
+    conn = mysql.connector.connect(**db_config.db_config_cred_react_natvie())
+    cursor = conn.cursor(dictionary=True)
+    failures = 0
+
+    for name, query, params, expected in CHECKS:
+        cursor.execute("EXPLAIN " + query, params)
+        plan = cursor.fetchall()
+        cart_rows = [row for row in plan if row['table'] in ('c', 'cart')]
+        used = [row['key'] for row in cart_rows]
+        ok = bool(cart_rows) and all(key in expected for key in used)
+        failures += 0 if ok else 1
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: key={used} expected one of {sorted(expected)}")
+
+    cursor.close()
+    conn.close()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+# Replays a restaurant dinner rush against app_restaurant.py and reports
+# throughput and p50/p95/p99 latency per endpoint. A scratch database is
+# seeded with orgs, menus, staff and LOAD_HISTORY_DAYS of completed orders,
+# then waiters, kitchen, billing, dashboard and export clients run
+# concurrently for LOAD_DURATION seconds through the Flask test client (the
+# full app and MySQL, without the HTTP layer). Any MySQL-compatible server
+# works, e.g. a throwaway container:
+#
+#     docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=... mysql:8
+#     LOAD_DATABASE=restaurant_load python -m scripts.load_test
+#
+# The scratch database is dropped and recreated on every run, so never point
+# LOAD_DATABASE at real data. Runs are repeatable for a given LOAD_SEED.
+# LOAD_REPORT=path writes the results as JSON; LOAD_BASELINE=path compares
+# against an earlier report and exits 1 when an endpoint's p95 grew by more
+# than LOAD_TOLERANCE (default 0.25, i.e. 25%).
+
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+import db_config
+
+DATABASE = os.environ.get('LOAD_DATABASE', 'restaurant_load')
+SEED = int(os.environ.get('LOAD_SEED', 42))
+ORGS = int(os.environ.get('LOAD_ORGS', 3))
+TABLES_PER_ORG = int(os.environ.get('LOAD_TABLES', 20))
+WAITERS_PER_ORG = int(os.environ.get('LOAD_WAITERS', 4))
+MENU_ITEMS = int(os.environ.get('LOAD_MENU_ITEMS', 40))
+HISTORY_DAYS = int(os.environ.get('LOAD_HISTORY_DAYS', 90))
+ORDERS_PER_DAY = int(os.environ.get('LOAD_ORDERS_PER_DAY', 60))
+DURATION = float(os.environ.get('LOAD_DURATION', 60))
+THINK_SECONDS = float(os.environ.get('LOAD_THINK', 0.2))
+TOLERANCE = float(os.environ.get('LOAD_TOLERANCE', 0.25))
+
+SCHEMA = [
+    """CREATE TABLE clients (
+        id int AUTO_INCREMENT PRIMARY KEY, name varchar(100), org_id int, no_of_users int
+    )""",
+    """CREATE TABLE users (
+        id int AUTO_INCREMENT PRIMARY KEY, name varchar(255), phone varchar(15), password varchar(255),
+        area varchar(255), pincode char(6), user_uid int, parent_uid int, role int, org int,
+        status varchar(10), no_of_users int, created_at timestamp NULL, updated_at timestamp NULL,
+        KEY idx_users_uid (user_uid), KEY idx_users_parent (parent_uid), KEY idx_users_org_role (org, role)
+    )""",
+    """CREATE TABLE org_info (
+        id int AUTO_INCREMENT PRIMARY KEY, org_id int, org_name varchar(100), org_address varchar(500),
+        org_phone varchar(20), org_gst varchar(20), org_fssai varchar(20), org_table_nos int DEFAULT 20,
+        org_status int DEFAULT 1, KEY idx_org_info_org (org_id)
+    )""",
+    """CREATE TABLE menu (
+        id int AUTO_INCREMENT PRIMARY KEY, item_id char(10) UNIQUE, item_name varchar(100), item_price int,
+        item_cat varchar(50), item_status int DEFAULT 1, org_id int, manager_id int,
+        created_at timestamp NULL, updated_at timestamp NULL, KEY idx_menu_org (org_id, item_status)
+    )""",
+    """CREATE TABLE cart (
+        id int AUTO_INCREMENT PRIMARY KEY, order_id varchar(20), cart_id varchar(20), item_id char(10),
+        item_name varchar(100), item_price int, item_qty int, table_id int, server_id int, chef_id int, manager_id int,
+        order_created_at timestamp NULL, order_updated_at timestamp NULL, status tinyint NOT NULL DEFAULT 0,
+        open_line_key varchar(64) GENERATED ALWAYS AS (
+            IF(status = 0, IF(table_id IS NULL, CONCAT('M', manager_id, ':', item_id),
+                              CONCAT('T', table_id, ':', server_id, ':', item_id)), NULL)
+        ) STORED,
+        UNIQUE KEY uq_cart_open_line (open_line_key),
+        KEY idx_cart_status_created (status, order_created_at),
+        KEY idx_cart_table_server_status (table_id, server_id, status),
+        KEY idx_cart_manager_status (manager_id, status),
+        KEY idx_cart_order_id (order_id),
+        KEY idx_cart_cart_id (cart_id),
+        KEY idx_cart_server_created (server_id, order_created_at),
+        KEY idx_cart_chef_created (chef_id, order_created_at)
+    )""",
+    """CREATE TABLE customer_info (
+        id int AUTO_INCREMENT PRIMARY KEY, order_id varchar(20), customer_phone varchar(20),
+        customer_name varchar(50), KEY idx_customer_info_order_id (order_id)
+    )""",
+    """CREATE TABLE payment_mode (
+        id int AUTO_INCREMENT PRIMARY KEY, order_id varchar(20), mode varchar(100), org_id int,
+        billed_by int, KEY idx_payment_mode_order_id (order_id)
+    )""",
+    """CREATE TABLE id_sequences (name varchar(20) PRIMARY KEY, next_value bigint NOT NULL)""",
+    """CREATE TABLE sales_rollup (
+        org_id int NOT NULL DEFAULT 0, sale_date date NOT NULL, sale_hour tinyint NOT NULL,
+        item_id char(10) NOT NULL, item_name varchar(100), table_id int NOT NULL DEFAULT 0, server_id int NOT NULL DEFAULT 0,
+        chef_id int NOT NULL DEFAULT 0,
+        item_qty int NOT NULL DEFAULT 0, line_count int NOT NULL DEFAULT 0, revenue decimal(14,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (sale_date, org_id, sale_hour, item_id, table_id, server_id, chef_id),
+        KEY idx_sales_rollup_server (server_id, sale_date), KEY idx_sales_rollup_chef (chef_id, sale_date)
+    )""",
+]
+
+PAYMENT_MODES = ('Cash', 'Card', 'UPI')
+CATEGORIES = ('Starters', 'Mains', 'Breads', 'Desserts', 'Drinks')
+
+
+def schema_updates_statement(start, end):
+    # Statements that only live in schema_updates.sql (the add_to_cart
+    # procedure, cart_history and its reporting view, order headers and the
+    # backfills) are taken from there verbatim, latest definition first
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'schema_updates.sql')
+    with open(path) as f:
+        sql = f.read()
+    begin = sql.rindex(start)
+    return sql[begin:sql.index(end, begin)]
+
+
+def seed(cursor, rng):
+    # Returns {org_id: {...uids, menu item ids}} for the replay
+    orgs = {}
+    next_uid = 1000
+    start_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=HISTORY_DAYS)
+    order_number, cart_number = 1, 1
+
+    for org in range(1, ORGS + 1):
+        cursor.execute("INSERT INTO clients (name, org_id, no_of_users) VALUES (%s, %s, %s)", (f"Client {org}", org, 50))
+        cursor.execute("""
+            INSERT INTO org_info (org_id, org_name, org_address, org_phone, org_table_nos, org_status)
+            VALUES (%s, %s, %s, %s, %s, 1)
+        """, (org, f"Org {org}", "Address", "9999999999", TABLES_PER_ORG))
+
+        manager = next_uid
+        waiters = list(range(manager + 1, manager + 1 + WAITERS_PER_ORG))
+        chef, biller = waiters[-1] + 1, waiters[-1] + 2
+        next_uid = biller + 1
+        members = [(f"Client {org}", org, 0, 2), (f"Manager {manager}", manager, org, 3)]
+        members += [(f"Staff {uid}", uid, manager, 4) for uid in waiters + [chef, biller]]
+        cursor.executemany("""
+            INSERT INTO users (name, phone, password, user_uid, parent_uid, role, org, status, created_at)
+            VALUES (%s, '0000000000', 'load', %s, %s, %s, %s, 'active', %s)
+        """, [(name, uid, parent, role, org, start_day) for name, uid, parent, role in members])
+
+        items = [(f"{org}{n:03d}", rng.randint(60, 450)) for n in range(MENU_ITEMS)]
+        cursor.executemany("""
+            INSERT INTO menu (item_id, item_name, item_price, item_cat, item_status, org_id, manager_id, created_at)
+            VALUES (%s, %s, %s, %s, 1, %s, %s, %s)
+        """, [(item_id, f"Item {item_id}", price, CATEGORIES[n % len(CATEGORIES)], org, manager, start_day)
+              for n, (item_id, price) in enumerate(items)])
+
+        cart_rows, payments, customers = [], [], []
+        for day in range(HISTORY_DAYS):
+            for _ in range(ORDERS_PER_DAY):
+                created = start_day + timedelta(days=day, hours=rng.randint(11, 22), minutes=rng.randint(0, 59))
+                order_id = f"ORD_{order_number}"
+                order_number += 1
+                table, server = rng.randint(1, TABLES_PER_ORG), rng.choice(waiters)
+                for item_id, price in rng.sample(items, rng.randint(1, 6)):
+                    cart_rows.append((order_id, f"CRT_{cart_number}", item_id, f"Item {item_id}", price,
+                                      rng.randint(1, 3), table, server, chef, manager, created,
+                                      created + timedelta(minutes=40), 6))
+                    cart_number += 1
+                payments.append((order_id, rng.choice(PAYMENT_MODES), org, biller))
+                customers.append((order_id, '9000000000', 'Guest'))
+            if len(cart_rows) >= 5000:
+                insert_history(cursor, cart_rows, payments, customers)
+                cart_rows, payments, customers = [], [], []
+        insert_history(cursor, cart_rows, payments, customers)
+
+        orgs[org] = {'manager': manager, 'waiters': waiters, 'chef': chef, 'biller': biller,
+                     'items': [item_id for item_id, _ in items]}
+
+    cursor.execute("INSERT INTO id_sequences (name, next_value) VALUES ('ORD', %s), ('CRT', %s)", (order_number, cart_number))
+    return orgs
+
+
+def insert_history(cursor, cart_rows, payments, customers):
+    if cart_rows:
+        cursor.executemany("""
+            INSERT INTO cart (order_id, cart_id, item_id, item_name, item_price, item_qty, table_id, server_id,
+                              chef_id, manager_id, order_created_at, order_updated_at, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, cart_rows)
+    if payments:
+        cursor.executemany("INSERT INTO payment_mode (order_id, mode, org_id, billed_by) VALUES (%s, %s, %s, %s)", payments)
+        cursor.executemany("INSERT INTO customer_info (order_id, customer_phone, customer_name) VALUES (%s, %s, %s)", customers)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def call(self, client, method, path, label=None, **kwargs):
+        label = label or f"{method} {path.split('?')[0]}"
+        started = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.setdefault(label, []).append(elapsed)
+            if response.status_code >= 500:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        if response.is_json:
+            return response.get_json()
+        return body
+
+
+def waiter(app, recorder, rng, org, info, server, tables, deadline):
+    client = app.test_client()
+    while time.time() < deadline:
+        table = rng.choice(tables)
+        recorder.call(client, 'GET', f"/menu?org_id={org}")
+        picks = rng.sample(info['items'], rng.randint(3, 8))
+        if rng.random() < 0.5:
+            for item_id in picks:
+                recorder.call(client, 'POST', '/cart/add', json={
+                    'item_id': item_id, 'item_qty': rng.randint(1, 2), 'table_id': table,
+                    'server_id': server, 'manager_id': info['manager']})
+                time.sleep(THINK_SECONDS * rng.random())
+        else:
+            recorder.call(client, 'POST', '/cart/add-batch', json={
+                'items': [{'item_id': item_id, 'item_qty': rng.randint(1, 2)} for item_id in picks],
+                'table_id': table, 'server_id': server, 'manager_id': info['manager']})
+        recorder.call(client, 'POST', '/cart/send-to-kitchen', json={'table_id': table, 'server_id': server})
+
+        # Wait for the kitchen, serve what is ready, then send the table to billing
+        served_by = time.time() + 30
+        while time.time() < min(served_by, deadline):
+            time.sleep(1 + THINK_SECONDS)
+            result = recorder.call(client, 'GET', f"/cart/items?table_id={table}&server_id={server}")
+            lines = [line for line in (result or {}).get('data', []) if int(line['status']) < 5]
+            for line in lines:
+                if int(line['status']) == 3:
+                    recorder.call(client, 'POST', '/cart/mark-served', json={'cart_id': line['cart_id']})
+            if lines and all(int(line['status']) >= 3 for line in lines):
+                break
+        recorder.call(client, 'POST', '/cart/send-to-bill', json={
+            'table_id': table, 'server_id': server, 'customer_name': 'Guest', 'customer_phone': '9000000000'})
+
+
+def kitchen(app, recorder, rng, org, info, deadline):
+    client = app.test_client()
+    while time.time() < deadline:
+        result = recorder.call(client, 'GET', f"/kitchen/orders?manager_id={info['manager']}&org_id={org}")
+        lines = (result or {}).get('data', [])
+        for status in (1, 2):
+            cart_ids = [line['cart_id'] for line in lines if int(line['status']) == status]
+            if cart_ids:
+                recorder.call(client, 'POST', '/cart/update-status', json={
+                    'cart_ids': cart_ids, 'status': status + 1, 'chef_id': info['chef']})
+        time.sleep(1 + THINK_SECONDS * rng.random())
+
+
+def biller(app, recorder, rng, org, info, deadline):
+    client = app.test_client()
+    while time.time() < deadline:
+        result = recorder.call(client, 'GET', f"/biller/orders?manager_id={info['manager']}&org_id={org}")
+        for order_id in sorted({line['order_id'] for line in (result or {}).get('data', [])}):
+            recorder.call(client, 'POST', '/payment/mode', json={
+                'order_id': order_id, 'mode': rng.choice(PAYMENT_MODES), 'org_id': org, 'billed_by': info['biller']})
+            recorder.call(client, 'POST', '/biller/complete-order', json={'order_id': order_id})
+        time.sleep(2 + THINK_SECONDS * rng.random())
+
+
+def dashboards(app, recorder, rng, org, info, deadline):
+    client = app.test_client()
+    month_ago = (datetime.now() - timedelta(days=30)).date().isoformat()
+    today = datetime.now().date().isoformat()
+    panels = ('overview', 'popular_items', 'hourly_orders', 'table_performance',
+              'server_performance', 'payment_mode_revenue', 'status_counts')
+    while time.time() < deadline:
+        for panel in panels:
+            recorder.call(client, 'GET', f"/dashboard_insights/{panel}?manager_id={info['manager']}"
+                                         f"&from_date={month_ago}&to_date={today}")
+        recorder.call(client, 'GET', f"/completed_orders?manager_id={info['manager']}&org_id={org}")
+        time.sleep(5 + THINK_SECONDS * rng.random())
+
+
+def exports(app, recorder, rng, deadline):
+    client = app.test_client()
+    month_ago = (datetime.now() - timedelta(days=30)).date().isoformat()
+    today = datetime.now().date().isoformat()
+    while time.time() < deadline:
+        recorder.call(client, 'POST', '/export/orders', label='POST /export/orders (30 days, streamed)', json={
+            'from_date': month_ago, 'to_date': today, 'export_type': rng.choice(('full', 'summary'))})
+        time.sleep(15 + THINK_SECONDS * rng.random())
+
+
+def percentile(ordered, fraction):
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def report(recorder, elapsed):
+    results = {}
+    for label, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        results[label] = {
+            'requests': len(ordered),
+            'errors': recorder.errors.get(label, 0),
+            'rps': round(len(ordered) / elapsed, 2),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 1),
+        }
+
+    print(f"{'endpoint':<52} {'reqs':>6} {'err':>4} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, row in results.items():
+        print(f"{label:<52} {row['requests']:>6} {row['errors']:>4} {row['rps']:>7} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+    total = sum(row['requests'] for row in results.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['endpoints']
+    regressions = []
+    for label, row in results.items():
+        before = baseline.get(label)
+        if before and before['p95_ms'] > 0 and row['p95_ms'] > before['p95_ms'] * (1 + TOLERANCE):
+            regressions.append(f"{label}: p95 {before['p95_ms']}ms -> {row['p95_ms']}ms")
+        if row['errors'] and not (before and before['errors']):
+            regressions.append(f"{label}: {row['errors']} server errors")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return regressions
+
+
+def main():
+    cred = dict(db_config.db_config_cred_react_natvie())
+    cred.pop('database', None)
+    rng = random.Random(SEED)
+
+    conn = mysql.connector.connect(**cred)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{DATABASE}`")
+    cursor.execute(f"CREATE DATABASE `{DATABASE}`")
+    cursor.execute(f"USE `{DATABASE}`")
+    for statement in SCHEMA:
+        cursor.execute(statement)
+    cursor.execute(schema_updates_statement("CREATE PROCEDURE `restaurant_add_to_cart`", "END //") + "END")
+    cursor.execute(schema_updates_statement("CREATE TABLE IF NOT EXISTS `cart_history`", "\n);") + "\n)")
+    cursor.execute(schema_updates_statement("ALTER TABLE `cart_history`\n  ADD COLUMN `item_name`", ";"))
+    cursor.execute(schema_updates_statement("CREATE OR REPLACE VIEW `cart_reporting`", ";"))
+    cursor.execute(schema_updates_statement("CREATE TABLE IF NOT EXISTS `orders`", "\n);") + "\n)")
+    cursor.execute(schema_updates_statement("CREATE TABLE IF NOT EXISTS `sales_rollup_orders`", "\n);") + "\n)")
+
+    print(f"Seeding {ORGS} orgs with {HISTORY_DAYS} days of history...")
+    orgs = seed(cursor, rng)
+    cursor.execute(schema_updates_statement("INSERT INTO `sales_rollup`", ";"))
+    cursor.execute(schema_updates_statement("UPDATE `sales_rollup` r", ";"))
+    cursor.execute(schema_updates_statement("INSERT IGNORE INTO `sales_rollup_orders`", ";"))
+    cursor.execute("SET @completed_status = 6")
+    for start in ("INSERT IGNORE INTO `orders`", "UPDATE `orders` o\nJOIN `customer_info`", "UPDATE `orders` o\nJOIN `payment_mode`"):
+        cursor.execute(schema_updates_statement(start, ";"))
+    conn.commit()
+
+    # Size the pool for the client threads before the app builds it
+    threads = ORGS * (WAITERS_PER_ORG + 3) + 1
+    os.environ.setdefault('DB_POOL_SIZE', str(threads + 2))
+    import app_restaurant
+    app_restaurant.db_cred = dict(cred, database=DATABASE)
+    app_restaurant.initialize_connection_pool()
+    app = app_restaurant.app
+
+    deadline = time.time() + DURATION
+    recorder = Recorder()
+    workers = []
+    for org, info in orgs.items():
+        tables = list(range(1, TABLES_PER_ORG + 1))
+        for index, server in enumerate(info['waiters']):
+            # Each waiter owns its own tables so two clients never share a cart
+            workers.append((waiter, (org, info, server, tables[index::len(info['waiters'])])))
+        workers += [(kitchen, (org, info)), (biller, (org, info)), (dashboards, (org, info))]
+
+    threads = [threading.Thread(target=target, args=(app, recorder, random.Random(rng.random())) + args + (deadline,))
+               for target, args in workers]
+    threads.append(threading.Thread(target=exports, args=(app, recorder, random.Random(rng.random()), deadline)))
+
+    print(f"Replaying a {DURATION:.0f}s dinner rush with {len(threads)} clients...\n")
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = report(recorder, time.time() - started)
+
+    if os.environ.get('LOAD_REPORT'):
+        with open(os.environ['LOAD_REPORT'], 'w') as f:
+            json.dump({'seed': SEED, 'duration': DURATION, 'endpoints': results}, f, indent=2)
+
+    regressions = compare(results, os.environ['LOAD_BASELINE']) if os.environ.get('LOAD_BASELINE') else []
+
+    cursor.execute(f"DROP DATABASE IF EXISTS `{DATABASE}`")
+    cursor.close()
+    conn.close()
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
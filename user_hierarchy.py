@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+
+# In-memory copy of the users table as a parent_uid tree (org owner ->
+# managers -> staff), so dashboard filters, org lookups and staff lists are
+# dictionary reads instead of parent_uid subqueries and users self-joins. The
+# whole table is read in one query (it holds one row per person, not per
+# order) into an immutable snapshot; handlers that write users or org_info
+# call invalidate() after committing and the next lookup builds a new version.
+# Other worker processes rebuild once their copy is USER_HIERARCHY_TTL seconds
+# old, and a lookup of an unknown user rebuilds straight away, so a member
+# added elsewhere is found on first use.
+USER_HIERARCHY_TTL = float(os.environ.get('USER_HIERARCHY_TTL', 60))
+# Unknown users trigger at most one rebuild per this many seconds
+USER_HIERARCHY_MISS_RELOAD = float(os.environ.get('USER_HIERARCHY_MISS_RELOAD', 5))
+
+# Never includes password
+USER_COLUMNS = ('user_uid', 'name', 'phone', 'area', 'pincode', 'status', 'role', 'org', 'parent_uid')
+
+logger = logging.getLogger(__name__)
+
+
+def _key(user_uid):
+    return None if user_uid in (None, '') else str(user_uid)
+
+
+class Snapshot:
+    def __init__(self, version, rows):
+        self.version = version
+        self.users = {}
+        self.children = {}
+        for row in rows:
+            user = dict(row)
+            self.users[str(row['user_uid'])] = user
+            if _key(row['parent_uid']) is not None:
+                self.children.setdefault(str(row['parent_uid']), []).append(user)
+
+
+class UserHierarchy:
+    def __init__(self, connect, columns=USER_COLUMNS, ttl=USER_HIERARCHY_TTL):
+        # connect() returns a connection that close() gives back; columns are
+        # the users columns kept, a superset of USER_COLUMNS
+        self.connect = connect
+        self.columns = columns
+        self.ttl = ttl
+        self.loads = 0
+        self._snapshot = None
+        self._loaded_at = 0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def _load(self):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"SELECT {', '.join(self.columns)} FROM users")
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        version = (self._snapshot.version if self._snapshot else 0) + 1
+        self._snapshot = Snapshot(version, rows)
+        self._loaded_at = time.monotonic()
+        self._stale = False
+        self.loads += 1
+        return self._snapshot
+
+    def snapshot(self, reload=False):
+        with self._lock:
+            if (reload or self._stale or self._snapshot is None
+                    or time.monotonic() - self._loaded_at > self.ttl):
+                return self._load()
+            return self._snapshot
+
+    def warm(self):
+        # Called when a worker starts; if the database is not reachable yet
+        # the first lookup loads instead
+        try:
+            self.snapshot(reload=True)
+        except Exception:
+            logger.exception("Could not load the user hierarchy")
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+
+    def user(self, user_uid):
+        user_uid = _key(user_uid)
+        if user_uid is None:
+            return None
+        user = self.snapshot().users.get(user_uid)
+        if user is None and time.monotonic() - self._loaded_at > USER_HIERARCHY_MISS_RELOAD:
+            user = self.snapshot(reload=True).users.get(user_uid)
+        return user
+
+    def org_of(self, user_uid):
+        user = self.user(user_uid)
+        return user['org'] if user else None
+
+    def staff_ids(self, manager_id):
+        # Users whose parent is manager_id, the set the old
+        # "IN (SELECT user_uid FROM users WHERE parent_uid = %s)" matched
+        manager_id = _key(manager_id)
+        if manager_id is None:
+            return None
+        return [user['user_uid'] for user in self.snapshot().children.get(manager_id, [])]
+
+    def staff(self, parent_uid=None, fields=None, role=4):
+        # Users with role (all of them, or only parent_uid's) ordered by name,
+        # as dicts of fields (default: every kept column) plus manager_name
+        snapshot = self.snapshot()
+        parent_uid = _key(parent_uid)
+        users = snapshot.children.get(parent_uid, []) if parent_uid is not None else snapshot.users.values()
+        staff = []
+        for user in users:
+            if str(user['role']) != str(role):
+                continue
+            member = {field: user[field] for field in (fields or self.columns)}
+            manager = snapshot.users.get(_key(user['parent_uid']) or '')
+            member['manager_name'] = manager['name'] if manager else None
+            staff.append(member)
+        staff.sort(key=lambda member: member.get('name') or '')
+        return staff
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                'version': snapshot.version if snapshot else 0,
+                'users': len(snapshot.users) if snapshot else 0,
+                'loads': self.loads,
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if snapshot else None
+            }
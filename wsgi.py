@@ -0,0 +1,30 @@
+import importlib
+import os
+
+# WSGI entry point for production. Both apps are served the same way; pick
+# one with APP_MODULE and run it under gunicorn with the bundled config:
+#
+#     APP_MODULE=app_restaurant gunicorn -c gunicorn.conf.py wsgi:app
+#     APP_MODULE=app gunicorn -c gunicorn.conf.py wsgi:app
+#
+# `python app.py` / `python app_restaurant.py` still start the Werkzeug
+# development server for local work.
+APP_MODULE = os.environ.get('APP_MODULE', 'app_restaurant')
+
+
+def create_app(module_name=APP_MODULE):
+    # The routes are registered when the module is imported; the connection
+    # pool it creates opens no connections until the first request
+    return importlib.import_module(module_name).app
+
+
+def init_worker(module_name=APP_MODULE):
+    # gunicorn imports the app once in the master (preload_app) and forks the
+    # workers from it; each worker then builds its own pool so no socket is
+    # ever shared between processes, then loads its user hierarchy
+    module = importlib.import_module(module_name)
+    module.initialize_connection_pool()
+    module.user_hierarchy.warm()
+
+
+app = create_app()